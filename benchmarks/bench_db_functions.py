@@ -0,0 +1,183 @@
+"""utils/database.py funksiyalarini oldindan to'ldirilgan bazada o'lchash
+
+Baza --users ta foydalanuvchi bilan (standart 1 000 000) to'ldiriladi.
+create_coupon o'lchanmaydi: kupon kodi soniya aniqligidagi vaqtdan
+yasaladi, shuning uchun bir soniyada ikkinchi chaqiruv UNIQUE xatosi beradi.
+
+Limit tekshiruvi eski usul (har DB chaqiruvida yangi sqlite3.connect),
+doimiy ulanish va atomik consume_download bilan solishtiriladi. Eski usul
+bazaning journal_mode=DELETE rejimidagi alohida nusxasida o'lchanadi -
+WAL bazasida u eski holatdagidan tezroq chiqib, farqni kamaytirib ko'rsatardi.
+
+    python -m benchmarks.bench_db_functions --users 1000000
+"""
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+from benchmarks.common import print_table, summarize, time_calls, write_results
+
+BATCH = 10000
+
+
+def populate(database, users):
+    conn = database.get_connection()
+    now = datetime.now()
+    for start in range(0, users, BATCH):
+        rows = [
+            (
+                user_id,
+                user_id % 150,
+                (now + timedelta(days=30)).isoformat() if user_id % 10 == 0 else None,
+            )
+            for user_id in range(start, min(start + BATCH, users))
+        ]
+        conn.executemany(
+            'INSERT INTO users (user_id, downloads_count, subscription_end) VALUES (?, ?, ?)', rows
+        )
+    conn.commit()
+
+
+def quota_check(database, user_id):
+    """consume_download'dan oldingi limit tekshiruvi: get_user (+ create_user) + increment_downloads"""
+    if not database.get_user(user_id):
+        database.create_user(user_id)
+    database.increment_downloads(user_id)
+
+
+def make_legacy_copy(database, path):
+    """To'ldirilgan bazani WAL'siz (journal_mode=DELETE) nusxalash"""
+    target = sqlite3.connect(path)
+    try:
+        database.get_connection().backup(target)
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+
+
+def legacy_quota_check(database, path, user_id):
+    """Xuddi shu tekshiruv, lekin har DB chaqiruvi path'ga yangi ulanish ochadi (eski usul)
+
+    Ochilgan ulanishlar chaqiruv oxirida yopiladi.
+    """
+    opened = []
+
+    def connect():
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        opened.append(conn)
+        return conn
+
+    original = database.get_connection
+    database.get_connection = connect
+    try:
+        quota_check(database, user_id)
+    finally:
+        database.get_connection = original
+        for conn in opened:
+            conn.close()
+
+
+def run(args):
+    import utils.database as database
+
+    logging.disable(logging.ERROR)
+    rng = random.Random(1)
+    users = args.users
+    iterations = args.db_iterations
+    counter = iter(range(users, users * 10))
+    ttl = timedelta(hours=1)
+    results = []
+
+    def bench(name, func, count=iterations):
+        samples = time_calls(func, count, warmup=min(10, count))
+        results.append(summarize('database', name, samples, users=users))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_PATH = os.path.join(tmp, 'bench.db')
+        database.close_connection()
+        try:
+            database.init_database()
+            populate(database, users)
+            conn = database.get_connection()
+            conn.executemany(
+                'INSERT INTO coupons (code, duration) VALUES (?, ?)',
+                [(f"BENCH-{i}", '1month') for i in range(iterations * 2)]
+            )
+            conn.commit()
+            coupons = iter(range(iterations * 2))
+            legacy_path = os.path.join(tmp, 'bench-legacy.db')
+            make_legacy_copy(database, legacy_path)
+
+            bench('get_user (existing)', lambda: database.get_user(rng.randrange(users)))
+            bench('get_user (missing)', lambda: database.get_user(next(counter)))
+            bench('create_user', lambda: database.create_user(next(counter)))
+            bench('increment_downloads', lambda: database.increment_downloads(rng.randrange(users)))
+            bench('consume_download', lambda: database.consume_download(rng.randrange(users), 100))
+            bench('quota check (per-call connect)', lambda: legacy_quota_check(
+                database, legacy_path, rng.randrange(users)
+            ))
+            bench('quota check (persistent)', lambda: quota_check(database, rng.randrange(users)))
+            bench('add_downloads (100 users)', lambda: database.add_downloads(
+                {rng.randrange(users): 1 for _ in range(100)}
+            ))
+            bench('extend_subscription', lambda: database.extend_subscription(rng.randrange(users), '1month'))
+            bench('activate_coupon', lambda: database.activate_coupon(
+                rng.randrange(users), f"BENCH-{next(coupons)}"
+            ))
+            bench('get_usage_stats', database.get_usage_stats, count=args.stats_iterations)
+
+            bench('add_admin', lambda: database.add_admin(next(counter), 'bench'))
+            bench('get_all_admins', database.get_all_admins)
+            bench('remove_admin', lambda: database.remove_admin(next(counter)))
+            bench('add_mandatory_channel', lambda: database.add_mandatory_channel(str(next(counter)), 'bench'))
+            bench('get_mandatory_channels', database.get_mandatory_channels)
+            bench('remove_mandatory_channel', lambda: database.remove_mandatory_channel(str(next(counter))))
+
+            entries = [{'method': 'video', 'file_id': 'x' * 80, 'caption': 'bench'}]
+            bench('save_cached_media', lambda: database.save_cached_media(
+                f"https://example.com/{rng.randrange(iterations)}", entries
+            ))
+            bench('get_cached_media', lambda: database.get_cached_media(
+                f"https://example.com/{rng.randrange(iterations)}", ttl
+            ))
+            bench('delete_cached_media', lambda: database.delete_cached_media(
+                f"https://example.com/{rng.randrange(iterations)}"
+            ))
+            bench('evict_cached_media', lambda: database.evict_cached_media(ttl, iterations), count=10)
+
+            payload = {'links': [{'quality': 'video_hd_original', 'link': 'https://cdn.example.com/v.mp4'}]}
+            expires_at = datetime.now() + ttl
+            bench('save_resolver_cache', lambda: database.save_resolver_cache(
+                f"https://example.com/{rng.randrange(iterations)}", payload, expires_at
+            ))
+            bench('get_resolver_cache', lambda: database.get_resolver_cache(
+                f"https://example.com/{rng.randrange(iterations)}"
+            ))
+            bench('purge_resolver_cache', database.purge_resolver_cache, count=10)
+        finally:
+            database.close_connection()
+            logging.disable(logging.NOTSET)
+
+    return results
+
+
+def add_arguments(parser):
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--db-iterations', type=int, default=1000)
+    parser.add_argument('--stats-iterations', type=int, default=5)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    results = run(args)
+    print_table(results)
+    if args.output:
+        write_results(results, args.output)
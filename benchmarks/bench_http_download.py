@@ -0,0 +1,199 @@
+"""download_media'ni lokal HTTP serverga qarshi o'lchash (1-50 MB)
+
+    python -m benchmarks.bench_http_download --download-sizes 1 10 50
+
+Har bir ulanish tezligi cheklangan (CDN kabi) /throttled/ endpoint'ida
+bitta oqim va DOWNLOAD_CONNECTIONS ta parallel Range so'rovi solishtiriladi;
+/range-ignored/ esa Accept-Ranges deb e'lon qilib, Range'ni e'tiborsiz
+qoldiruvchi server (bitta oqimga qaytish yo'li).
+
+--legacy-sizes uchun eski yo'l ham o'lchanadi: javob 8 KB bo'laklab
+`content += chunk` bilan bytes'ga yig'iladi (MediaBuffer'dan oldingi
+download_video). U kvadratik nusxa ko'chiradi - 50 MB bir necha daqiqa
+olishi mumkin, shuning uchun standart holda bir martadan o'lchanadi va
+yangi yo'l natijalaridan keyin (peak RSS ularga ta'sir qilmasligi uchun).
+"""
+import argparse
+import asyncio
+import os
+
+from aiohttp import web
+
+from benchmarks.common import print_table, summarize, time_async_calls, write_results
+
+MB = 1024 * 1024
+HOST = '127.0.0.1'
+THROTTLE_CHUNK = 64 * 1024
+LEGACY_CHUNK_SIZE = 8192
+
+
+def parse_range(header, size):
+    """'bytes=start-end' -> (start, end) yoki None"""
+    if not header or not header.startswith('bytes='):
+        return None
+    start, _, end = header[6:].partition('-')
+    return int(start), min(int(end) if end else size - 1, size - 1)
+
+
+async def start_server(payloads, port, throttle_mbps=None):
+    async def with_length(request):
+        return web.Response(body=payloads[int(request.match_info['size'])])
+
+    async def chunked(request):
+        # Content-Length yo'q - spooled fayl yo'li
+        payload = payloads[int(request.match_info['size'])]
+        response = web.StreamResponse()
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        for offset in range(0, len(payload), 256 * 1024):
+            await response.write(payload[offset:offset + 256 * 1024])
+        await response.write_eof()
+        return response
+
+    async def throttled(request, honour_range=True):
+        # Har bir ulanish throttle_mbps MB/s dan tez yubormaydi
+        payload = payloads[int(request.match_info['size'])]
+        byte_range = parse_range(request.headers.get('Range'), len(payload)) if honour_range else None
+        response = web.StreamResponse()
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['ETag'] = '"bench"'
+        if byte_range:
+            start, end = byte_range
+            response.set_status(206)
+            response.headers['Content-Range'] = f"bytes {start}-{end}/{len(payload)}"
+        else:
+            start, end = 0, len(payload) - 1
+        response.content_length = end + 1 - start
+        await response.prepare(request)
+        delay = THROTTLE_CHUNK / (throttle_mbps * MB)
+        try:
+            for offset in range(start, end + 1, THROTTLE_CHUNK):
+                await response.write(payload[offset:min(offset + THROTTLE_CHUNK, end + 1)])
+                await asyncio.sleep(delay)
+            await response.write_eof()
+        except ConnectionResetError:
+            # Mijoz kerakli bo'lakni olib, ulanishni yopdi
+            pass
+        return response
+
+    async def range_ignored(request):
+        return await throttled(request, honour_range=False)
+
+    app = web.Application()
+    app.router.add_get('/length/{size}', with_length)
+    app.router.add_get('/throttled/{size}', throttled)
+    app.router.add_get('/range-ignored/{size}', range_ignored)
+    app.router.add_get('/chunked/{size}', chunked)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, HOST, port).start()
+    return runner
+
+
+async def legacy_download(session, url, max_size):
+    """Eski yo'l: butun fayl `content += chunk` bilan xotiraga yig'iladi"""
+    async with session.get(url) as response:
+        response.raise_for_status()
+        content = b''
+        async for chunk in response.content.iter_chunked(LEGACY_CHUNK_SIZE):
+            content += chunk
+            if len(content) > max_size:
+                return None
+        return content
+
+
+async def run_async(sizes, iterations, port, throttled_sizes=(), connections=(1,), throttle_mbps=8,
+                    legacy_sizes=(), legacy_iterations=1):
+    from utils import downloader
+    from utils.downloader import download_media
+    from utils.http_client import close_http_session, get_http_session, init_http_session
+
+    payloads = {size: os.urandom(size * MB) for size in set(sizes) | set(throttled_sizes) | set(legacy_sizes)}
+    runner = await start_server(payloads, port, throttle_mbps)
+    await init_http_session()
+    results = []
+    try:
+        for size in sizes:
+            for mode in ('length', 'chunked'):
+                url = f"http://{HOST}:{port}/{mode}/{size}"
+
+                async def download():
+                    media = await download_media(url, max_size=(size + 1) * MB)
+                    assert media is not None and media.size == size * MB
+                    media.close()
+
+                samples = await time_async_calls(download, iterations, warmup=1)
+                result = summarize('download', f"download_media {mode} {size}MB", samples, size_mb=size)
+                result['mb_per_sec'] = size * result['ops_per_sec']
+                results.append(result)
+
+        default_connections = downloader.DOWNLOAD_CONNECTIONS
+        for size in throttled_sizes:
+            for mode, connection_counts in (('throttled', connections), ('range-ignored', connections[-1:])):
+                for count in connection_counts:
+                    downloader.DOWNLOAD_CONNECTIONS = count
+                    url = f"http://{HOST}:{port}/{mode}/{size}"
+
+                    async def download():
+                        media = await download_media(url, max_size=(size + 1) * MB)
+                        assert media is not None and media.size == size * MB
+                        assert media.getvalue() == payloads[size]
+                        media.close()
+
+                    samples = await time_async_calls(download, iterations)
+                    result = summarize(
+                        'download', f"{mode} {throttle_mbps}MB/s/conn {size}MB x{count}", samples,
+                        size_mb=size, connections=count, throttle_mbps=throttle_mbps,
+                    )
+                    result['mb_per_sec'] = size * result['ops_per_sec']
+                    results.append(result)
+        downloader.DOWNLOAD_CONNECTIONS = default_connections
+
+        for size in legacy_sizes:
+            url = f"http://{HOST}:{port}/length/{size}"
+
+            async def download():
+                content = await legacy_download(get_http_session(), url, (size + 1) * MB)
+                assert content is not None and len(content) == size * MB
+
+            samples = await time_async_calls(download, legacy_iterations)
+            result = summarize('download', f"legacy content+=chunk length {size}MB", samples, size_mb=size)
+            result['mb_per_sec'] = size * result['ops_per_sec']
+            results.append(result)
+    finally:
+        await close_http_session()
+        await runner.cleanup()
+    return results
+
+
+def run(args):
+    return asyncio.run(run_async(
+        args.download_sizes, args.download_iterations, args.port,
+        throttled_sizes=args.throttled_sizes,
+        connections=args.download_connections,
+        throttle_mbps=args.throttle_mbps,
+        legacy_sizes=args.legacy_sizes,
+        legacy_iterations=args.legacy_iterations,
+    ))
+
+
+def add_arguments(parser):
+    parser.add_argument('--download-sizes', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--download-iterations', type=int, default=10)
+    parser.add_argument('--port', type=int, default=8931)
+    parser.add_argument('--throttled-sizes', type=int, nargs='*', default=[32])
+    parser.add_argument('--download-connections', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--throttle-mbps', type=float, default=8)
+    parser.add_argument('--legacy-sizes', type=int, nargs='*', default=[10, 50])
+    parser.add_argument('--legacy-iterations', type=int, default=1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    results = run(args)
+    print_table(results)
+    if args.output:
+        write_results(results, args.output)
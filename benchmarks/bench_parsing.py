@@ -0,0 +1,105 @@
+"""Pinterest HTML tahlili va havola sifatini tanlash tezligi
+
+    python -m benchmarks.bench_parsing
+"""
+import argparse
+import logging
+import re
+
+from benchmarks.common import print_table, summarize, time_calls, write_results
+from benchmarks.fixtures import pinterest_html, resolver_links
+
+
+# Oldingi extract_pinterest_image_from_html (butun hujjat, kompilyatsiyasiz)
+LEGACY_PATTERNS = [
+    r'"url":"(https://i\.pinimg\.com/originals/[^"]+)"',
+    r'"url":"(https://i\.pinimg\.com/736x/[^"]+)"',
+    r'"images":\{"orig":\{"url":"([^"]+)"',
+    r'property="og:image" content="([^"]+)"',
+    r'"image_large_url":"([^"]+)"',
+    r'"image_medium_url":"([^"]+)"',
+]
+
+
+def legacy_extract(html_content):
+    for pattern in LEGACY_PATTERNS:
+        matches = re.findall(pattern, html_content)
+        if matches:
+            for match in matches:
+                if 'originals' in match or '736x' in match:
+                    return match
+            return matches[0]
+    return None
+
+
+def stream_scan(page, chunk_size, limit):
+    """scan_pinterest_page'dagi kabi baytlarni bo'laklab skanerlash: (URL, o'qilgan baytlar)"""
+    from handlers.pinterest import PinterestImageScanner
+    scanner = PinterestImageScanner()
+    bytes_read = 0
+    for offset in range(0, len(page), chunk_size):
+        chunk = page[offset:offset + chunk_size]
+        bytes_read += len(chunk)
+        if scanner.feed(chunk) or bytes_read >= limit:
+            break
+    return scanner.result(), bytes_read
+
+
+def run(args):
+    from handlers.pinterest import PINTEREST_SCAN_CHUNK, PINTEREST_SCAN_LIMIT
+    from utils.resolver import video_candidates
+
+    # Har bir chaqiruvdagi logger.info o'lchovni buzmasligi uchun
+    logging.disable(logging.INFO)
+    results = []
+    try:
+        for size_kb in args.html_sizes:
+            for position in (0.1, 0.9):
+                html = pinterest_html(size_kb=size_kb, image_position=position)
+                page = html.encode()
+                label = f"{size_kb}KB at {position:.0%}"
+
+                samples = time_calls(lambda: legacy_extract(html), args.parse_iterations, warmup=2)
+                results.append(summarize(
+                    'parsing', f"pinterest legacy {label}", samples,
+                    size_kb=size_kb, image_position=position, bytes_read=len(page)
+                ))
+
+                found, bytes_read = stream_scan(page, PINTEREST_SCAN_CHUNK, PINTEREST_SCAN_LIMIT)
+                assert found == legacy_extract(html)
+                samples = time_calls(
+                    lambda: stream_scan(page, PINTEREST_SCAN_CHUNK, PINTEREST_SCAN_LIMIT),
+                    args.parse_iterations, warmup=2
+                )
+                results.append(summarize(
+                    'parsing', f"pinterest stream {label}, read {bytes_read // 1024}KB", samples,
+                    size_kb=size_kb, image_position=position, bytes_read=bytes_read
+                ))
+
+        for count in (3, 20):
+            for hd_position in ('first', 'last', 'mp4_only'):
+                links = resolver_links(count, hd_position)
+                samples = time_calls(lambda: video_candidates(links), args.parse_iterations * 50, warmup=10)
+                results.append(summarize(
+                    'parsing', f"video_candidates {count} links, {hd_position}", samples,
+                    links=count, hd_position=hd_position
+                ))
+    finally:
+        logging.disable(logging.NOTSET)
+    return results
+
+
+def add_arguments(parser):
+    parser.add_argument('--html-sizes', type=int, nargs='+', default=[100, 400, 1000])
+    parser.add_argument('--parse-iterations', type=int, default=50)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    results = run(args)
+    print_table(results)
+    if args.output:
+        write_results(results, args.output)
@@ -0,0 +1,71 @@
+"""Havolalarni platformaga ajratish: eski substring tekshiruvi va utils.router
+
+    python -m benchmarks.bench_router
+"""
+import argparse
+
+from benchmarks.common import print_table, summarize, time_calls, write_results
+from benchmarks.fixtures import url_corpus
+
+# process_link'dagi oldingi tekshiruv (taqqoslash uchun)
+LEGACY_PLATFORMS = [
+    ('instagram', ('instagram.com',)),
+    ('tiktok', ('tiktok.com',)),
+    ('twitter', ('x.com', 'twitter.com')),
+    ('youtube', ('youtube.com', 'youtu.be')),
+    ('facebook', ('facebook.com',)),
+    ('pinterest', ('pin.it', 'pinterest.com')),
+]
+
+
+def legacy_route(text):
+    for name, markers in LEGACY_PLATFORMS:
+        if any(marker in text for marker in markers):
+            return name
+    return None
+
+
+def router_route(text):
+    from utils.router import route_message
+    route = route_message(text)
+    return route.platform if route is not None else None
+
+
+def run(args):
+    from utils.router import route_message
+
+    corpus = url_corpus(args.corpus_size)
+    texts = [text for text, _ in corpus]
+    results = []
+
+    for name, func in (('legacy substring', legacy_route), ('router', router_route)):
+        errors = sum(func(text) != expected for text, expected in corpus)
+        samples = time_calls(lambda: [func(text) for text in texts], args.router_iterations, warmup=1)
+        # Bitta xabar uchun vaqt
+        per_message = [sample / len(texts) for sample in samples]
+        results.append(summarize(
+            'router', f"{name} ({errors} misrouted of {len(texts)})", per_message,
+            corpus_size=len(texts), misrouted=errors
+        ))
+
+    # Eng yomon holat: Telegram xabari chegarasidagi bo'shliqsiz matn
+    worst = 'a.' * 2048
+    samples = time_calls(lambda: route_message(worst), args.router_iterations * 10, warmup=2)
+    results.append(summarize('router', 'router 4096-char adversarial text', samples, length=len(worst)))
+    return results
+
+
+def add_arguments(parser):
+    parser.add_argument('--corpus-size', type=int, default=20000)
+    parser.add_argument('--router-iterations', type=int, default=5)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    results = run(args)
+    print_table(results)
+    if args.output:
+        write_results(results, args.output)
@@ -0,0 +1,94 @@
+"""Benchmark suitlari uchun umumiy o'lchash va natija formatlash"""
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault('BOT_TOKEN', 'benchmark')
+
+
+def peak_rss_kb():
+    """Jarayonning eng yuqori RSS qiymati (KB)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS baytlarda, Linux kilobaytlarda qaytaradi
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(suite, name, samples, **params):
+    """Vaqt namunalaridan (sekund) natija yozuvini yaratish"""
+    total = sum(samples)
+    return {
+        'suite': suite,
+        'name': name,
+        'params': params,
+        'iterations': len(samples),
+        'ops_per_sec': len(samples) / total if total else None,
+        'mean_us': statistics.mean(samples) * 1e6,
+        'p50_us': percentile(samples, 0.50) * 1e6,
+        'p99_us': percentile(samples, 0.99) * 1e6,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def time_calls(func, iterations, warmup=0):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def time_async_calls(func, iterations, warmup=0):
+    for _ in range(warmup):
+        await func()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results):
+    print(f"{'suite':<10}{'name':<44}{'ops/s':>12}{'p50 us':>12}{'p99 us':>12}{'rss MB':>9}")
+    for result in results:
+        ops = result['ops_per_sec'] or 0
+        print(
+            f"{result['suite']:<10}{result['name'][:43]:<44}{ops:>12.1f}"
+            f"{result['p50_us']:>12.1f}{result['p99_us']:>12.1f}{result['peak_rss_kb'] / 1024:>9.1f}"
+        )
+
+
+def write_results(results, output):
+    """Natijalarni commitlar orasida solishtirish uchun JSON'ga yozish"""
+    report = {
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,102 @@
+"""Benchmarklar uchun sun'iy, lekin haqiqiy hajmdagi ma'lumotlar"""
+import json
+import random
+
+
+def pinterest_html(size_kb=400, image_position=0.9, seed=1):
+    """Pinterest pin sahifasiga o'xshash HTML (ko'p inline JSON skriptlar)
+
+    image_position - originals URL hujjatning qaysi qismida joylashgani
+    (0 - boshida, 1 - oxirida).
+    """
+    rng = random.Random(seed)
+    head = (
+        '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">'
+        '<title>Pin on Ideas</title>'
+        '<meta property="og:image" content="https://i.pinimg.com/736x/ab/cd/ef/abcdef0123456789.jpg">'
+        '</head><body><div id="__PWS_ROOT__"></div>'
+    )
+    image_block = (
+        '<script id="__PWS_DATA__" type="application/json">'
+        '{"images":{"orig":{"url":"https://i.pinimg.com/originals/ab/cd/ef/abcdef0123456789.jpg"}},'
+        '"url":"https://i.pinimg.com/originals/ab/cd/ef/abcdef0123456789.jpg"}</script>'
+    )
+
+    filler = []
+    filler_size = 0
+    target = size_kb * 1024 - len(head) - len(image_block)
+    while filler_size < target:
+        blob = json.dumps({
+            'id': rng.randrange(10 ** 17),
+            'description': ''.join(rng.choice('abcdefghij klmnop') for _ in range(200)),
+            'thumbnail': f"https://i.pinimg.com/236x/{rng.randrange(16 ** 8):08x}.jpg",
+            'board': {'name': 'board', 'pin_count': rng.randrange(1000)},
+        })
+        chunk = f'<script type="application/json">{blob}</script>'
+        filler.append(chunk)
+        filler_size += len(chunk)
+
+    split = int(len(filler) * image_position)
+    return head + ''.join(filler[:split]) + image_block + ''.join(filler[split:]) + '</body></html>'
+
+
+def resolver_links(count, hd_position='first'):
+    """social-media-video-downloader javobidagi 'links' ro'yxati"""
+    links = [
+        {'quality': f'audio_{i}', 'link': f'https://cdn.example.com/a{i}.m4a'}
+        for i in range(count - 1)
+    ]
+    video = {'quality': 'video_hd_original_0', 'link': 'https://cdn.example.com/v.mp4'}
+    if hd_position == 'first':
+        links.insert(0, video)
+    elif hd_position == 'last':
+        links.append(video)
+    else:
+        # Faqat mp4 havolasi, sifat nomida 'video' yo'q
+        links.append({'quality': 'hd_no_watermark', 'link': 'https://cdn.example.com/v.mp4'})
+    return links
+
+
+# (namuna, kutilgan platforma); {id} va {code} tasodifiy qiymatlar bilan to'ldiriladi
+URL_SAMPLES = [
+    ('https://www.instagram.com/reel/{code}/?igsh={code}', 'instagram'),
+    ('https://instagram.com/p/{code}/', 'instagram'),
+    ('https://www.tiktok.com/@user.name/video/{id}?lang=en', 'tiktok'),
+    ('https://vm.tiktok.com/{code}/', 'tiktok'),
+    ('https://x.com/someone/status/{id}?s=20', 'twitter'),
+    ('https://mobile.twitter.com/someone/status/{id}', 'twitter'),
+    ('https://www.youtube.com/watch?v={yt}&t=42s', 'youtube'),
+    ('youtu.be/{yt}?si={code}', 'youtube'),
+    ('https://m.youtube.com/shorts/{yt}', 'youtube'),
+    ('https://www.facebook.com/watch?v={id}', 'facebook'),
+    ('https://fb.watch/{code}/', 'facebook'),
+    ('https://www.pinterest.com/pin/{id}/', 'pinterest'),
+    ('https://pin.it/{code}', 'pinterest'),
+    ('Qarang: https://www.youtube.com/watch?v={yt} juda zo\'r!', 'youtube'),
+    ('(https://x.com/a/status/{id}).', 'twitter'),
+    # Adversarial: platforma nomi boshqa joyda uchraydi
+    ('https://box.com/s/{code}', None),
+    ('https://dropbox.com/s/{code}/video.mp4', None),
+    ('https://x.com.evil.example/status/{id}', None),
+    ('https://example.com/?next=https://www.instagram.com/p/{code}/', None),
+    ('https://notyoutube.com/watch?v={yt}', None),
+    ('https://pin.it.example.org/{code}', None),
+    ('salom, instagram.com haqida gaplashamiz', None),
+    ('https://example.com/' + 'a' * 2000, None),
+    ('a' * 4000, None),
+]
+
+
+def url_corpus(count=10000, seed=1):
+    """Haqiqiy va adversarial havolali xabarlar: [(matn, kutilgan platforma)]"""
+    rng = random.Random(seed)
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-'
+    corpus = []
+    for _ in range(count):
+        template, expected = rng.choice(URL_SAMPLES)
+        corpus.append((template.format(
+            id=rng.randrange(10 ** 15, 10 ** 19),
+            code=''.join(rng.choice(alphabet[:62]) for _ in range(10)),
+            yt=''.join(rng.choice(alphabet) for _ in range(11)),
+        ), expected))
+    return corpus
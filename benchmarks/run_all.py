@@ -0,0 +1,41 @@
+"""Barcha benchmark suitlarini ishga tushirib, natijani JSON'ga yozish
+
+Loyiha ildizidan:
+    python -m benchmarks.run_all --output bench_results.json
+
+Ikki commit natijalarini solishtirish uchun JSON fayllardagi bir xil
+(suite, name) yozuvlarining ops_per_sec, p50_us, p99_us qiymatlarini
+taqqoslang.
+"""
+import argparse
+
+from benchmarks import bench_db_functions, bench_http_download, bench_parsing, bench_router
+from benchmarks.common import print_table, write_results
+
+SUITES = {
+    'parsing': bench_parsing,
+    'router': bench_router,
+    'download': bench_http_download,
+    'database': bench_db_functions,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--suites', nargs='+', choices=sorted(SUITES), default=list(SUITES))
+    parser.add_argument('--output', default='bench_results.json')
+    for suite in SUITES.values():
+        suite.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = []
+    for name in args.suites:
+        results.extend(SUITES[name].run(args))
+
+    print_table(results)
+    write_results(results, args.output)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,36 @@
 import asyncio
+import functools
 import logging
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 
-from config import BOT_TOKEN
-from handlers.handlers import register_handlers
-from utils.database import init_database
+from config import (
+    BOT_MODE,
+    BOT_ROLE,
+    BOT_TOKEN,
+    METRICS_HOST,
+    METRICS_PORT,
+    TELEGRAM_API_LOCAL,
+    TELEGRAM_API_URL,
+)
+from handlers.handlers import register_handlers, run_download_job
+from utils import disk_cache
+from utils.database import close_connection, init_database
+from utils.delivery import UploadTimingMiddleware
+from utils.downloader import purge_temp_files
+from utils.http_client import close_http_session, init_http_session
+from utils.job_queue import download_queue
+from utils.link_expander import purge_expired as purge_expired_redirects
+from utils.media_cache import evict_media_cache
+from utils.partial_files import purge_stale_partials, start_janitor, stop_janitor
+from utils.metrics import start_metrics_server
+from utils.resolver import purge_expired as purge_expired_resolver_cache
+from utils.shared_state import state_backend
+from utils.webhook_server import run_webhook
 
 # Logging sozlamalari
 logging.basicConfig(
@@ -21,29 +44,80 @@ async def main():
     # Ma'lumotlar bazasini ishga tushirish
     logger.info("Ma'lumotlar bazasini ishga tushirmoqda...")
     init_database()
+    evict_media_cache()
+    purge_expired_resolver_cache()
+    purge_expired_redirects()
+    purge_temp_files()
+    purge_stale_partials()
+    disk_cache.enforce_budget()
+
+    # Umumiy HTTP sessiyasini ochish (barcha handlerlar uchun)
+    await init_http_session()
+
+    # Umumiy holat (navbat, kvota, FSM) va yuklab olish hisoblagichlarini davriy yozish
+    await state_backend.start()
+
+    # Uzilgan yuklab olishlardan qolgan eski qisman fayllarni davriy tozalash
+    start_janitor()
+    # Diskdagi media keshini hajm chegarasida ushlab turish
+    disk_cache.start_janitor()
+
+    # Prometheus metrikalari uchun ichki endpoint (webhook rejimida ham ochiq portdan alohida)
+    metrics_runner = None
+    if METRICS_PORT:
+        try:
+            metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            # Bir hostdagi boshqa jarayon portni band qilgan - bu jarayon metrikasiz ishlaydi
+            logger.warning(f"Metrics endpoint disabled, cannot listen on {METRICS_HOST}:{METRICS_PORT}: {e}")
     
-    # Bot va Dispatcher yaratish
+    # Bot va Dispatcher yaratish (sozlangan bo'lsa o'z Bot API serverimiz orqali)
+    session = None
+    if TELEGRAM_API_URL:
+        session = AiohttpSession(
+            api=TelegramAPIServer.from_base(TELEGRAM_API_URL, is_local=TELEGRAM_API_LOCAL)
+        )
+        logger.info(f"Telegram Bot API server: {TELEGRAM_API_URL} (local={TELEGRAM_API_LOCAL})")
     bot = Bot(
         token=BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    dp = Dispatcher()
+    bot.session.middleware(UploadTimingMiddleware())
+    dp = Dispatcher(storage=state_backend.fsm_storage())
 
     # Handlerlarni ro'yxatdan o'tkazish
     register_handlers(dp)
 
-    # Webhook o'chirish (agar mavjud bo'lsa)
-    await bot.delete_webhook(drop_pending_updates=True)
-    logger.info("Webhook o'chirildi")
+    # Yuklab olish ishchilarini ishga tushirish
+    await download_queue.start(functools.partial(run_download_job, bot))
 
     # Botni ishga tushirish
-    logger.info("Bot ishga tushmoqda...")
+    logger.info(f"Bot ishga tushmoqda ({BOT_MODE}, {BOT_ROLE}, {state_backend.name})...")
     try:
-        await dp.start_polling(bot)
+        if BOT_ROLE == 'worker':
+            # Faqat umumiy navbatdagi ishlarni bajarish
+            await asyncio.Event().wait()
+        elif BOT_MODE == 'webhook':
+            await run_webhook(dp, bot)
+        else:
+            # Webhook o'chirish (agar mavjud bo'lsa)
+            await bot.delete_webhook(drop_pending_updates=True)
+            logger.info("Webhook o'chirildi")
+            await dp.start_polling(bot)
     except KeyboardInterrupt:
         logger.info("Bot to'xtatildi")
     finally:
+        await download_queue.stop()
+        await dp.storage.close()
+        await state_backend.close()
+        await stop_janitor()
+        await disk_cache.stop_janitor()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await close_http_session()
         await bot.session.close()
+        close_connection()
         logger.info("Bot sessiyasi yopildi")
 
 
@@ -28,6 +28,91 @@ if os.getenv('ADMIN_IDS'):
 
 FREE_LIMIT = int(os.getenv('FREE_LIMIT', 100))
 
+# Foydalanuvchi huquqlari keshi va hisoblagichlarni yozish oralig'i (sekund)
+ENTITLEMENT_CACHE_SIZE = int(os.getenv('ENTITLEMENT_CACHE_SIZE', 100000))
+ENTITLEMENT_FLUSH_INTERVAL = float(os.getenv('ENTITLEMENT_FLUSH_INTERVAL', 5))
+
+# Telegram file_id keshi
+MEDIA_CACHE_TTL_DAYS = int(os.getenv('MEDIA_CACHE_TTL_DAYS', 30))
+MEDIA_CACHE_MAX_ENTRIES = int(os.getenv('MEDIA_CACHE_MAX_ENTRIES', 100000))
+
+# RapidAPI javoblari keshi (CDN havolalari eskirmasligi uchun qisqa TTL)
+RESOLVER_CACHE_TTL = int(os.getenv('RESOLVER_CACHE_TTL', 600))  # sekund
+RESOLVER_CACHE_MEMORY_SIZE = int(os.getenv('RESOLVER_CACHE_MEMORY_SIZE', 1000))
+
+# Qisqa havolalar (pin.it, vt.tiktok.com, t.co, ...) yo'naltirish keshi
+REDIRECT_CACHE_TTL_DAYS = int(os.getenv('REDIRECT_CACHE_TTL_DAYS', 30))
+REDIRECT_CACHE_MEMORY_SIZE = int(os.getenv('REDIRECT_CACHE_MEMORY_SIZE', 5000))
+
+# Yuklab olish navbati
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', 8))
+DOWNLOAD_QUEUE_SIZE = int(os.getenv('DOWNLOAD_QUEUE_SIZE', 200))
+PER_USER_JOBS = int(os.getenv('PER_USER_JOBS', 2))
+
+# Katta fayllarni bir nechta ulanish orqali bo'laklab (Range) yuklab olish;
+# DOWNLOAD_CONNECTIONS=1 - o'chirilgan
+DOWNLOAD_CONNECTIONS = int(os.getenv('DOWNLOAD_CONNECTIONS', 4))
+RANGED_DOWNLOAD_MIN_MB = int(os.getenv('RANGED_DOWNLOAD_MIN_MB', 8))
+# Uzilgan yuklab olishni TEMP_DIRECTORY'dagi qisman fayldan davom ettirish urinishlari
+DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', 3))
+# Shuncha vaqt yangilanmagan qisman fayllar va janitor ishlash oralig'i (sekund)
+PARTIAL_MAX_AGE_HOURS = float(os.getenv('PARTIAL_MAX_AGE_HOURS', 6))
+PARTIAL_JANITOR_INTERVAL = int(os.getenv('PARTIAL_JANITOR_INTERVAL', 600))
+
+# Yuklab olingan videolarning diskdagi keshi (kontent xeshi bo'yicha, LRU);
+# DISK_CACHE_MAX_MB=0 - o'chirilgan. Janitor ishlash oralig'i (sekund)
+DISK_CACHE_MAX_MB = int(os.getenv('DISK_CACHE_MAX_MB', 2048))
+DISK_CACHE_DIRECTORY = os.path.join(TEMP_DIRECTORY, 'cache')
+DISK_CACHE_JANITOR_INTERVAL = int(os.getenv('DISK_CACHE_JANITOR_INTERVAL', 600))
+
+# Umumiy holat (navbat, FSM, kvota): 'memory' - bitta jarayon,
+# 'sqlite' - bitta hostdagi bir nechta jarayon, 'redis' - bir nechta host
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory').lower()
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+# 'all' - yangilanishlarni qabul qiladi va yuklab oladi, 'worker' - faqat navbatdagi ishlarni bajaradi
+BOT_ROLE = os.getenv('BOT_ROLE', 'all').lower()
+# SQLite navbatini so'rash oralig'i (bo'sh navbatda maksimalgacha uzayadi, sekund)
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 0.2))
+JOB_POLL_MAX_INTERVAL = float(os.getenv('JOB_POLL_MAX_INTERVAL', 2.0))
+# Redis'dagi foydalanuvchi ishlari hisoblagichining TTL'i (sekund)
+STALE_JOB_TIMEOUT = int(os.getenv('STALE_JOB_TIMEOUT', 600))
+
+# O'z serveridagi Telegram Bot API (masalan http://localhost:8081): yuborish
+# chegarasi 50 MB'dan 2000 MB'ga ko'tariladi. TELEGRAM_API_LOCAL=1 - server
+# --local rejimida va TEMP_DIRECTORY'ni ko'ra oladi (fayllar yo'l orqali beriladi)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '').rstrip('/')
+TELEGRAM_API_LOCAL = os.getenv('TELEGRAM_API_LOCAL', '0').lower() in ('1', 'true', 'yes')
+TELEGRAM_UPLOAD_LIMIT = (2000 if TELEGRAM_API_URL else 50) * 1024 * 1024
+
+# Tarif bo'yicha yuklab olinadigan fayl hajmi chegarasi (MB), Telegram chegarasidan oshmaydi
+FREE_MAX_FILE_MB = int(os.getenv('FREE_MAX_FILE_MB', 50))
+PREMIUM_MAX_FILE_MB = int(os.getenv('PREMIUM_MAX_FILE_MB', 2000))
+
+# TikTok zaxira endpoint'i asosiysidan qancha keyin ishga tushadi (0 - bir vaqtda)
+TIKTOK_HEDGE_DELAY = float(os.getenv('TIKTOK_HEDGE_DELAY', 2.0))
+
+# Yangilanishlarni qabul qilish rejimi: 'polling' yoki 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+# Telegram har bir so'rovda X-Telegram-Bot-Api-Secret-Token sarlavhasida yuboradi
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+# Bir vaqtda qayta ishlanadigan yangilanishlar va Telegram ochadigan ulanishlar soni
+WEBHOOK_MAX_UPDATES = int(os.getenv('WEBHOOK_MAX_UPDATES', 100))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+
+# Stripe to'lovlari (webhook route faqat STRIPE_WEBHOOK_SECRET berilganda ulanadi)
+STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
+
+# Prometheus metrikalari (/metrics); 0 - o'chirilgan. Webhook rejimida ham ochiq
+# webhook portida emas, shu ichki manzilda beriladi. Bir hostdagi har bir
+# jarayonga alohida port kerak, shuning uchun worker'larda sukut bo'yicha o'chirilgan
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108 if BOT_ROLE == 'all' else 0))
+
 # Bot ma'lumotlari
 BOT_USERNAME = os.getenv('BOT_USERNAME', '')
 BOT_URL = f"https://t.me/{BOT_USERNAME}" if BOT_USERNAME else ""
@@ -42,5 +127,27 @@ os.makedirs(TEMP_DIRECTORY, exist_ok=True)
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN .env faylida ko'rsatilmagan!")
 
+if BOT_MODE not in ('polling', 'webhook'):
+    raise ValueError(f"BOT_MODE noto'g'ri: {BOT_MODE} (polling yoki webhook bo'lishi kerak)")
+
+if STATE_BACKEND not in ('memory', 'sqlite', 'redis'):
+    raise ValueError(f"STATE_BACKEND noto'g'ri: {STATE_BACKEND} (memory, sqlite yoki redis bo'lishi kerak)")
+
+if BOT_ROLE not in ('all', 'worker'):
+    raise ValueError(f"BOT_ROLE noto'g'ri: {BOT_ROLE} (all yoki worker bo'lishi kerak)")
+
+if BOT_ROLE == 'worker' and STATE_BACKEND == 'memory':
+    # Xotiradagi navbatga boshqa jarayon ish qo'ya olmaydi - ishchi abadiy kutib qoladi
+    raise ValueError("BOT_ROLE=worker uchun STATE_BACKEND sqlite yoki redis bo'lishi kerak!")
+
+if BOT_MODE == 'webhook' and not WEBHOOK_URL:
+    raise ValueError("BOT_MODE=webhook uchun WEBHOOK_URL .env faylida ko'rsatilmagan!")
+
+if BOT_MODE == 'webhook' and STATE_BACKEND != 'memory' and not WEBHOOK_SECRET:
+    raise ValueError("Bir nechta jarayonli webhook rejimida WEBHOOK_SECRET barcha jarayonlarda bir xil bo'lishi kerak!")
+
+if TELEGRAM_API_LOCAL and not TELEGRAM_API_URL:
+    raise ValueError("TELEGRAM_API_LOCAL uchun TELEGRAM_API_URL .env faylida ko'rsatilmagan!")
+
 if not RAPIDAPI_KEY:
     print("Ogohlantirish: RAPIDAPI_KEY .env faylida ko'rsatilmagan!")
@@ -0,0 +1,191 @@
+import importlib
+import logging
+from collections import namedtuple
+
+from aiogram.exceptions import TelegramNetworkError, TelegramBadRequest
+
+from utils import disk_cache
+from utils.delivery import send_video, send_video_and_document
+from utils.downloader import download_media
+from utils.media_cache import media_entry, remember_media
+from utils.metrics import register_collector
+from utils.renditions import MediaTooLarge, select_rendition
+from utils.resolver import resolve_social_media, video_candidates
+
+logger = logging.getLogger(__name__)
+
+# Platforma ma'lumotlari: module - maxsus qayta ishlovchi moduli (None bo'lsa
+# umumiy resolver orqali video), emoji va nom - izohlar va fayl nomlari uchun,
+# send_document - video hujjat sifatida ham yuboriladimi (Instagram - faqat video)
+Extractor = namedtuple('Extractor', ['module', 'emoji', 'label', 'send_document'])
+
+EXTRACTORS = {
+    'instagram': Extractor('handlers.instagram', '📹', 'Instagram', False),
+    'tiktok': Extractor('handlers.tiktok', '🎵', 'TikTok', True),
+    'pinterest': Extractor('handlers.pinterest', '📌', 'Pinterest', True),
+    'twitter': Extractor(None, '🐦', 'Twitter', True),
+    'youtube': Extractor(None, '🎬', 'YouTube', True),
+    'facebook': Extractor(None, '📘', 'Facebook', True),
+}
+
+# Platforma -> qayta ishlovchi; modullar birinchi havola kelganda import qilinadi
+_loaded = {}
+
+extractor_stats = {
+    'loads': 0,
+}
+
+
+def get_extractor(platform):
+    """Platforma uchun qayta ishlovchi: handler(message, bot, url)
+
+    Maxsus modul faqat shu platformaning birinchi havolasida import
+    qilinadi va keyin qayta ishlatiladi. Moduli yo'q platformalar umumiy
+    resolve -> download -> deliver oqimidan foydalanadi.
+    """
+    handler = _loaded.get(platform)
+    if handler is not None:
+        return handler
+
+    extractor = EXTRACTORS[platform]
+    if extractor.module is None:
+        async def handler(message, bot, url):
+            await process_resolved_video(message, bot, url, platform)
+    else:
+        module = importlib.import_module(extractor.module)
+        handler = getattr(module, f"process_{platform}")
+        extractor_stats['loads'] += 1
+        logger.info(f"Loaded extractor module {extractor.module}")
+
+    _loaded[platform] = handler
+    return handler
+
+
+def video_captions(platform):
+    """(video izohi, hujjat izohi)"""
+    extractor = EXTRACTORS[platform]
+    return (
+        f"{extractor.emoji} {extractor.label} video",
+        f"📁 {extractor.label} video (hujjat)",
+    )
+
+
+def too_large_text(error):
+    """Barcha variantlar chegaradan katta bo'lganda foydalanuvchiga xabar"""
+    mb = 1024 * 1024
+    return (
+        f"❌ Video hajmi juda katta: {error.size / mb:.0f} MB.\n"
+        f"Sizning chegarangiz: {error.limit // mb} MB."
+    )
+
+
+async def _send_video(message, bot, source_url, video_content, platform, send_document):
+    video_caption, document_caption = video_captions(platform)
+    if not send_document:
+        video_msg = await send_video(
+            bot, message.chat.id, video_content, f"{platform}_video.mp4", video_caption
+        )
+        await remember_media(source_url, [media_entry('video', video_msg, video_caption)])
+        return
+
+    # Video bir marta yuklab olinadi, hujjat shu fayldan yuboriladi
+    video_msg, doc_msg = await send_video_and_document(
+        bot, message.chat.id, video_content,
+        video_filename=f"{platform}_video.mp4",
+        video_caption=video_caption,
+        document_filename=f"{platform}_video_{message.from_user.id}.mp4",
+        document_caption=document_caption
+    )
+    await remember_media(source_url, [
+        media_entry('video', video_msg, video_caption),
+        media_entry('document', doc_msg, document_caption),
+    ])
+
+
+async def fetch_and_deliver_video(message, bot, source_url, video_url, platform, send_document=None):
+    """Videoni yuklab olib, video (va hujjat) sifatida yuborish va keshga yozish
+
+    send_document berilmasa platforma sozlamasi (Extractor.send_document)
+    ishlatiladi. Yuklab olib bo'lmasa False qaytaradi (chaqiruvchi boshqa
+    usulni sinashi mumkin). Yuborishdagi xatolik foydalanuvchiga shu yerda
+    xabar qilinadi.
+    """
+    if send_document is None:
+        send_document = EXTRACTORS[platform].send_document
+
+    video_content = await download_media(video_url)
+    if not video_content:
+        logger.warning(f"Video download failed for {source_url}")
+        return False
+
+    # Buffer boshqa kutganlar bilan umumiy - yopilganda faqat shu egalik qaytariladi
+    with video_content:
+        try:
+            await _send_video(message, bot, source_url, video_content, platform, send_document)
+        except (TelegramNetworkError, TelegramBadRequest) as e:
+            logger.error(f"Telegram error: {e}")
+            await bot.send_message(message.chat.id, "❌ Video yuborishda xatolik.")
+            return True
+
+        # file_id yaroqsiz bo'lib qolsa, qayta yuklab olmasdan diskdan yuboriladi
+        await disk_cache.store_media(source_url, video_content)
+    return True
+
+
+async def deliver_from_disk_cache(message, bot, source_url, platform, send_document=None):
+    """Diskdagi keshdan videoni qayta yuklab olmasdan yuborish; topilmasa yoki yuborilmasa False"""
+    if send_document is None:
+        send_document = EXTRACTORS[platform].send_document
+
+    video_content = await disk_cache.open_media(source_url)
+    if video_content is None:
+        return False
+
+    try:
+        await _send_video(message, bot, source_url, video_content, platform, send_document)
+        return True
+    except (TelegramNetworkError, TelegramBadRequest) as e:
+        logger.error(f"Telegram error: {e}")
+        return False
+    finally:
+        video_content.close()
+
+
+async def process_resolved_video(message, bot, url, platform):
+    """Umumiy resolver orqali video olish (maxsus moduli yo'q platformalar uchun)"""
+    label = EXTRACTORS[platform].label
+    try:
+        logger.info(f"Processing {label} URL: {url}")
+
+        status, data = await resolve_social_media(url)
+
+        if status != 200:
+            await bot.send_message(message.chat.id, f"❌ API xatoligi: {status}")
+            return
+
+        if not data.get('links'):
+            error_message = data.get('message', f'{label} videosini yuklab olishda xatolik')
+            await bot.send_message(message.chat.id, f"❌ Xatolik: {error_message}")
+            return
+
+        video_url = await select_rendition(video_candidates(data['links']))
+        if not video_url:
+            await bot.send_message(message.chat.id, "❌ Video topilmadi.")
+            return
+
+        if not await fetch_and_deliver_video(message, bot, url, video_url, platform):
+            await bot.send_message(message.chat.id, "❌ Video yuklab olishda xatolik.")
+
+    except MediaTooLarge as e:
+        await bot.send_message(message.chat.id, too_large_text(e))
+    except Exception as e:
+        logger.error(f"Error processing {label} video: {str(e)}")
+        await bot.send_message(message.chat.id, f"❌ {label} videosini qayta ishlashda xatolik.")
+
+
+@register_collector
+def _collect_metrics():
+    return [
+        ('bot_extractor_modules_loaded', 'gauge', 'Platform extractor modules imported so far',
+         extractor_stats['loads']),
+    ]
@@ -1,3 +1,6 @@
+import asyncio
+import time
+
 from aiogram import Bot, types, F
 from aiogram.filters.command import Command
 from aiogram.fsm.context import FSMContext
@@ -5,14 +8,22 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
 
 from config import FREE_LIMIT
-from handlers import facebook, instagram, pinterest, tiktok, twitter, youtube
+from handlers.extractors import deliver_from_disk_cache, get_extractor
 from utils.user_management import (
     check_user_limit,
     get_limit_exceeded_message,
+    get_max_file_size,
     get_usage_stats,
     is_admin,
+    refund_user_download,
 )
 from utils.database import create_coupon, activate_coupon
+from utils.downloader import max_download_size
+from utils.job_queue import download_queue
+from utils.media_cache import send_cached_media
+from utils.metrics import PROCESS_LINK_SECONDS, current_platform
+from utils.link_expander import route_text
+from utils.shared_state import state_backend
 
 
 class DownloadVideo(StatesGroup):
@@ -93,15 +104,10 @@ async def send_help(message: Message):
 
 
 async def process_link(message: Message, state: FSMContext, bot: Bot):
-    url = message.text.strip()
-    
-    # URL tekshirish
-    supported_platforms = [
-        'instagram.com', 'tiktok.com', 'x.com', 'twitter.com',
-        'youtube.com', 'youtu.be', 'facebook.com', 'pin.it', 'pinterest.com'
-    ]
+    # Xabardagi birinchi qo'llab-quvvatlanadigan havolani topish (qisqa havolalar kengaytiriladi)
+    route = await route_text(message.text)
     
-    if not any(platform in url for platform in supported_platforms):
+    if route is None:
         await message.answer(
             "❌ Qo'llab-quvvatlanmaydigan havola!\n\n"
             "Iltimos, quyidagi platformalardan havola yuboring:\n"
@@ -109,35 +115,85 @@ async def process_link(message: Message, state: FSMContext, bot: Bot):
         )
         return
     
+    # Navbatda joy borligini tekshirish (limit sarflanishidan oldin)
+    if not await download_queue.can_accept(message.from_user.id):
+        await message.answer(
+            "⏳ Oldingi havolalaringiz hali qayta ishlanmoqda yoki navbat to'la.\n"
+            "Iltimos, biroz kutib qaytadan yuboring."
+        )
+        return
+
     # Limit tekshirish
-    if not check_user_limit(message.from_user.id):
+    if not await check_user_limit(message.from_user.id):
         await message.answer(get_limit_exceeded_message())
         return
 
     # Jarayon xabari
     processing_msg = await message.answer("⏳ Havolangizni qayta ishlamoqdaman...")
-    
+
+    # Vazifani navbatga qo'yish, handler darhol bo'shaydi
+    # Vazifa boshqa jarayonda bajarilishi mumkin, shuning uchun JSON ko'rinishida
+    position = await download_queue.queue_position()
     try:
-        if 'instagram.com' in url:
-            await instagram.process_instagram(message, bot, url)
-        elif 'tiktok.com' in url:
-            await tiktok.process_tiktok(message, bot, url)
-        elif 'x.com' in url or 'twitter.com' in url:
-            await twitter.process_twitter(message, bot, url)
-        elif 'youtube.com' in url or 'youtu.be' in url:
-            await youtube.process_youtube(message, bot, url)
-        elif 'facebook.com' in url:
-            await facebook.process_facebook(message, bot, url)
-        elif 'pin.it' in url or 'pinterest.com' in url:
-            await pinterest.process_pinterest(message, bot, url)
+        await download_queue.submit(message.from_user.id, {
+            'url': route.url,
+            'platform': route.platform,
+            'message': message.model_dump(mode='json', exclude_none=True),
+            'processing_msg': processing_msg.model_dump(mode='json', exclude_none=True),
+            'queued': position > 0,
+        })
+        if position > 0:
+            await processing_msg.edit_text(
+                f"⏳ Havolangiz navbatga qo'yildi. Navbatdagi o'rningiz: {position}"
+            )
+    except asyncio.QueueFull:
+        # Navbat shu orada to'lib qoldi - sarflangan limit qaytariladi
+        await refund_user_download(message.from_user.id)
+        await processing_msg.edit_text("❌ Navbat to'la. Iltimos, birozdan so'ng qaytadan urinib ko'ring.")
+
+    await state.set_state(DownloadVideo.waiting_for_link)
+
+
+async def run_download_job(bot: Bot, job: dict):
+    """Navbatdan olingan havolani qayta ishlash (ishchi ichida)"""
+    url = job['url']
+    message = Message.model_validate(job['message']).as_(bot)
+    processing_msg = Message.model_validate(job['processing_msg']).as_(bot)
+    queued = job['queued']
+    platform = job['platform']
+    handler = get_extractor(platform)
+
+    current_platform.set(platform)
+    # Yuklab olinadigan fayl hajmi foydalanuvchi tarifiga bog'liq
+    max_download_size.set(await get_max_file_size(message.from_user.id))
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        if queued:
+            await processing_msg.edit_text("⏳ Havolangizni qayta ishlamoqdaman...")
+
+        # Avval yuborilgan kontentni file_id orqali qayta yuborish
+        if await send_cached_media(bot, message.chat.id, url):
+            outcome = 'cached'
+            await processing_msg.delete()
+            return
+
+        # file_id yo'q bo'lsa, avval yuklab olingan faylni diskdan yuborish
+        if await deliver_from_disk_cache(message, bot, url, platform):
+            outcome = 'disk_cache'
+            await processing_msg.delete()
+            return
+
+        await handler(message, bot, url)
+        outcome = 'processed'
             
         # Jarayon xabarini o'chirish
         await processing_msg.delete()
         
     except Exception as e:
         await processing_msg.edit_text(f"❌ Kontent qayta ishlashda xatolik: {str(e)}")
-
-    await state.set_state(DownloadVideo.waiting_for_link)
+    finally:
+        PROCESS_LINK_SECONDS.observe(time.perf_counter() - started, platform=platform, outcome=outcome)
 
 
 async def generate_coupon_command(message: Message, state: FSMContext):
@@ -216,8 +272,8 @@ async def activate_coupon_command(message: Message, state: FSMContext):
 async def handle_coupon_activation(message: Message, state: FSMContext):
     coupon_code = message.text.strip()
     activation_result = activate_coupon(message.from_user.id, coupon_code)
-
     if activation_result:
+        await state_backend.invalidate_quota(message.from_user.id)
         await message.answer(
             "🎉 <b>Kupon muvaffaqiyatli faollashtirildi!</b>\n\n"
             "✅ Endi sizda cheksiz yuklab olish imkoniyati bor!\n"
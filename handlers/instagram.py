@@ -1,61 +1,28 @@
 import logging
-import requests
+import aiohttp
 import asyncio
-from aiogram.types import URLInputFile, BufferedInputFile, InputMediaPhoto
-from aiogram.exceptions import TelegramNetworkError, TelegramBadRequest
+from aiogram.types import InputMediaPhoto
 
-from config import RAPIDAPI_KEY
+from handlers.extractors import fetch_and_deliver_video, too_large_text
+from utils.downloader import close_all, download_many, download_media
+from utils.media_cache import media_entry, media_group_entry, remember_media
+from utils.renditions import MediaTooLarge, select_rendition
+from utils.resolver import resolve_social_media, video_candidates
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-async def download_file(url, max_size=50*1024*1024):  # 50MB limit
-    """Fayl (video yoki rasm) yuklab olish"""
-    try:
-        response = requests.get(url, stream=True, timeout=30)
-        response.raise_for_status()
-        
-        # Fayl hajmini tekshirish
-        content_length = response.headers.get('content-length')
-        if content_length and int(content_length) > max_size:
-            logger.warning(f"File too large: {content_length} bytes")
-            return None
-        
-        content = b''
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                content += chunk
-                if len(content) > max_size:
-                    logger.warning("File size exceeded during download")
-                    return None
-        
-        return content
-    except Exception as e:
-        logger.error(f"Error downloading file: {e}")
-        return None
-
-
 async def process_instagram(message, bot, instagram_url):
     try:
         logger.info(f"Processing Instagram URL: {instagram_url}")
 
-        url = "https://social-media-video-downloader.p.rapidapi.com/smvd/get/all"
-        
-        querystring = {"url": instagram_url}
-        
-        headers = {
-            "x-rapidapi-key": RAPIDAPI_KEY,
-            "x-rapidapi-host": "social-media-video-downloader.p.rapidapi.com"
-        }
-
-        response = requests.get(url, headers=headers, params=querystring, timeout=30)
+        status, data = await resolve_social_media(instagram_url)
         
-        logger.info(f"API Response status: {response.status_code}")
+        logger.info(f"API Response status: {status}")
         
-        if response.status_code == 200:
-            data = response.json()
+        if status == 200:
             
             # Video bor-yo'qligini tekshirish
             has_video = 'links' in data and len(data['links']) > 0
@@ -63,66 +30,19 @@ async def process_instagram(message, bot, instagram_url):
             
             if has_video:
                 # Video qayta ishlash
-                video_url = None
-                
-                # Video linkini topish
-                for link in data['links']:
-                    quality = link.get('quality', '')
-                    if 'video_hd_original' in quality or 'video' in quality:
-                        video_url = link['link']
-                        logger.info(f"Found HD video URL with quality: {quality}")
-                        break
-                
-                if not video_url:
-                    for link in data['links']:
-                        quality = link.get('quality', '')
-                        link_url = link.get('link', '')
-                        if 'audio' not in quality and ('mp4' in link_url or 'video' in quality):
-                            video_url = link_url
-                            logger.info(f"Found alternative video URL with quality: {quality}")
-                            break
+                video_url = await select_rendition(video_candidates(data['links']))
                 
                 if video_url:
                     logger.info(f"Selected video URL: {video_url[:100]}...")
                     
-                    # Video yuklab olish
-                    video_content = await download_file(video_url)
-                    
-                    if video_content:
-                        try:
-                            # Faqat video yuborish (hujjat emas)
-                            video_file = BufferedInputFile(video_content, filename="instagram_video.mp4")
-                            await bot.send_video(
-                                chat_id=message.chat.id,
-                                video=video_file,
-                                caption="📹 Instagram video",
-                                request_timeout=60
-                            )
-                            logger.info("Video successfully sent")
-                            
-                        except TelegramNetworkError as e:
-                            logger.error(f"Telegram network error: {e}")
-                            await bot.send_message(
-                                message.chat.id, 
-                                "❌ Tarmoq xatoligi. Iltimos, qaytadan urinib ko'ring."
-                            )
-                        except TelegramBadRequest as e:
-                            logger.error(f"Telegram bad request: {e}")
-                            await bot.send_message(
-                                message.chat.id, 
-                                "❌ Video yuborishda xatolik. Fayl juda katta bo'lishi mumkin."
-                            )
-                        except Exception as e:
-                            logger.error(f"Error sending video: {e}")
-                            await bot.send_message(
-                                message.chat.id, 
-                                "❌ Video yuborishda xatolik yuz berdi."
-                            )
-                    else:
+                    # Yuklab olish, yuborish va keshga yozish umumiy oqim orqali
+                    if not await fetch_and_deliver_video(message, bot, instagram_url, video_url, 'instagram'):
                         await bot.send_message(
                             message.chat.id, 
                             "❌ Video yuklab olishda xatolik. Fayl juda katta bo'lishi mumkin."
                         )
+                else:
+                    await bot.send_message(message.chat.id, "❌ Video topilmadi.")
             
             elif has_images:
                 # Rasmlar qayta ishlash
@@ -132,29 +52,31 @@ async def process_instagram(message, bot, instagram_url):
                     # Agar 1 ta rasm bo'lsa
                     if len(data['images']) == 1:
                         image_url = data['images'][0]
-                        image_content = await download_file(image_url, max_size=10*1024*1024)  # 10MB limit for images
+                        image_content = await download_media(image_url, max_size=10*1024*1024)  # 10MB limit for images
                         
                         if image_content:
-                            # Rasm formatini aniqlash
-                            if image_url.lower().endswith('.jpg') or image_url.lower().endswith('.jpeg'):
-                                filename = "instagram_photo.jpg"
-                            elif image_url.lower().endswith('.png'):
-                                filename = "instagram_photo.png"
-                            elif image_url.lower().endswith('.webp'):
-                                filename = "instagram_photo.webp"
-                            else:
-                                filename = "instagram_photo.jpg"
+                            with image_content:
+                                # Rasm formatini aniqlash
+                                if image_url.lower().endswith('.jpg') or image_url.lower().endswith('.jpeg'):
+                                    filename = "instagram_photo.jpg"
+                                elif image_url.lower().endswith('.png'):
+                                    filename = "instagram_photo.png"
+                                elif image_url.lower().endswith('.webp'):
+                                    filename = "instagram_photo.webp"
+                                else:
+                                    filename = "instagram_photo.jpg"
                             
-                            # Faqat rasm yuborish (hujjat emas)
-                            photo_file = BufferedInputFile(image_content, filename=filename)
-                            await bot.send_photo(
-                                chat_id=message.chat.id,
-                                photo=photo_file,
-                                caption="📸 Instagram rasm",
-                                request_timeout=60
-                            )
+                                # Faqat rasm yuborish (hujjat emas)
+                                photo_file = image_content.input_file(filename)
+                                sent_msg = await bot.send_photo(
+                                    chat_id=message.chat.id,
+                                    photo=photo_file,
+                                    caption="📸 Instagram rasm",
+                                    request_timeout=60
+                                )
+                                await remember_media(instagram_url, [media_entry('photo', sent_msg, "📸 Instagram rasm")])
                             
-                            logger.info("Single image successfully sent")
+                                logger.info("Single image successfully sent")
                         else:
                             await bot.send_message(message.chat.id, "❌ Rasmni yuklab olishda xatolik.")
                     
@@ -163,41 +85,51 @@ async def process_instagram(message, bot, instagram_url):
                         media_group = []
                         images_to_send = data['images'][:10]  # Maksimal 10 ta rasm
                         
-                        for i, image_url in enumerate(images_to_send):
-                            image_content = await download_file(image_url, max_size=10*1024*1024)
-                            
-                            if image_content:
-                                # Rasm formatini aniqlash
-                                if image_url.lower().endswith('.jpg') or image_url.lower().endswith('.jpeg'):
-                                    filename = f"instagram_photo_{i+1}.jpg"
-                                elif image_url.lower().endswith('.png'):
-                                    filename = f"instagram_photo_{i+1}.png"
-                                elif image_url.lower().endswith('.webp'):
-                                    filename = f"instagram_photo_{i+1}.webp"
-                                else:
-                                    filename = f"instagram_photo_{i+1}.jpg"
+                        # Rasmlarni parallel yuklab olish (tartib saqlanadi)
+                        image_contents = await download_many(images_to_send, max_size=10*1024*1024)
+                        
+                        try:
+                            for i, (image_url, image_content) in enumerate(zip(images_to_send, image_contents)):
+                                if image_content:
+                                    # Rasm formatini aniqlash
+                                    if image_url.lower().endswith('.jpg') or image_url.lower().endswith('.jpeg'):
+                                        filename = f"instagram_photo_{i+1}.jpg"
+                                    elif image_url.lower().endswith('.png'):
+                                        filename = f"instagram_photo_{i+1}.png"
+                                    elif image_url.lower().endswith('.webp'):
+                                        filename = f"instagram_photo_{i+1}.webp"
+                                    else:
+                                        filename = f"instagram_photo_{i+1}.jpg"
                                 
-                                photo_file = BufferedInputFile(image_content, filename=filename)
+                                    photo_file = image_content.input_file(filename)
                                 
-                                if i == 0:
-                                    media_group.append(InputMediaPhoto(
-                                        media=photo_file,
-                                        caption=f"📸 Instagram rasmlari ({len(images_to_send)} ta)"
-                                    ))
+                                    # Izoh birinchi yuklangan rasmga qo'yiladi
+                                    if not media_group:
+                                        media_group.append(InputMediaPhoto(
+                                            media=photo_file,
+                                            caption=f"📸 Instagram rasmlari ({len(images_to_send)} ta)"
+                                        ))
+                                    else:
+                                        media_group.append(InputMediaPhoto(media=photo_file))
                                 else:
-                                    media_group.append(InputMediaPhoto(media=photo_file))
+                                    logger.warning(f"Skipping image {i+1}, download failed")
                         
-                        if media_group:
-                            # Faqat media guruh yuborish (hujjat emas)
-                            await bot.send_media_group(
-                                chat_id=message.chat.id,
-                                media=media_group,
-                                request_timeout=60
-                            )
+                            if media_group:
+                                # Faqat media guruh yuborish (hujjat emas)
+                                sent_msgs = await bot.send_media_group(
+                                    chat_id=message.chat.id,
+                                    media=media_group,
+                                    request_timeout=60
+                                )
+                                await remember_media(instagram_url, [
+                                    media_group_entry(sent_msgs, f"📸 Instagram rasmlari ({len(images_to_send)} ta)")
+                                ])
                             
-                            logger.info(f"Multiple images ({len(media_group)}) successfully sent")
-                        else:
-                            await bot.send_message(message.chat.id, "❌ Rasmlarni yuklab olishda xatolik.")
+                                logger.info(f"Multiple images ({len(media_group)}) successfully sent")
+                            else:
+                                await bot.send_message(message.chat.id, "❌ Rasmlarni yuklab olishda xatolik.")
+                        finally:
+                            close_all(image_contents)
                 
                 except Exception as e:
                     logger.error(f"Error processing images: {e}")
@@ -207,12 +139,14 @@ async def process_instagram(message, bot, instagram_url):
                 await bot.send_message(message.chat.id, "❌ Bu postda video yoki rasm topilmadi.")
                 
         else:
-            await bot.send_message(message.chat.id, f"❌ API xatoligi: {response.status_code}")
+            await bot.send_message(message.chat.id, f"❌ API xatoligi: {status}")
 
-    except requests.exceptions.Timeout:
+    except MediaTooLarge as e:
+        await bot.send_message(message.chat.id, too_large_text(e))
+    except asyncio.TimeoutError:
         logger.error("Request timeout")
         await bot.send_message(message.chat.id, "❌ So'rov vaqti tugadi. Qaytadan urinib ko'ring.")
-    except requests.exceptions.RequestException as e:
+    except aiohttp.ClientError as e:
         logger.error(f"Request error: {e}")
         await bot.send_message(message.chat.id, "❌ Internet ulanishida xatolik.")
     except Exception as e:
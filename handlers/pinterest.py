@@ -1,100 +1,155 @@
-import logging
-import requests
 import asyncio
+import logging
 import re
-from aiogram.types import URLInputFile, BufferedInputFile, InputMediaPhoto
-from aiogram.exceptions import TelegramNetworkError, TelegramBadRequest
 
-from config import RAPIDAPI_KEY
+import aiohttp
+from aiogram.types import InputMediaPhoto
+
+from handlers.extractors import fetch_and_deliver_video, too_large_text
+from utils.downloader import close_all, download_many, download_media
+from utils.http_client import get_http_session
+from utils.link_expander import expand_url
+from utils.media_cache import media_entry, media_group_entry, remember_media
+from utils.renditions import MediaTooLarge, select_rendition
+from utils.resolver import resolve_social_media, video_candidates
 
 logger = logging.getLogger(__name__)
 
 
-async def download_file(url, max_size=50*1024*1024):
-    """Fayl (video yoki rasm) yuklab olish"""
-    try:
-        response = requests.get(url, stream=True, timeout=30)
-        response.raise_for_status()
-        
-        content_length = response.headers.get('content-length')
-        if content_length and int(content_length) > max_size:
-            logger.warning(f"File too large: {content_length} bytes")
-            return None
-        
-        content = b''
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                content += chunk
-                if len(content) > max_size:
-                    logger.warning("File size exceeded during download")
-                    return None
-        
-        return content
-    except Exception as e:
-        logger.error(f"Error downloading file: {e}")
-        return None
+# Rasm URL'lari uchun ifodalar (ustuvorlik tartibida), bir marta kompilyatsiya qilinadi.
+# Ifoda faqat bo'lakda uning literal qismi uchrasa ishga tushiriladi
+PINIMG_URL = b'"url":"https://i.pinimg.com/'
+PINTEREST_IMAGE_PATTERNS = [
+    (PINIMG_URL, re.compile(rb'"url":"(https://i\.pinimg\.com/originals/[^"]+)"')),
+    (PINIMG_URL, re.compile(rb'"url":"(https://i\.pinimg\.com/736x/[^"]+)"')),
+    (b'"images":{"orig":{"url":"', re.compile(rb'"images":\{"orig":\{"url":"([^"]+)"')),
+    (b'property="og:image"', re.compile(rb'property="og:image" content="([^"]+)"')),
+    (b'"image_large_url":"', re.compile(rb'"image_large_url":"([^"]+)"')),
+    (b'"image_medium_url":"', re.compile(rb'"image_medium_url":"([^"]+)"')),
+]
+
+# Sahifadan o'qiladigan eng ko'p hajm va bo'laklar chegarasidagi moslikni
+# yo'qotmaslik uchun keyingi bo'lakka qo'shiladigan oxirgi qism
+PINTEREST_SCAN_LIMIT = 1024 * 1024
+PINTEREST_SCAN_CHUNK = 64 * 1024
+SCAN_OVERLAP = 4096
+
+PINTEREST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+
+class PinterestImageScanner:
+    """HTML baytlarini bo'laklab ko'rib chiqib, eng yaxshi rasm URL'ini topish
+
+    originals URL topilishi bilan to'xtaydi (undan yaxshisi yo'q). Aks holda
+    oldingi tartib saqlanadi: avvalgi ifodaning mosligi, uning ichida esa
+    originals/736x URL'lar afzal.
+    """
+
+    def __init__(self):
+        self._tail = b''
+        self._best = None
+        self.done = False
+
+    def feed(self, data):
+        """Navbatdagi bayt bo'lagini tekshirish; yakuniy natija topilsa True"""
+        window = self._tail + data
+        overlap = len(self._tail)
+        present = {}
+        for priority, (literal, pattern) in enumerate(PINTEREST_IMAGE_PATTERNS):
+            # Topilgan natijani faqat yuqoriroq ustuvorlikdagi moslik yaxshilay oladi
+            if self._best is not None and self._best[:2] <= (priority, 0):
+                break
+            if literal not in present:
+                present[literal] = window.find(literal)
+            start = present[literal]
+            if start < 0:
+                continue
+            for match in pattern.finditer(window, start):
+                # Oldingi bo'lakda to'liq ko'rilgan mosliklarni o'tkazib yuborish
+                if match.end() <= overlap:
+                    continue
+                url = match.group(1).decode('utf-8', errors='replace')
+                if 'originals' in url:
+                    self._best = (priority, 0, url)
+                    self.done = True
+                    return True
+                rank = (priority, 0 if '736x' in url else 1, url)
+                if self._best is None or rank[:2] < self._best[:2]:
+                    self._best = rank
+        self._tail = window[-SCAN_OVERLAP:]
+        return False
+
+    def result(self):
+        return self._best[2] if self._best else None
 
 
 def extract_pinterest_image_from_html(html_content):
     """HTML'dan Pinterest rasm URL'ini ajratib olish"""
     try:
-        # Pinterest'da asosiy rasm URL'ini topish
-        patterns = [
-            r'"url":"(https://i\.pinimg\.com/originals/[^"]+)"',
-            r'"url":"(https://i\.pinimg\.com/736x/[^"]+)"',
-            r'"images":\{"orig":\{"url":"([^"]+)"',
-            r'property="og:image" content="([^"]+)"',
-            r'"image_large_url":"([^"]+)"',
-            r'"image_medium_url":"([^"]+)"'
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, html_content)
-            if matches:
-                # Eng yaxshi sifatli rasmni tanlash
-                for match in matches:
-                    if 'originals' in match or '736x' in match:
-                        logger.info(f"Found Pinterest image URL: {match}")
-                        return match
-                
-                # Agar originals topilmasa, birinchi topilgan rasmni qaytarish
-                logger.info(f"Found Pinterest image URL (fallback): {matches[0]}")
-                return matches[0]
-        
-        return None
+        page = html_content.encode('utf-8')
+        scanner = PinterestImageScanner()
+        for offset in range(0, len(page), PINTEREST_SCAN_CHUNK):
+            if scanner.feed(page[offset:offset + PINTEREST_SCAN_CHUNK]):
+                break
+        image_url = scanner.result()
+        if image_url:
+            logger.info(f"Found Pinterest image URL: {image_url}")
+        return image_url
     except Exception as e:
         logger.error(f"Error extracting image from HTML: {e}")
         return None
 
 
+async def scan_pinterest_page(page_url, limit=PINTEREST_SCAN_LIMIT):
+    """Sahifani bo'laklab o'qib, rasm topilishi yoki limitga yetguncha skanerlash
+
+    Qaytaradi: (rasm URL'i yoki None, o'qilgan baytlar). Ifodalar event
+    loop'ni bloklamasligi uchun alohida oqimda ishlaydi.
+    """
+    session = get_http_session()
+    scanner = PinterestImageScanner()
+    bytes_read = 0
+
+    async with session.get(
+        page_url,
+        headers=PINTEREST_HEADERS,
+        timeout=aiohttp.ClientTimeout(total=15)
+    ) as response:
+        if response.status != 200:
+            logger.warning(f"Pinterest page returned status {response.status}")
+            return None, bytes_read
+
+        async for chunk in response.content.iter_chunked(PINTEREST_SCAN_CHUNK):
+            bytes_read += len(chunk)
+            if await asyncio.to_thread(scanner.feed, chunk):
+                break
+            if bytes_read >= limit:
+                logger.info(f"Pinterest scan stopped at {bytes_read} bytes limit")
+                break
+
+    return scanner.result(), bytes_read
+
+
 async def process_pinterest_direct(pinterest_url):
     """Pinterest'dan to'g'ridan-to'g'ri rasm olish"""
     try:
-        # Pinterest URL'ini to'g'ri formatga keltirish
-        if 'pin.it' in pinterest_url:
-            # pin.it linkini kengaytirish
-            response = requests.get(pinterest_url, allow_redirects=True, timeout=10)
-            pinterest_url = response.url
+        # Pinterest URL'ini to'g'ri formatga keltirish (pin.it linkini kengaytirish)
+        pinterest_url = await expand_url(pinterest_url)
         
         logger.info(f"Processing direct Pinterest URL: {pinterest_url}")
         
-        # Pinterest sahifasini olish
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-        }
-        
-        response = requests.get(pinterest_url, headers=headers, timeout=15)
+        # Sahifani rasm topilguncha o'qish
+        image_url, bytes_read = await scan_pinterest_page(pinterest_url)
         
-        if response.status_code == 200:
-            html_content = response.text
-            image_url = extract_pinterest_image_from_html(html_content)
-            
-            if image_url:
-                return image_url
+        if image_url:
+            logger.info(f"Found Pinterest image URL after {bytes_read} bytes: {image_url}")
+            return image_url
         
         return None
     except Exception as e:
@@ -107,19 +162,10 @@ async def process_pinterest(message, bot, pinterest_url):
         logger.info(f"Processing Pinterest URL: {pinterest_url}")
 
         # Avval asosiy API'ni sinab ko'rish
-        url = "https://social-media-video-downloader.p.rapidapi.com/smvd/get/all"
-        querystring = {"url": pinterest_url}
-        headers = {
-            "x-rapidapi-key": RAPIDAPI_KEY,
-            "x-rapidapi-host": "social-media-video-downloader.p.rapidapi.com"
-        }
-
         try:
-            response = requests.get(url, headers=headers, params=querystring, timeout=30)
+            status, data = await resolve_social_media(pinterest_url)
             
-            if response.status_code == 200:
-                data = response.json()
-                
+            if status == 200:
                 if data.get('success', False):
                     # Video bor-yo'qligini tekshirish
                     has_video = 'links' in data and len(data['links']) > 0
@@ -127,50 +173,12 @@ async def process_pinterest(message, bot, pinterest_url):
                     
                     if has_video:
                         # Video qayta ishlash (oldingi kod)
-                        video_url = None
-                        
-                        for link in data['links']:
-                            quality = link.get('quality', '')
-                            if 'video_hd_original' in quality or 'video' in quality:
-                                video_url = link['link']
-                                break
+                        video_url = await select_rendition(video_candidates(data['links']))
                         
-                        if not video_url:
-                            for link in data['links']:
-                                quality = link.get('quality', '')
-                                link_url = link.get('link', '')
-                                if 'audio' not in quality and ('mp4' in link_url or 'video' in quality):
-                                    video_url = link_url
-                                    break
-                        
-                        if video_url:
-                            video_content = await download_file(video_url)
-                            
-                            if video_content:
-                                try:
-                                    video_file = BufferedInputFile(video_content, filename="pinterest_video.mp4")
-                                    await bot.send_video(
-                                        chat_id=message.chat.id,
-                                        video=video_file,
-                                        caption="📌 Pinterest video",
-                                        request_timeout=60
-                                    )
-                                    
-                                    await asyncio.sleep(1)
-                                    
-                                    file_name = f"pinterest_video_{message.from_user.id}.mp4"
-                                    doc_file = BufferedInputFile(video_content, filename=file_name)
-                                    await bot.send_document(
-                                        chat_id=message.chat.id,
-                                        document=doc_file,
-                                        caption="📁 Pinterest video (hujjat)",
-                                        disable_content_type_detection=True,
-                                        request_timeout=60
-                                    )
-                                    return
-                                except (TelegramNetworkError, TelegramBadRequest) as e:
-                                    await bot.send_message(message.chat.id, "❌ Video yuborishda xatolik.")
-                                    return
+                        if video_url and await fetch_and_deliver_video(
+                            message, bot, pinterest_url, video_url, 'pinterest'
+                        ):
+                            return
                     
                     elif has_images:
                         # API'dan rasmlar qayta ishlash (oldingi kod)
@@ -179,19 +187,55 @@ async def process_pinterest(message, bot, pinterest_url):
                         try:
                             if len(data['images']) == 1:
                                 image_url = data['images'][0]
-                                image_content = await download_file(image_url, max_size=10*1024*1024)
+                                image_content = await download_media(image_url, max_size=10*1024*1024)
                                 
                                 if image_content:
-                                    photo_file = BufferedInputFile(image_content, filename="pinterest_photo.jpg")
-                                    await bot.send_photo(
-                                        chat_id=message.chat.id,
-                                        photo=photo_file,
-                                        caption="📌 Pinterest rasm",
-                                        request_timeout=60
-                                    )
-                                    return
+                                    with image_content:
+                                        photo_file = image_content.input_file("pinterest_photo.jpg")
+                                        sent_msg = await bot.send_photo(
+                                            chat_id=message.chat.id,
+                                            photo=photo_file,
+                                            caption="📌 Pinterest rasm",
+                                            request_timeout=60
+                                        )
+                                        await remember_media(pinterest_url, [media_entry('photo', sent_msg, "📌 Pinterest rasm")])
+                                        return
+                            
+                            # Bir nechta rasm bo'lsa (maksimal 10 ta) - parallel yuklab olish
+                            else:
+                                images_to_send = data['images'][:10]
+                                image_contents = await download_many(images_to_send, max_size=10*1024*1024)
+                                
+                                try:
+                                    media_group = []
+                                    for i, image_content in enumerate(image_contents):
+                                        if image_content:
+                                            photo_file = image_content.input_file(f"pinterest_photo_{i+1}.jpg")
+                                            if not media_group:
+                                                media_group.append(InputMediaPhoto(
+                                                    media=photo_file,
+                                                    caption=f"📌 Pinterest rasmlari ({len(images_to_send)} ta)"
+                                                ))
+                                            else:
+                                                media_group.append(InputMediaPhoto(media=photo_file))
+                                
+                                    if media_group:
+                                        sent_msgs = await bot.send_media_group(
+                                            chat_id=message.chat.id,
+                                            media=media_group,
+                                            request_timeout=60
+                                        )
+                                        await remember_media(pinterest_url, [
+                                            media_group_entry(sent_msgs, f"📌 Pinterest rasmlari ({len(images_to_send)} ta)")
+                                        ])
+                                        return
+                                finally:
+                                    close_all(image_contents)
                         except Exception as e:
                             logger.error(f"Error processing API images: {e}")
+        except MediaTooLarge as e:
+            await bot.send_message(message.chat.id, too_large_text(e))
+            return
         except Exception as e:
             logger.error(f"API request failed: {e}")
         
@@ -202,27 +246,29 @@ async def process_pinterest(message, bot, pinterest_url):
         
         if image_url:
             try:
-                image_content = await download_file(image_url, max_size=10*1024*1024)
+                image_content = await download_media(image_url, max_size=10*1024*1024)
                 
                 if image_content:
-                    # Rasm formatini aniqlash
-                    if image_url.lower().endswith('.jpg') or image_url.lower().endswith('.jpeg'):
-                        filename = "pinterest_photo.jpg"
-                    elif image_url.lower().endswith('.png'):
-                        filename = "pinterest_photo.png"
-                    elif image_url.lower().endswith('.webp'):
-                        filename = "pinterest_photo.webp"
-                    else:
-                        filename = "pinterest_photo.jpg"
+                    with image_content:
+                        # Rasm formatini aniqlash
+                        if image_url.lower().endswith('.jpg') or image_url.lower().endswith('.jpeg'):
+                            filename = "pinterest_photo.jpg"
+                        elif image_url.lower().endswith('.png'):
+                            filename = "pinterest_photo.png"
+                        elif image_url.lower().endswith('.webp'):
+                            filename = "pinterest_photo.webp"
+                        else:
+                            filename = "pinterest_photo.jpg"
                     
-                    photo_file = BufferedInputFile(image_content, filename=filename)
-                    await bot.send_photo(
-                        chat_id=message.chat.id,
-                        photo=photo_file,
-                        caption="📌 Pinterest rasm",
-                        request_timeout=60
-                    )
-                    logger.info("Pinterest image successfully sent via direct method")
+                        photo_file = image_content.input_file(filename)
+                        sent_msg = await bot.send_photo(
+                            chat_id=message.chat.id,
+                            photo=photo_file,
+                            caption="📌 Pinterest rasm",
+                            request_timeout=60
+                        )
+                        await remember_media(pinterest_url, [media_entry('photo', sent_msg, "📌 Pinterest rasm")])
+                        logger.info("Pinterest image successfully sent via direct method")
                 else:
                     await bot.send_message(message.chat.id, "❌ Rasmni yuklab olishda xatolik.")
             except Exception as e:
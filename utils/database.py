@@ -1,15 +1,60 @@
+import json
 import sqlite3
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 from config import DATABASE_PATH
+from utils.metrics import timed_db_call
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Busy timeout in milliseconds and prepared statement cache size
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+
+def _open_connection():
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE
+    )
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers run alongside the single writer; NORMAL sync is
+    # durable across application crashes and much cheaper than FULL
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
 
 def get_connection():
-    """Get database connection"""
-    return sqlite3.connect(DATABASE_PATH)
+    """Get this thread's persistent database connection"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _open_connection()
+        _local.conn = conn
+    return conn
+
+
+def rollback():
+    """Roll back an unfinished transaction after an error"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+
+def close_connection():
+    """Close this thread's database connection (on shutdown)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
 
 
 def init_database():
@@ -63,15 +108,96 @@ def init_database():
             )
         ''')
         
+        # Create Telegram file_id cache table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS media_cache (
+                source_key TEXT PRIMARY KEY,
+                entries TEXT NOT NULL,
+                hits INTEGER DEFAULT 0,
+                created_at DATETIME NOT NULL,
+                last_used_at DATETIME NOT NULL
+            )
+        ''')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_media_cache_last_used ON media_cache (last_used_at)'
+        )
+        
+        # Create resolver (RapidAPI) response cache table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS resolver_cache (
+                source_key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                expires_at DATETIME NOT NULL
+            )
+        ''')
+        
+        # Create short link redirect cache table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS redirect_cache (
+                short_url TEXT PRIMARY KEY,
+                final_url TEXT NOT NULL,
+                expires_at DATETIME NOT NULL
+            )
+        ''')
+        
+        # Create content-addressed disk cache index (file hash -> size, source URL -> hash)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS disk_cache_files (
+                content_hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_disk_cache_files_access ON disk_cache_files (last_access)'
+        )
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS disk_cache_sources (
+                source_key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL
+            )
+        ''')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_disk_cache_sources_hash ON disk_cache_sources (content_hash)'
+        )
+        
+        # Create shared download job queue table (multi-process mode)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS download_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                claimed_by TEXT,
+                claimed_at REAL
+            )
+        ''')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_download_jobs_claimed ON download_jobs (claimed_at, id)'
+        )
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_download_jobs_user ON download_jobs (user_id)'
+        )
+        
+        # Create shared FSM state table (multi-process mode)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_state (
+                storage_key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}'
+            )
+        ''')
+        
         conn.commit()
-        conn.close()
         logger.info("Database initialized successfully")
         
     except Exception as e:
+        rollback()
         logger.error(f"Error initializing database: {e}")
         raise
 
 
+@timed_db_call
 def get_user(user_id):
     """Get user from database"""
     try:
@@ -79,23 +205,24 @@ def get_user(user_id):
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
         user = cursor.fetchone()
-        conn.close()
         
         if user:
             return {
-                'id': user[0],
-                'user_id': user[1],
-                'downloads_count': user[2],
-                'subscription_end': datetime.fromisoformat(user[3]) if user[3] else None,
-                'created_at': user[4]
+                'id': user['id'],
+                'user_id': user['user_id'],
+                'downloads_count': user['downloads_count'],
+                'subscription_end': datetime.fromisoformat(user['subscription_end']) if user['subscription_end'] else None,
+                'created_at': user['created_at']
             }
         return None
         
     except Exception as e:
+        rollback()
         logger.error(f"Error getting user: {e}")
         return None
 
 
+@timed_db_call
 def create_user(user_id):
     """Create new user"""
     try:
@@ -106,15 +233,16 @@ def create_user(user_id):
             (user_id, 0)
         )
         conn.commit()
-        conn.close()
         logger.info(f"Created new user: {user_id}")
         return get_user(user_id)
         
     except Exception as e:
+        rollback()
         logger.error(f"Error creating user: {e}")
         return None
 
 
+@timed_db_call
 def increment_downloads(user_id):
     """Increment user download count"""
     try:
@@ -125,12 +253,81 @@ def increment_downloads(user_id):
             (user_id,)
         )
         conn.commit()
-        conn.close()
         
     except Exception as e:
+        rollback()
         logger.error(f"Error incrementing downloads: {e}")
 
 
+@timed_db_call
+def consume_download(user_id, free_limit):
+    """Atomically create the user if needed and consume one download
+
+    One upsert statement both checks the entitlement and increments the
+    counter, so concurrent requests can't go past free_limit. Returns True
+    when the download is allowed. Requires SQLite 3.35+ (RETURNING).
+    """
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            '''INSERT INTO users (user_id, downloads_count)
+               SELECT ?, 1 WHERE ? > 0
+               ON CONFLICT(user_id) DO UPDATE SET
+                   downloads_count = downloads_count + 1
+               WHERE users.subscription_end > ? OR users.downloads_count < ?
+               RETURNING downloads_count''',
+            (user_id, free_limit, datetime.now().isoformat(), free_limit)
+        )
+        allowed = cursor.fetchone() is not None
+        conn.commit()
+        return allowed
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error consuming download: {e}")
+        return False
+
+
+@timed_db_call
+def refund_download(user_id):
+    """Give back one consumed download (the job it was consumed for never ran)"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE users SET downloads_count = downloads_count - 1 WHERE user_id = ? AND downloads_count > 0',
+            (user_id,)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error refunding download: {e}")
+        return False
+
+
+@timed_db_call
+def add_downloads(counts):
+    """Add batched download counts ({user_id: count}) in one transaction"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.executemany(
+            'UPDATE users SET downloads_count = downloads_count + ? WHERE user_id = ?',
+            [(count, user_id) for user_id, count in counts.items()]
+        )
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error adding downloads: {e}")
+        return False
+
+
+@timed_db_call
 def create_coupon(duration):
     """Create a new coupon"""
     try:
@@ -142,15 +339,49 @@ def create_coupon(duration):
             (coupon_code, duration)
         )
         conn.commit()
-        conn.close()
         logger.info(f"Created coupon: {coupon_code}")
         return coupon_code
         
     except Exception as e:
+        rollback()
         logger.error(f"Error creating coupon: {e}")
         return None
 
 
+SUBSCRIPTION_DURATIONS = {
+    '1month': timedelta(days=30),
+    '3months': timedelta(days=90),
+    'lifetime': timedelta(days=36500)  # ~100 years
+}
+
+
+@timed_db_call
+def extend_subscription(user_id, duration):
+    """Set user subscription for a plan duration ('1month', '3months', 'lifetime')"""
+    try:
+        duration_delta = SUBSCRIPTION_DURATIONS.get(duration)
+        if not duration_delta:
+            return False
+        
+        subscription_end = datetime.now() + duration_delta
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            '''INSERT INTO users (user_id, subscription_end) VALUES (?, ?)
+               ON CONFLICT(user_id) DO UPDATE SET subscription_end = excluded.subscription_end''',
+            (user_id, subscription_end.isoformat())
+        )
+        conn.commit()
+        logger.info(f"Subscription {duration} set for user {user_id}")
+        return True
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error extending subscription: {e}")
+        return False
+
+
+@timed_db_call
 def activate_coupon(user_id, coupon_code):
     """Activate a coupon for user"""
     try:
@@ -162,20 +393,12 @@ def activate_coupon(user_id, coupon_code):
         coupon = cursor.fetchone()
         
         if not coupon:
-            conn.close()
             return False
         
-        duration = coupon[2]  # duration column
+        duration = coupon['duration']
         
-        duration_map = {
-            '1month': timedelta(days=30),
-            '3months': timedelta(days=90),
-            'lifetime': timedelta(days=36500)  # ~100 years
-        }
-        
-        duration_delta = duration_map.get(duration)
+        duration_delta = SUBSCRIPTION_DURATIONS.get(duration)
         if not duration_delta:
-            conn.close()
             return False
         
         subscription_end = datetime.now() + duration_delta
@@ -193,15 +416,16 @@ def activate_coupon(user_id, coupon_code):
         )
         
         conn.commit()
-        conn.close()
         logger.info(f"Activated coupon {coupon_code} for user {user_id}")
         return True
         
     except Exception as e:
+        rollback()
         logger.error(f"Error activating coupon: {e}")
         return False
 
 
+@timed_db_call
 def get_usage_stats():
     """Get usage statistics"""
     try:
@@ -232,8 +456,6 @@ def get_usage_stats():
         cursor.execute('SELECT COUNT(*) FROM mandatory_channels')
         total_channels = cursor.fetchone()[0]
         
-        conn.close()
-        
         return {
             'total_users': total_users,
             'active_subscriptions': active_subscriptions,
@@ -244,6 +466,7 @@ def get_usage_stats():
         }
         
     except Exception as e:
+        rollback()
         logger.error(f"Error getting stats: {e}")
         return {
             'total_users': 0,
@@ -256,6 +479,7 @@ def get_usage_stats():
 
 
 # Majburiy kanallar uchun funksiyalar
+@timed_db_call
 def add_mandatory_channel(channel_id, channel_name, channel_username=None):
     """Add mandatory channel"""
     try:
@@ -266,14 +490,15 @@ def add_mandatory_channel(channel_id, channel_name, channel_username=None):
             (channel_id, channel_name, channel_username)
         )
         conn.commit()
-        conn.close()
         logger.info(f"Added mandatory channel: {channel_name}")
         return True
     except Exception as e:
+        rollback()
         logger.error(f"Error adding mandatory channel: {e}")
         return False
 
 
+@timed_db_call
 def remove_mandatory_channel(channel_id):
     """Remove mandatory channel"""
     try:
@@ -281,14 +506,15 @@ def remove_mandatory_channel(channel_id):
         cursor = conn.cursor()
         cursor.execute('DELETE FROM mandatory_channels WHERE channel_id = ?', (channel_id,))
         conn.commit()
-        conn.close()
         logger.info(f"Removed mandatory channel: {channel_id}")
         return True
     except Exception as e:
+        rollback()
         logger.error(f"Error removing mandatory channel: {e}")
         return False
 
 
+@timed_db_call
 def get_mandatory_channels():
     """Get all mandatory channels"""
     try:
@@ -296,24 +522,16 @@ def get_mandatory_channels():
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM mandatory_channels')
         channels = cursor.fetchall()
-        conn.close()
         
-        return [
-            {
-                'id': channel[0],
-                'channel_id': channel[1],
-                'channel_name': channel[2],
-                'channel_username': channel[3],
-                'created_at': channel[4]
-            }
-            for channel in channels
-        ]
+        return [dict(channel) for channel in channels]
     except Exception as e:
+        rollback()
         logger.error(f"Error getting mandatory channels: {e}")
         return []
 
 
 # Admin funksiyalar
+@timed_db_call
 def add_admin(user_id, username=None):
     """Add admin"""
     try:
@@ -324,14 +542,15 @@ def add_admin(user_id, username=None):
             (user_id, username)
         )
         conn.commit()
-        conn.close()
         logger.info(f"Added admin: {user_id}")
         return True
     except Exception as e:
+        rollback()
         logger.error(f"Error adding admin: {e}")
         return False
 
 
+@timed_db_call
 def remove_admin(user_id):
     """Remove admin"""
     try:
@@ -339,14 +558,15 @@ def remove_admin(user_id):
         cursor = conn.cursor()
         cursor.execute('DELETE FROM admins WHERE user_id = ?', (user_id,))
         conn.commit()
-        conn.close()
         logger.info(f"Removed admin: {user_id}")
         return True
     except Exception as e:
+        rollback()
         logger.error(f"Error removing admin: {e}")
         return False
 
 
+@timed_db_call
 def get_all_admins():
     """Get all admins"""
     try:
@@ -354,17 +574,576 @@ def get_all_admins():
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM admins')
         admins = cursor.fetchall()
-        conn.close()
         
-        return [
-            {
-                'id': admin[0],
-                'user_id': admin[1],
-                'username': admin[2],
-                'created_at': admin[3]
-            }
-            for admin in admins
-        ]
+        return [dict(admin) for admin in admins]
     except Exception as e:
+        rollback()
         logger.error(f"Error getting admins: {e}")
         return []
+
+
+# Telegram file_id kesh funksiyalari
+@timed_db_call
+def get_cached_media(source_key, ttl):
+    """Get cached Telegram file_id entries for a source URL"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        now = datetime.now()
+        cursor.execute(
+            'SELECT entries FROM media_cache WHERE source_key = ? AND created_at > ?',
+            (source_key, (now - ttl).isoformat())
+        )
+        row = cursor.fetchone()
+        
+        if row:
+            cursor.execute(
+                'UPDATE media_cache SET hits = hits + 1, last_used_at = ? WHERE source_key = ?',
+                (now.isoformat(), source_key)
+            )
+            conn.commit()
+        
+        return json.loads(row['entries']) if row else None
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error getting cached media: {e}")
+        return None
+
+
+@timed_db_call
+def save_cached_media(source_key, entries):
+    """Save Telegram file_id entries for a source URL"""
+    try:
+        now = datetime.now().isoformat()
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            '''INSERT INTO media_cache (source_key, entries, created_at, last_used_at)
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT(source_key) DO UPDATE SET
+                   entries = excluded.entries,
+                   created_at = excluded.created_at,
+                   last_used_at = excluded.last_used_at''',
+            (source_key, json.dumps(entries), now, now)
+        )
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error saving cached media: {e}")
+        return False
+
+
+@timed_db_call
+def delete_cached_media(source_key):
+    """Delete cached entries for a source URL"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM media_cache WHERE source_key = ?', (source_key,))
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error deleting cached media: {e}")
+        return False
+
+
+@timed_db_call
+def evict_cached_media(ttl, max_entries):
+    """Remove expired entries and keep only the most recently used ones"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'DELETE FROM media_cache WHERE created_at <= ?',
+            ((datetime.now() - ttl).isoformat(),)
+        )
+        expired = cursor.rowcount
+        cursor.execute(
+            '''DELETE FROM media_cache WHERE source_key IN (
+                   SELECT source_key FROM media_cache
+                   ORDER BY last_used_at DESC
+                   LIMIT -1 OFFSET ?
+               )''',
+            (max_entries,)
+        )
+        evicted = cursor.rowcount
+        conn.commit()
+        
+        if expired or evicted:
+            logger.info(f"Media cache eviction: {expired} expired, {evicted} least recently used")
+        return expired + evicted
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error evicting cached media: {e}")
+        return 0
+
+
+# Diskdagi media keshi indeksi
+@timed_db_call
+def get_disk_cache_entry(source_key):
+    """Get (content_hash, size) for a source URL and mark the file as recently used"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            '''SELECT f.content_hash, f.size FROM disk_cache_sources s
+               JOIN disk_cache_files f ON f.content_hash = s.content_hash
+               WHERE s.source_key = ?''',
+            (source_key,)
+        )
+        row = cursor.fetchone()
+        
+        if row:
+            cursor.execute(
+                'UPDATE disk_cache_files SET last_access = ? WHERE content_hash = ?',
+                (time.time(), row['content_hash'])
+            )
+            conn.commit()
+            return row['content_hash'], row['size']
+        return None
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error getting disk cache entry: {e}")
+        return None
+
+
+@timed_db_call
+def save_disk_cache_entry(source_key, content_hash, size):
+    """Record a stored file and point a source URL at it"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            '''INSERT INTO disk_cache_files (content_hash, size, last_access) VALUES (?, ?, ?)
+               ON CONFLICT(content_hash) DO UPDATE SET last_access = excluded.last_access''',
+            (content_hash, size, time.time())
+        )
+        cursor.execute(
+            'INSERT OR REPLACE INTO disk_cache_sources (source_key, content_hash) VALUES (?, ?)',
+            (source_key, content_hash)
+        )
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error saving disk cache entry: {e}")
+        return False
+
+
+@timed_db_call
+def delete_disk_cache_file(content_hash):
+    """Forget a stored file and every source URL that points at it"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM disk_cache_sources WHERE content_hash = ?', (content_hash,))
+        cursor.execute('DELETE FROM disk_cache_files WHERE content_hash = ?', (content_hash,))
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error deleting disk cache file: {e}")
+        return False
+
+
+@timed_db_call
+def evict_disk_cache(max_bytes):
+    """Drop least recently used files until the total size fits max_bytes
+
+    Returns (evicted content hashes, total bytes remaining).
+    """
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COALESCE(SUM(size), 0) FROM disk_cache_files')
+        total = cursor.fetchone()[0]
+        if total <= max_bytes:
+            return [], total
+
+        evicted = []
+        cursor.execute('SELECT content_hash, size FROM disk_cache_files ORDER BY last_access')
+        for row in cursor.fetchall():
+            if total <= max_bytes:
+                break
+            evicted.append(row['content_hash'])
+            total -= row['size']
+
+        cursor.executemany('DELETE FROM disk_cache_sources WHERE content_hash = ?', [(h,) for h in evicted])
+        cursor.executemany('DELETE FROM disk_cache_files WHERE content_hash = ?', [(h,) for h in evicted])
+        conn.commit()
+        return evicted, total
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error evicting disk cache: {e}")
+        return [], None
+
+
+@timed_db_call
+def list_disk_cache_files():
+    """All indexed content hashes"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT content_hash FROM disk_cache_files')
+        return {row['content_hash'] for row in cursor.fetchall()}
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error listing disk cache files: {e}")
+        return None
+
+
+# Resolver (RapidAPI) javoblari keshi
+@timed_db_call
+def get_resolver_cache(source_key):
+    """Get a cached resolver payload that has not expired yet"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT payload, expires_at FROM resolver_cache WHERE source_key = ? AND expires_at > ?',
+            (source_key, datetime.now().isoformat())
+        )
+        row = cursor.fetchone()
+        
+        if row:
+            return json.loads(row['payload']), datetime.fromisoformat(row['expires_at'])
+        return None
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error getting resolver cache: {e}")
+        return None
+
+
+@timed_db_call
+def save_resolver_cache(source_key, payload, expires_at):
+    """Save a resolver payload until expires_at"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT OR REPLACE INTO resolver_cache (source_key, payload, expires_at) VALUES (?, ?, ?)',
+            (source_key, json.dumps(payload), expires_at.isoformat())
+        )
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error saving resolver cache: {e}")
+        return False
+
+
+@timed_db_call
+def purge_resolver_cache():
+    """Delete expired resolver payloads"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM resolver_cache WHERE expires_at <= ?', (datetime.now().isoformat(),))
+        deleted = cursor.rowcount
+        conn.commit()
+        return deleted
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error purging resolver cache: {e}")
+        return 0
+
+
+# Qisqa havolalar (pin.it, vt.tiktok.com, ...) yo'naltirish keshi
+@timed_db_call
+def get_redirect(short_url):
+    """Get a cached expansion that has not expired yet, returns (final_url, expires_at)"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT final_url, expires_at FROM redirect_cache WHERE short_url = ? AND expires_at > ?',
+            (short_url, datetime.now().isoformat())
+        )
+        row = cursor.fetchone()
+        
+        if row:
+            return row['final_url'], datetime.fromisoformat(row['expires_at'])
+        return None
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error getting redirect: {e}")
+        return None
+
+
+@timed_db_call
+def save_redirect(short_url, final_url, expires_at):
+    """Save a short link expansion until expires_at"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT OR REPLACE INTO redirect_cache (short_url, final_url, expires_at) VALUES (?, ?, ?)',
+            (short_url, final_url, expires_at.isoformat())
+        )
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error saving redirect: {e}")
+        return False
+
+
+@timed_db_call
+def purge_redirect_cache():
+    """Delete expired short link expansions"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM redirect_cache WHERE expires_at <= ?', (datetime.now().isoformat(),))
+        deleted = cursor.rowcount
+        conn.commit()
+        return deleted
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error purging redirect cache: {e}")
+        return 0
+
+
+# Jarayonlar o'rtasida umumiy yuklab olish navbati
+@timed_db_call
+def enqueue_job(user_id, payload, max_queued, per_user_limit):
+    """Queue a job unless the queue or the user's job limit is full
+
+    The limits are checked in the same statement as the insert, so
+    concurrent processes can't overfill the queue. Returns the job id or None.
+    """
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            '''INSERT INTO download_jobs (user_id, payload, created_at)
+               SELECT ?, ?, ?
+               WHERE (SELECT COUNT(*) FROM download_jobs WHERE claimed_at IS NULL) < ?
+                 AND (SELECT COUNT(*) FROM download_jobs WHERE user_id = ?) < ?''',
+            (user_id, json.dumps(payload), time.time(), max_queued, user_id, per_user_limit)
+        )
+        job_id = cursor.lastrowid if cursor.rowcount else None
+        conn.commit()
+        return job_id
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error enqueuing job: {e}")
+        return None
+
+
+@timed_db_call
+def claim_job(worker_name):
+    """Atomically claim the oldest unclaimed job, returns (id, user_id, payload) or None"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        # Bo'sh navbatda yozish tranzaksiyasi (va qulf) ochilmaydi
+        cursor.execute('SELECT 1 FROM download_jobs WHERE claimed_at IS NULL LIMIT 1')
+        if cursor.fetchone() is None:
+            return None
+        
+        cursor.execute(
+            '''UPDATE download_jobs SET claimed_by = ?, claimed_at = ?
+               WHERE id = (
+                   SELECT id FROM download_jobs WHERE claimed_at IS NULL ORDER BY id LIMIT 1
+               )
+               RETURNING id, user_id, payload''',
+            (worker_name, time.time())
+        )
+        row = cursor.fetchone()
+        conn.commit()
+        
+        if row:
+            return row['id'], row['user_id'], json.loads(row['payload'])
+        return None
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error claiming job: {e}")
+        return None
+
+
+@timed_db_call
+def finish_job(job_id):
+    """Remove a finished job from the queue"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM download_jobs WHERE id = ?', (job_id,))
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error finishing job: {e}")
+        return False
+
+
+@timed_db_call
+def count_user_jobs(user_id):
+    """Return the number of queued and running jobs of one user"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM download_jobs WHERE user_id = ?', (user_id,))
+        return cursor.fetchone()[0]
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error counting user jobs: {e}")
+        return 0
+
+
+@timed_db_call
+def count_jobs():
+    """Return (queued, claimed) job counts"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            '''SELECT COALESCE(SUM(claimed_at IS NULL), 0) AS queued,
+                      COALESCE(SUM(claimed_at IS NOT NULL), 0) AS claimed
+               FROM download_jobs'''
+        )
+        row = cursor.fetchone()
+        return row['queued'], row['claimed']
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error counting jobs: {e}")
+        return 0, 0
+
+
+@timed_db_call
+def renew_job_leases(worker_name):
+    """Refresh claimed_at of the jobs a live worker is still processing"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE download_jobs SET claimed_at = ? WHERE claimed_by = ?',
+            (time.time(), worker_name)
+        )
+        renewed = cursor.rowcount
+        conn.commit()
+        return renewed
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error renewing job leases: {e}")
+        return 0
+
+
+@timed_db_call
+def requeue_stale_jobs(max_age, worker_name=None):
+    """Release jobs whose lease was not renewed for max_age seconds (their worker died)
+
+    Jobs claimed under worker_name are released too: a new process with the
+    same name means the previous one is gone.
+    """
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cutoff = time.time() - max_age
+        # Hammasi tirik bo'lsa yozish tranzaksiyasi (va qulf) ochilmaydi
+        cursor.execute(
+            'SELECT 1 FROM download_jobs WHERE claimed_at < ? OR claimed_by = ? LIMIT 1',
+            (cutoff, worker_name)
+        )
+        if cursor.fetchone() is None:
+            return 0
+        
+        cursor.execute(
+            '''UPDATE download_jobs SET claimed_by = NULL, claimed_at = NULL
+               WHERE claimed_at < ? OR claimed_by = ?''',
+            (cutoff, worker_name)
+        )
+        requeued = cursor.rowcount
+        conn.commit()
+        
+        if requeued:
+            logger.info(f"Requeued {requeued} stale download jobs")
+        return requeued
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error requeuing stale jobs: {e}")
+        return 0
+
+
+# Jarayonlar o'rtasida umumiy FSM holati
+@timed_db_call
+def get_fsm_record(storage_key):
+    """Get (state, data) for an FSM storage key"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT state, data FROM fsm_state WHERE storage_key = ?', (storage_key,))
+        row = cursor.fetchone()
+        
+        if row:
+            return row['state'], json.loads(row['data'])
+        return None, {}
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error getting FSM state: {e}")
+        return None, {}
+
+
+@timed_db_call
+def set_fsm_state(storage_key, state):
+    """Set the FSM state, keeping stored data"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            '''INSERT INTO fsm_state (storage_key, state) VALUES (?, ?)
+               ON CONFLICT(storage_key) DO UPDATE SET state = excluded.state''',
+            (storage_key, state)
+        )
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error setting FSM state: {e}")
+        return False
+
+
+@timed_db_call
+def set_fsm_data(storage_key, data):
+    """Replace the FSM data, keeping the stored state"""
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            '''INSERT INTO fsm_state (storage_key, data) VALUES (?, ?)
+               ON CONFLICT(storage_key) DO UPDATE SET data = excluded.data''',
+            (storage_key, json.dumps(data))
+        )
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        rollback()
+        logger.error(f"Error setting FSM data: {e}")
+        return False
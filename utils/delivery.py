@@ -0,0 +1,70 @@
+import logging
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import SendDocument, SendMediaGroup, SendPhoto, SendVideo
+
+from utils.metrics import UPLOAD_SECONDS, current_platform
+
+logger = logging.getLogger(__name__)
+
+# Yuborish vaqti o'lchanadigan media metodlari
+MEDIA_METHODS = (SendVideo, SendDocument, SendPhoto, SendMediaGroup)
+
+# Katta fayllarni yuborish uchun vaqt: kamida 60 sekund + shu tezlikda yuborish vaqti
+UPLOAD_MIN_SPEED = 1024 * 1024  # bayt/sekund
+
+
+def upload_timeout(media):
+    """Fayl hajmiga qarab Bot API so'rovi uchun timeout (sekund)"""
+    return 60 + len(media) // UPLOAD_MIN_SPEED
+
+
+async def send_video(bot, chat_id, media, filename, caption):
+    """Videoni fayl hajmiga mos timeout bilan yuklab yuborish"""
+    return await bot.send_video(
+        chat_id=chat_id,
+        video=media.input_file(filename),
+        caption=caption,
+        request_timeout=upload_timeout(media)
+    )
+
+
+async def send_video_and_document(bot, chat_id, media, video_filename, video_caption,
+                                  document_filename, document_caption):
+    """Bitta yuklab olingan fayldan video va hujjat nusxasini yuborish
+
+    Bot API file_id orqali qayta yuborishda fayl turini o'zgartirishga yo'l
+    qo'ymaydi (video file_id hujjat sifatida qabul qilinmaydi), shuning
+    uchun hujjat o'sha buferdan (nusxa ko'chirmasdan) yana yuklanadi. Lokal
+    Bot API serverida ikkalasi ham diskdagi fayl yo'li orqali beriladi va
+    baytlar bot orqali umuman o'tmaydi (bot_bytes_uploaded_total).
+    """
+    video_msg = await send_video(bot, chat_id, media, video_filename, video_caption)
+    doc_msg = await bot.send_document(
+        chat_id=chat_id,
+        document=media.input_file(document_filename),
+        caption=document_caption,
+        disable_content_type_detection=True,
+        request_timeout=upload_timeout(media)
+    )
+    return video_msg, doc_msg
+
+
+class UploadTimingMiddleware(BaseRequestMiddleware):
+    """Media yuboruvchi Bot API so'rovlarining davomiyligini o'lchash"""
+
+    async def __call__(self, make_request, bot, method):
+        if not isinstance(method, MEDIA_METHODS):
+            return await make_request(bot, method)
+
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            UPLOAD_SECONDS.observe(
+                time.perf_counter() - started,
+                platform=current_platform.get(),
+                method=type(method).__name__,
+            )
+
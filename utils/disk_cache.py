@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from config import DISK_CACHE_DIRECTORY, DISK_CACHE_JANITOR_INTERVAL, DISK_CACHE_MAX_MB
+from utils.database import (
+    delete_disk_cache_file,
+    evict_disk_cache,
+    get_disk_cache_entry,
+    list_disk_cache_files,
+    save_disk_cache_entry,
+)
+from utils.downloader import MediaBuffer, max_download_size
+from utils.metrics import register_collector
+from utils.router import cache_key
+
+logger = logging.getLogger(__name__)
+
+DISK_CACHE_MAX_BYTES = DISK_CACHE_MAX_MB * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+# Shundan yosh indekslanmagan fayllarga tegilmaydi (yozilib, hali indeksga kirmagan bo'lishi mumkin)
+ORPHAN_GRACE = 3600
+
+_janitor_task = None
+
+disk_cache_stats = {
+    'hits': 0,
+    'misses': 0,
+    'stores': 0,
+    'evicted': 0,
+    'bytes': 0,
+}
+
+
+def is_enabled():
+    return DISK_CACHE_MAX_BYTES > 0
+
+
+def _file_path(content_hash):
+    # Bitta katalogda juda ko'p fayl bo'lmasligi uchun xeshning boshi bo'yicha bo'linadi
+    return os.path.join(DISK_CACHE_DIRECTORY, content_hash[:2], content_hash)
+
+
+def _remove(content_hash):
+    try:
+        os.remove(_file_path(content_hash))
+    except FileNotFoundError:
+        pass
+
+
+def _hash_media(media):
+    """Media mazmunining sha256 xeshi (diskdagi fayl alohida deskriptor orqali o'qiladi)"""
+    digest = hashlib.sha256()
+    if media.path:
+        with open(media.path, 'rb') as f:
+            remaining = media.size
+            while remaining > 0:
+                chunk = f.read(min(HASH_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError("Media file is shorter than expected")
+                digest.update(chunk)
+                remaining -= len(chunk)
+    else:
+        for chunk in media.iter_chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _store_file(media, content_hash):
+    """Mediani xesh nomi bilan keshga qo'yish
+
+    Diskdagi fayl uchun qattiq havola (hard link) yaratiladi - nusxa
+    ko'chirilmaydi va media yopilganda ham kesh fayli qoladi.
+    """
+    path = _file_path(content_hash)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        if media.path:
+            try:
+                os.link(media.path, tmp_path)
+            except OSError:
+                shutil.copyfile(media.path, tmp_path)
+        else:
+            with open(tmp_path, 'wb') as f:
+                for chunk in media.iter_chunks(HASH_CHUNK_SIZE):
+                    f.write(chunk)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _store(source_key, media):
+    content_hash = _hash_media(media)
+    _store_file(media, content_hash)
+    if not save_disk_cache_entry(source_key, content_hash, media.size):
+        return False
+    disk_cache_stats['stores'] += 1
+    enforce_budget()
+    return True
+
+
+async def store_media(source_url, media):
+    """Yuborilgan mediani manba URL bo'yicha diskdagi keshga yozish
+
+    Xeshlash va yozish alohida oqimda bajariladi; xatolik yuborishga
+    ta'sir qilmaydi, faqat logga yoziladi.
+    """
+    if not is_enabled() or media.size > DISK_CACHE_MAX_BYTES:
+        return False
+    try:
+        return await asyncio.to_thread(_store, cache_key(source_url), media)
+    except Exception as e:
+        logger.error(f"Error storing media in disk cache: {e}")
+        return False
+
+
+def _open(source_key, max_size):
+    entry = get_disk_cache_entry(source_key)
+    if entry is None:
+        disk_cache_stats['misses'] += 1
+        return None
+
+    content_hash, size = entry
+    if size > max_size:
+        disk_cache_stats['misses'] += 1
+        return None
+
+    try:
+        media = MediaBuffer.open_file(_file_path(content_hash), size)
+    except FileNotFoundError:
+        # Fayl tashqaridan o'chirilgan - indeksdan ham olib tashlanadi
+        logger.warning(f"Disk cache file missing for {source_key}")
+        delete_disk_cache_file(content_hash)
+        disk_cache_stats['misses'] += 1
+        return None
+
+    disk_cache_stats['hits'] += 1
+    logger.info(f"Serving {source_key} from disk cache")
+    return media
+
+
+async def open_media(source_url):
+    """Keshdagi faylni MediaBuffer sifatida ochish; topilmasa yoki joriy chegaradan katta bo'lsa None
+
+    Indeks so'rovi (topilganda last_access yangilanadi) alohida oqimda
+    bajariladi. Ochilgan fayl keshda qoladi (yopilganda o'chirilmaydi).
+    Evict qilingan bo'lsa ham ochiq deskriptor o'qishda davom etadi.
+    """
+    if not is_enabled():
+        return None
+    return await asyncio.to_thread(_open, cache_key(source_url), max_download_size.get())
+
+
+def enforce_budget(max_bytes=DISK_CACHE_MAX_BYTES):
+    """Eng uzoq ishlatilmagan fayllarni umumiy hajm max_bytes'ga tushguncha o'chirish"""
+    evicted, total = evict_disk_cache(max_bytes)
+    for content_hash in evicted:
+        _remove(content_hash)
+    if total is not None:
+        disk_cache_stats['bytes'] = total
+    if evicted:
+        disk_cache_stats['evicted'] += len(evicted)
+        logger.info(f"Evicted {len(evicted)} files from disk cache")
+    return len(evicted)
+
+
+def purge_orphans():
+    """Indeksda yo'q fayllarni va fayli yo'q yozuvlarni tozalash (to'xtab qolgan yozishlardan qoladi)"""
+    indexed = list_disk_cache_files()
+    if indexed is None or not os.path.isdir(DISK_CACHE_DIRECTORY):
+        return 0
+
+    removed = 0
+    on_disk = set()
+    cutoff = time.time() - ORPHAN_GRACE
+    for shard in os.listdir(DISK_CACHE_DIRECTORY):
+        shard_path = os.path.join(DISK_CACHE_DIRECTORY, shard)
+        if not os.path.isdir(shard_path):
+            continue
+        for name in os.listdir(shard_path):
+            if name in indexed:
+                on_disk.add(name)
+                continue
+            path = os.path.join(shard_path, name)
+            try:
+                # ctime qattiq havola yaratilganda ham yangilanadi
+                if os.stat(path).st_ctime > cutoff:
+                    continue
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+    for content_hash in indexed - on_disk:
+        delete_disk_cache_file(content_hash)
+        removed += 1
+
+    if removed:
+        logger.info(f"Removed {removed} orphaned disk cache entries")
+    return removed
+
+
+def _janitor_pass():
+    enforce_budget()
+    purge_orphans()
+
+
+async def _janitor_loop(interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(_janitor_pass)
+        except Exception as e:
+            logger.error(f"Error cleaning disk cache: {e}")
+
+
+def start_janitor(interval=DISK_CACHE_JANITOR_INTERVAL):
+    global _janitor_task
+    if is_enabled() and _janitor_task is None:
+        _janitor_task = asyncio.create_task(_janitor_loop(interval))
+
+
+async def stop_janitor():
+    global _janitor_task
+    if _janitor_task is not None:
+        _janitor_task.cancel()
+        await asyncio.gather(_janitor_task, return_exceptions=True)
+        _janitor_task = None
+
+
+@register_collector
+def _collect_metrics():
+    return [
+        ('bot_disk_cache_lookups_total', 'counter', 'Disk media cache lookups by result', {
+            (('result', 'hit'),): disk_cache_stats['hits'],
+            (('result', 'miss'),): disk_cache_stats['misses'],
+        }),
+        ('bot_disk_cache_stores_total', 'counter', 'Media files written to the disk cache',
+         disk_cache_stats['stores']),
+        ('bot_disk_cache_evictions_total', 'counter', 'Files evicted from the disk cache',
+         disk_cache_stats['evicted']),
+        ('bot_disk_cache_bytes', 'gauge', 'Bytes held in the disk cache at the last store or eviction',
+         disk_cache_stats['bytes']),
+    ]
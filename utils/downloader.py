@@ -0,0 +1,606 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import weakref
+from contextvars import ContextVar
+
+import aiofiles
+import aiohttp
+from aiogram.types import InputFile
+
+from config import (
+    DOWNLOAD_CONNECTIONS,
+    DOWNLOAD_RETRIES,
+    RANGED_DOWNLOAD_MIN_MB,
+    TELEGRAM_API_LOCAL,
+    TELEGRAM_UPLOAD_LIMIT,
+    TEMP_DIRECTORY,
+)
+from utils.http_client import download_timeout, get_http_session
+from utils.metrics import DOWNLOAD_SECONDS, current_platform, register_collector
+from utils.partial_files import FILE_LOCKS_SUPPORTED, PARTIAL_FILES_SUPPORTED, PartialDownload, try_lock
+from utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Shundan katta fayllar xotirada emas, TEMP_DIRECTORY'dagi faylda saqlanadi
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+DEFAULT_MAX_SIZE = 50 * 1024 * 1024
+# Albom (karusel) rasmlarini bir vaqtda yuklab olish chegarasi
+CAROUSEL_CONCURRENCY = 5
+# Diskdagi vaqtinchalik media fayllari nomi
+MEDIA_FILE_PREFIX = 'media-'
+# Band qilinmagan media fayli shundan yosh bo'lsa o'chirilmaydi (from_partial nomini
+# o'zgartirib, hali band qilmagan bo'lishi mumkin)
+MEDIA_FILE_GRACE = 60
+# flock bo'lmagan tizimlarda faqat shundan eski media fayllari o'chiriladi
+MEDIA_FILE_MAX_AGE = 24 * 3600
+# Bo'laklab yuklab olish: fayl shundan katta bo'lsa, har bir bo'lak kamida MIN_SEGMENT_SIZE
+RANGED_MIN_SIZE = RANGED_DOWNLOAD_MIN_MB * 1024 * 1024
+MIN_SEGMENT_SIZE = 2 * 1024 * 1024
+# Bo'laklarni qisman faylning o'z joyiga yozish mumkinmi (POSIX: flock va pwrite)
+PARALLEL_WRITES = PARTIAL_FILES_SUPPORTED
+# Qisman faylga shuncha yig'ilganda bitta pwrite bilan (alohida oqimda) yoziladi
+WRITE_BATCH_SIZE = 1024 * 1024
+# Qayta urinishlar orasidagi kutish (urinish raqamiga ko'paytiriladi), sekund
+RETRY_BACKOFF = 1.0
+
+# Joriy ish uchun fayl hajmi chegarasi (foydalanuvchi tarifi bo'yicha o'rnatiladi)
+max_download_size = ContextVar('max_download_size', default=min(DEFAULT_MAX_SIZE, TELEGRAM_UPLOAD_LIMIT))
+
+# Bir xil media URL'ni parallel yuklab olishni birlashtirish
+# Umumiy natija har bir kutgan chaqiruvchi uchun alohida egallanadi
+_flights = SingleFlight('download', acquire=lambda media: media.retain(), release=lambda media: media.close())
+
+# Jami yuklab olingan va Telegramga yuborilgan baytlar
+transfer_stats = {
+    'bytes_downloaded': 0,
+    'bytes_uploaded': 0,
+    'spooled_to_disk': 0,
+    'ranged': 0,
+    'range_fallbacks': 0,
+    'retries': 0,
+    'resumed': 0,
+    'bytes_resumed': 0,
+}
+
+
+class RangeNotSatisfied(Exception):
+    """Server so'ralgan bo'lakni qaytarmadi (Range qo'llab-quvvatlanmaydi yoki fayl o'zgargan)"""
+
+
+def _lock_media_file(file):
+    """Media faylini ochiq turgan vaqtda band qilish - boshqa jarayonlarning purge_temp_files'i unga tegmaydi"""
+    if FILE_LOCKS_SUPPORTED:
+        try_lock(file.fileno())
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class MediaBuffer:
+    """Yuklab olingan media: xotiradagi buffer yoki TEMP_DIRECTORY'dagi fayl
+
+    Content-Length ma'lum va kichik bo'lsa bayt massivi bir marta ajratiladi
+    va bo'laklar o'z joyiga yoziladi. Katta fayllar PartialDownload orqali
+    yuklanib, tugagach from_partial() bilan olinadi; hajmi noma'lumlari esa
+    SPOOL_MAX_MEMORY'dan oshganda diskka o'tadi. Fayl buffer yopilganda (yoki
+    yo'q qilinganda) o'chiriladi.
+
+    download_media() bir buffer'ni bir nechta chaqiruvchiga beradi: har biri
+    uchun retain() qilinadi va buffer oxirgi close()'dan keyingina
+    bo'shatiladi. Shuning uchun har bir olgan tomon uni yopishi (yoki
+    `with` bilan ishlatishi) kerak.
+    """
+
+    def __init__(self, size_hint=None):
+        self.size = 0
+        self.expected = size_hint
+        self._refs = 0
+        self._file = None
+        self._view = None
+        self._finalizer = None
+        if size_hint and size_hint > SPOOL_MAX_MEMORY:
+            self._buffer = None
+            self._open_file()
+        elif size_hint:
+            self._buffer = bytearray(size_hint)
+            self._view = memoryview(self._buffer)
+        else:
+            self._buffer = bytearray()
+
+    @classmethod
+    def from_partial(cls, partial):
+        """Tugagan qisman faylni egallash (ko'chirilmaydi, faqat nomi o'zgaradi)"""
+        fd, path = tempfile.mkstemp(prefix=MEDIA_FILE_PREFIX, dir=TEMP_DIRECTORY)
+        os.close(fd)
+        partial.detach(path)
+
+        media = cls()
+        media._buffer = None
+        media._file = open(path, 'rb')
+        _lock_media_file(media._file)
+        media._finalizer = weakref.finalize(media, _remove_file, path)
+        media.size = media.expected = partial.size
+        return media
+
+    @classmethod
+    def open_file(cls, path, size):
+        """Mavjud faylni o'qish uchun ochish (yopilganda o'chirilmaydi)"""
+        media = cls()
+        media._buffer = None
+        media._file = open(path, 'rb')
+        media.size = media.expected = size
+        return media
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def retain(self):
+        """Yana bir egasini qo'shish (har biri close() chaqiradi)"""
+        self._refs += 1
+        return self
+
+    @property
+    def path(self):
+        """Diskdagi fayl yo'li (xotirada bo'lsa None)"""
+        return self._file.name if self._file is not None else None
+
+    def _open_file(self):
+        self._file = tempfile.NamedTemporaryFile(prefix=MEDIA_FILE_PREFIX, dir=TEMP_DIRECTORY)
+        _lock_media_file(self._file)
+        if TELEGRAM_API_LOCAL:
+            # Bot API serveri boshqa foydalanuvchi nomidan o'qiydi
+            os.chmod(self._file.name, 0o644)
+        transfer_stats['spooled_to_disk'] += 1
+
+    def write(self, chunk):
+        end = self.size + len(chunk)
+        if self.expected is not None and end > self.expected:
+            raise ValueError("Received more data than Content-Length")
+        if self._file is not None:
+            self._file.write(chunk)
+        elif self._view is not None:
+            self._view[self.size:end] = chunk
+        else:
+            self._buffer += chunk
+            if end > SPOOL_MAX_MEMORY:
+                self._open_file()
+                self._file.write(self._buffer)
+                self._buffer = None
+        self.size = end
+
+    def is_complete(self):
+        """Content-Length ma'lum bo'lsa, hammasi qabul qilinganini tekshirish"""
+        return self.expected is None or self.size == self.expected
+
+    def finish(self):
+        """Yozishni yakunlash (diskdagi fayl boshqa o'quvchilarga ko'rinadi)"""
+        if self._file is not None:
+            self._file.flush()
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        """Ma'lumotni bo'laklab o'qish (butun faylni nusxalamasdan)"""
+        offset = 0
+        while offset < self.size:
+            end = min(offset + chunk_size, self.size)
+            if self._file is not None:
+                self._file.seek(offset)
+                yield self._file.read(end - offset)
+            elif self._view is not None:
+                yield bytes(self._view[offset:end])
+            else:
+                yield bytes(self._buffer[offset:end])
+            offset = end
+
+    def getvalue(self):
+        """Butun ma'lumotni bytes sifatida olish (nusxa ko'chiriladi)"""
+        return b''.join(self.iter_chunks())
+
+    def input_file(self, filename):
+        """aiogram uchun fayl
+
+        Lokal Bot API serveri (--local) diskdagi faylni yo'l orqali o'zi
+        o'qiydi, aks holda fayl bo'laklab yuklanadi.
+        """
+        if TELEGRAM_API_LOCAL and self.path:
+            return f"file://{self.path}"
+        return MediaInputFile(self, filename=filename)
+
+    def close(self):
+        """Egalikdan voz kechish; oxirgi egasi yopganda buffer/fayl bo'shatiladi"""
+        if self._refs > 1:
+            self._refs -= 1
+            return
+        self._refs = 0
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        self._buffer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._finalizer is not None:
+            self._finalizer()
+        self.size = 0
+
+
+class MediaInputFile(InputFile):
+    """MediaBuffer'dan to'g'ridan-to'g'ri yuboriladigan fayl
+
+    Diskdagi fayl event loop'ni bloklamasdan (aiofiles) o'qiladi va
+    xotiraga to'liq yuklanmaydi.
+    """
+
+    def __init__(self, media, filename, chunk_size=CHUNK_SIZE):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.media = media
+
+    async def read(self, bot):
+        if self.media.path:
+            async with aiofiles.open(self.media.path, 'rb') as f:
+                remaining = self.media.size
+                while remaining > 0:
+                    chunk = await f.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    transfer_stats['bytes_uploaded'] += len(chunk)
+                    yield chunk
+            return
+
+        for chunk in self.media.iter_chunks(self.chunk_size):
+            transfer_stats['bytes_uploaded'] += len(chunk)
+            yield chunk
+
+
+async def download_media(url, max_size=None):
+    """Fayl (video yoki rasm) yuklab olish; xatolik bo'lsa None qaytaradi
+
+    max_size berilmasa joriy ish chegarasi (max_download_size) ishlatiladi.
+    Bir vaqtda kelgan bir xil so'rovlar bitta yuklab olishni baham ko'radi,
+    qaytarilgan MediaBuffer faqat o'qiladi va yuborilgach yopilishi kerak
+    (boshqa kutganlar yopmaguncha u bo'shatilmaydi).
+    """
+    if max_size is None:
+        max_size = max_download_size.get()
+    with DOWNLOAD_SECONDS.time(platform=current_platform.get()):
+        return await _flights.run(f"{max_size}:{url}", _download, url, max_size)
+
+
+def _is_transient(error):
+    """Qayta urinib ko'rsa bo'ladigan xatolik (uzilish, timeout, 5xx/429)"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError))
+
+
+async def _download(url, max_size):
+    transfer = _Transfer(get_http_session(), url, max_size)
+    try:
+        return await transfer.run()
+    except Exception as e:
+        logger.error(f"Error downloading file: {e}")
+        return None
+    finally:
+        await asyncio.to_thread(transfer.release)
+
+
+class _Transfer:
+    """Bitta URL'ni yuklab olish
+
+    Hajmi ma'lum katta fayllar TEMP_DIRECTORY'dagi qisman faylga (server
+    Range'ni qo'llasa - parallel bo'laklab) yoziladi. Ulanish uzilsa yoki
+    timeout bo'lsa, yozilgan baytlar saqlanib qoladi va qayta urinish
+    Range + If-Range bilan qolgan joydan davom etadi. Fayl o'zgargan yoki
+    server Range'ni bajarmasa, boshidan bitta oqim bilan yuklanadi.
+    """
+
+    def __init__(self, session, url, max_size):
+        self.session = session
+        self.url = url
+        self.max_size = max_size
+        self.allow_ranges = True
+        self.partial = None
+
+    async def run(self):
+        if PARALLEL_WRITES:
+            # Oldingi (shu yoki boshqa jarayondagi) uzilgan yuklab olish
+            self.partial = await asyncio.to_thread(PartialDownload.load, self.url, self.max_size)
+            if self.partial is not None:
+                self._count_resume()
+
+        attempt = 0
+        while True:
+            try:
+                if self.partial is None:
+                    return await self._start()
+                await self._fill()
+                return await asyncio.to_thread(self._complete)
+            except RangeNotSatisfied as e:
+                logger.warning(f"Range request failed, restarting as a single stream: {e}")
+                await asyncio.to_thread(self._discard)
+                if not self.allow_ranges:
+                    return None
+                self.allow_ranges = False
+                transfer_stats['range_fallbacks'] += 1
+            except Exception as e:
+                if not _is_transient(e) or attempt >= DOWNLOAD_RETRIES:
+                    raise
+                attempt += 1
+                transfer_stats['retries'] += 1
+                if self.partial is not None and not self.partial.resumable:
+                    await asyncio.to_thread(self._discard)
+                if self.partial is not None:
+                    await asyncio.to_thread(self.partial.save)
+                    self._count_resume()
+                    logger.warning(
+                        f"Download interrupted at {self.partial.written}/{self.partial.size} bytes, "
+                        f"resuming (attempt {attempt}): {e!r}"
+                    )
+                else:
+                    logger.warning(f"Download failed, retrying (attempt {attempt}): {e!r}")
+                await asyncio.sleep(RETRY_BACKOFF * attempt)
+
+    async def _start(self):
+        media = None
+        async with self.session.get(self.url, timeout=download_timeout()) as response:
+            response.raise_for_status()
+
+            # Fayl hajmini tekshirish
+            content_length = response.headers.get('content-length')
+            if content_length and int(content_length) > self.max_size:
+                logger.warning(f"File too large: {content_length} bytes")
+                return None
+
+            # Siqilgan javobda Content-Length yechilgan hajmga mos kelmaydi
+            size_hint = None
+            if content_length and not response.headers.get('content-encoding'):
+                size_hint = int(content_length)
+
+            if PARALLEL_WRITES and size_hint and size_hint > SPOOL_MAX_MEMORY:
+                accepts_ranges = (
+                    self.allow_ranges
+                    and response.headers.get('accept-ranges', '').lower() == 'bytes'
+                )
+                # Fayl yuklash davomida o'zgarsa server If-Range'ga butun faylni (200) qaytaradi
+                validator = None
+                if accepts_ranges:
+                    validator = response.headers.get('etag') or response.headers.get('last-modified')
+                if accepts_ranges and size_hint >= RANGED_MIN_SIZE:
+                    ranges = _split_ranges(size_hint)
+                else:
+                    ranges = [(0, size_hint - 1)]
+                # posix_fallocate katta faylda sekin bo'lishi mumkin
+                self.partial = await asyncio.to_thread(
+                    PartialDownload.create, self.url, size_hint, validator, ranges
+                )
+                # Birinchi bo'lak ochiq javobdan o'qiladi
+                await self._fill(response)
+            else:
+                media = MediaBuffer(size_hint)
+                try:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        if media.size + len(chunk) > self.max_size:
+                            logger.warning("File size exceeded during download")
+                            media.close()
+                            return None
+                        media.write(chunk)
+                except BaseException:
+                    media.close()
+                    raise
+
+        if media is None:
+            return await asyncio.to_thread(self._complete)
+
+        if not media.is_complete():
+            logger.warning(f"Incomplete download: {media.size} of {content_length} bytes")
+            media.close()
+            return None
+
+        media.finish()
+        transfer_stats['bytes_downloaded'] += media.size
+        return media
+
+    async def _fill(self, response=None):
+        """Qisman faylning yozilmagan oraliqlarini parallel to'ldirish
+
+        Biror oraliq muvaffaqiyatsiz bo'lsa qolganlari darhol bekor qilinadi,
+        yozilgan baytlar esa qisman faylda qoladi.
+        """
+        tasks = []
+        for index, offset, end in self.partial.remaining():
+            if response is not None and offset == 0:
+                coro = _read_range(response, self.partial, index, end)
+            else:
+                coro = self._fetch_range(index, offset, end)
+            tasks.append(asyncio.ensure_future(coro))
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _fetch_range(self, index, offset, end):
+        headers = {'Range': f"bytes={offset}-{end}"}
+        if self.partial.validator:
+            headers['If-Range'] = self.partial.validator
+        async with self.session.get(self.url, headers=headers, timeout=download_timeout()) as response:
+            if response.status >= 500 or response.status == 429:
+                response.raise_for_status()
+            content_range = response.headers.get('content-range', '')
+            if response.status != 206 or not content_range.startswith(f"bytes {offset}-{end}/"):
+                raise RangeNotSatisfied(f"status {response.status}, Content-Range {content_range!r}")
+            await _read_range(response, self.partial, index, end)
+
+    def _complete(self):
+        partial, self.partial = self.partial, None
+        if len(partial.segments) > 1:
+            transfer_stats['ranged'] += 1
+        media = MediaBuffer.from_partial(partial)
+        transfer_stats['bytes_downloaded'] += media.size
+        return media
+
+    def _count_resume(self):
+        transfer_stats['resumed'] += 1
+        transfer_stats['bytes_resumed'] += self.partial.written
+
+    def _discard(self):
+        if self.partial is not None:
+            self.partial.discard()
+            self.partial = None
+
+    def release(self):
+        """Tugamagan qisman fayl: davom ettirib bo'lsa diskda qoladi, aks holda o'chiriladi"""
+        if self.partial is None:
+            return
+        if self.partial.resumable:
+            self.partial.close()
+            self.partial = None
+        else:
+            self._discard()
+
+
+def _split_ranges(size):
+    """[(start, end)] - oxiri kiritilgan holda, DOWNLOAD_CONNECTIONS tagacha bo'lak"""
+    count = max(1, min(DOWNLOAD_CONNECTIONS, size // MIN_SEGMENT_SIZE))
+    step = -(-size // count)
+    return [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+
+async def _write_partial(partial, index, data):
+    """Qisman faylga alohida oqimda yozish
+
+    Vazifa bekor qilinsa ham yozish tugashi kutiladi - aks holda fayl
+    yopilgandan keyin ham oqim unga yozishi mumkin edi.
+    """
+    write = asyncio.ensure_future(asyncio.to_thread(partial.write, index, bytes(data)))
+    try:
+        await asyncio.shield(write)
+    except asyncio.CancelledError:
+        await asyncio.gather(write, return_exceptions=True)
+        raise
+
+
+async def _read_range(response, partial, index, end):
+    """Javob tanasidan index-bo'lakni end'gacha yozish (ortig'i o'qilmaydi)
+
+    Bo'laklar WRITE_BATCH_SIZE'gacha yig'ilib yoziladi; uzilishda yozilmay
+    qolgani qisman faylda hisobga olinmaydi va qayta yuklanadi.
+    """
+    start, _, written = partial.segments[index]
+    offset = start + written
+    batch = bytearray()
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        chunk = chunk[:end + 1 - offset]
+        batch += chunk
+        offset += len(chunk)
+        if offset > end:
+            await _write_partial(partial, index, batch)
+            return
+        if len(batch) >= WRITE_BATCH_SIZE:
+            await _write_partial(partial, index, batch)
+            batch.clear()
+    if batch:
+        await _write_partial(partial, index, batch)
+    raise aiohttp.ClientPayloadError(f"Response ended at {offset} before range end {end}")
+
+
+@register_collector
+def _collect_metrics():
+    return [
+        ('bot_bytes_downloaded_total', 'counter', 'Bytes downloaded from media CDNs',
+         transfer_stats['bytes_downloaded']),
+        ('bot_bytes_uploaded_total', 'counter', 'Bytes uploaded to Telegram',
+         transfer_stats['bytes_uploaded']),
+        ('bot_downloads_spooled_to_disk_total', 'counter', 'Downloads stored in TEMP_DIRECTORY instead of memory',
+         transfer_stats['spooled_to_disk']),
+        ('bot_ranged_downloads_total', 'counter', 'Downloads split into parallel byte ranges',
+         transfer_stats['ranged']),
+        ('bot_range_fallbacks_total', 'counter', 'Ranged downloads retried as a single stream',
+         transfer_stats['range_fallbacks']),
+        ('bot_download_retries_total', 'counter', 'Download attempts retried after a transient error',
+         transfer_stats['retries']),
+        ('bot_downloads_resumed_total', 'counter', 'Downloads continued from a partial file',
+         transfer_stats['resumed']),
+        ('bot_bytes_resumed_total', 'counter', 'Bytes kept from partial files instead of re-downloading',
+         transfer_stats['bytes_resumed']),
+        ('bot_downloads_in_flight', 'gauge', 'Distinct media downloads in progress', len(_flights)),
+        ('bot_download_requests_total', 'counter', 'download_media calls by single-flight role',
+         {(('role', role),): count for role, count in _flights.stats.items()}),
+    ]
+
+
+async def download_many(urls, max_size=None, concurrency=CAROUSEL_CONCURRENCY):
+    """Bir nechta faylni parallel yuklab olish
+
+    Natijalar urls tartibida qaytadi; yuklab bo'lmaganlari o'rnida None.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(url):
+        async with semaphore:
+            return await download_media(url, max_size=max_size)
+
+    return await asyncio.gather(*(fetch(url) for url in urls))
+
+
+def close_all(media_list):
+    """download_many() natijalarini yopish (None'lar o'tkazib yuboriladi)"""
+    for media in media_list:
+        if media is not None:
+            media.close()
+
+
+def _is_stale_media_file(path):
+    """Hech bir jarayon ishlatmayotgan media faylimi (bir nechta jarayon TEMP_DIRECTORY'ni baham ko'radi)"""
+    # ctime nomi o'zgartirilganda ham yangilanadi
+    age = time.time() - os.stat(path).st_ctime
+    if not FILE_LOCKS_SUPPORTED:
+        return age > MEDIA_FILE_MAX_AGE
+    if age < MEDIA_FILE_GRACE:
+        return False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        # Ochiq media fayllari egasi tomonidan band qilingan
+        return try_lock(fd)
+    finally:
+        os.close(fd)
+
+
+def purge_temp_files():
+    """Oldingi ishga tushirishlardan qolgan vaqtinchalik media fayllarini o'chirish
+
+    Boshqa ishlayotgan jarayonlarning (band qilingan) fayllariga tegilmaydi.
+    """
+    removed = 0
+    for name in os.listdir(TEMP_DIRECTORY):
+        if name.startswith(MEDIA_FILE_PREFIX):
+            path = os.path.join(TEMP_DIRECTORY, name)
+            try:
+                if not _is_stale_media_file(path):
+                    continue
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove temp file {name}: {e}")
+    if removed:
+        logger.info(f"Removed {removed} leftover temp media files")
+    return removed
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+from config import ENTITLEMENT_CACHE_SIZE, ENTITLEMENT_FLUSH_INTERVAL, FREE_LIMIT
+from utils.database import add_downloads, create_user, get_user
+
+logger = logging.getLogger(__name__)
+
+# user_id -> {'subscription_end', 'downloads_count'}, eng oxirgi ishlatilgani oxirida
+_cache = OrderedDict()
+# Hali bazaga yozilmagan yuklab olishlar: user_id -> soni
+_pending = {}
+_flush_task = None
+# Yozilayotgan to'plam na bazada, na _pending'da ko'rinadi - o'qish yozish tugashini kutadi
+_flush_lock = asyncio.Lock()
+
+
+def _has_subscription(entry):
+    subscription_end = entry['subscription_end']
+    return subscription_end is not None and subscription_end > datetime.now()
+
+
+def _fetch_user(user_id):
+    return get_user(user_id) or create_user(user_id)
+
+
+async def _load(user_id):
+    """Foydalanuvchini bazadan (alohida oqimda) o'qish yoki yaratish va keshga qo'yish"""
+    async with _flush_lock:
+        user = await asyncio.to_thread(_fetch_user, user_id)
+    if not user:
+        return None
+
+    # Kutish paytida boshqa so'rov yuklagan bo'lsa, o'sha yozuv ishlatiladi
+    entry = _cache.get(user_id)
+    if entry is not None:
+        return entry
+
+    entry = {
+        'subscription_end': user['subscription_end'],
+        # Yozilmagan hisoblagichlarni ham hisobga olish
+        'downloads_count': user['downloads_count'] + _pending.get(user_id, 0),
+    }
+    _cache[user_id] = entry
+    while len(_cache) > ENTITLEMENT_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return entry
+
+
+async def consume(user_id):
+    """Yuklab olish huquqini tekshirib, bittasini sarflash
+
+    Qaror xotiradagi kesh bo'yicha qabul qilinadi (faqat birinchi marta
+    bazadan o'qiladi), hisoblagich esa keyinroq flush() bilan yoziladi.
+    """
+    entry = _cache.get(user_id)
+    if entry is None:
+        entry = await _load(user_id)
+        if entry is None:
+            return False
+    else:
+        _cache.move_to_end(user_id)
+
+    if not _has_subscription(entry) and entry['downloads_count'] >= FREE_LIMIT:
+        return False
+
+    entry['downloads_count'] += 1
+    _pending[user_id] = _pending.get(user_id, 0) + 1
+    return True
+
+
+async def has_subscription(user_id):
+    """Obuna faolmi (keshdan; faqat keshda bo'lmasa bazadan o'qiladi)"""
+    entry = _cache.get(user_id)
+    if entry is None:
+        entry = await _load(user_id)
+        if entry is None:
+            return False
+    else:
+        _cache.move_to_end(user_id)
+    return _has_subscription(entry)
+
+
+def record_download(user_id):
+    """Kvota boshqa joyda tekshirilganda hisoblagichni kechiktirib yozish uchun qo'shish"""
+    _pending[user_id] = _pending.get(user_id, 0) + 1
+
+
+def refund(user_id):
+    """Sarflangan, lekin bajarilmagan yuklab olishni qaytarish"""
+    entry = _cache.get(user_id)
+    if entry is not None and entry['downloads_count'] > 0:
+        entry['downloads_count'] -= 1
+    remaining = _pending.get(user_id, 0) - 1
+    if remaining:
+        _pending[user_id] = remaining
+    else:
+        _pending.pop(user_id, None)
+
+
+def invalidate(user_id):
+    """Obuna o'zgarganda (kupon, to'lov) keshdagi yozuvni o'chirish"""
+    _cache.pop(user_id, None)
+
+
+async def flush():
+    """Yig'ilgan hisoblagichlarni bitta tranzaksiyada (alohida oqimda) bazaga yozish"""
+    global _pending
+    if not _pending:
+        return 0
+
+    async with _flush_lock:
+        batch, _pending = _pending, {}
+        written = await asyncio.to_thread(add_downloads, batch)
+    if not written:
+        # Yozib bo'lmadi - keyingi safar qayta urinish
+        for user_id, count in batch.items():
+            _pending[user_id] = _pending.get(user_id, 0) + count
+        return 0
+    return sum(batch.values())
+
+
+async def _flush_loop(interval):
+    while True:
+        await asyncio.sleep(interval)
+        await flush()
+
+
+def start_flusher(interval=ENTITLEMENT_FLUSH_INTERVAL):
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_loop(interval))
+
+
+async def stop_flusher():
+    """Davriy yozishni to'xtatish va qolgan hisoblagichlarni yozish"""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        await asyncio.gather(_flush_task, return_exceptions=True)
+        _flush_task = None
+    flushed = await flush()
+    if flushed:
+        logger.info(f"Flushed {flushed} pending download counts on shutdown")
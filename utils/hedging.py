@@ -0,0 +1,36 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def first_successful(funcs, hedge_delay):
+    """Bir nechta manbadan birinchi yaroqli natijani olish (hedged so'rovlar)
+
+    funcs - argumentsiz coroutine funksiyalar, ustuvorlik tartibida.
+    Birinchisi darhol ishga tushadi, keyingisi hedge_delay sekund ichida
+    javob bo'lmasa (yoki oldingisi xatolik bilan tugasa) ishga tushadi.
+    hedge_delay=0 bo'lsa hammasi birdaniga boshlanadi. Birinchi bo'sh
+    bo'lmagan natija qaytariladi, qolgan vazifalar bekor qilinadi.
+    """
+    remaining = list(funcs)
+    pending = set()
+    try:
+        while remaining or pending:
+            if remaining:
+                pending.add(asyncio.ensure_future(remaining.pop(0)()))
+
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=hedge_delay if remaining else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is not None:
+                    logger.warning(f"Hedged request failed: {task.exception()}")
+                elif task.result():
+                    return task.result()
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
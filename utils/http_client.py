@@ -0,0 +1,93 @@
+import logging
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from utils.metrics import UPSTREAM_RESPONSES
+
+logger = logging.getLogger(__name__)
+
+# Umumiy ulanishlar puli sozlamalari
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 20
+KEEPALIVE_TIMEOUT = 30
+
+_session = None
+
+
+async def init_http_session():
+    """Umumiy aiohttp sessiyasini ochish (bot ishga tushganda bir marta)"""
+    global _session
+    if _session is not None and not _session.closed:
+        return _session
+
+    connector = aiohttp.TCPConnector(
+        limit=CONNECTION_LIMIT,
+        limit_per_host=CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=300,
+    )
+    _session = aiohttp.ClientSession(connector=connector)
+    logger.info("HTTP session opened")
+    return _session
+
+
+async def close_http_session():
+    """Umumiy aiohttp sessiyasini yopish (bot to'xtaganda)"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("HTTP session closed")
+    _session = None
+
+
+def get_http_session():
+    """Ochiq sessiyani qaytarish"""
+    if _session is None or _session.closed:
+        raise RuntimeError("HTTP session is not initialized, call init_http_session() first")
+    return _session
+
+
+async def get_json(url, headers=None, params=None, timeout=30):
+    """GET so'rov yuborib, (status, json) juftligini qaytarish"""
+    session = get_http_session()
+    async with session.get(
+        url,
+        headers=headers,
+        params=params,
+        timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as response:
+        UPSTREAM_RESPONSES.inc(host=urlsplit(url).hostname, status=response.status)
+        if response.status != 200:
+            return response.status, None
+        return response.status, await response.json(content_type=None)
+
+
+async def get_location(url, method='HEAD', headers=None, timeout=10):
+    """Yo'naltirishga ergashmasdan (status, Location) olish; tana o'qilmaydi"""
+    session = get_http_session()
+    async with session.request(
+        method,
+        url,
+        headers=headers,
+        allow_redirects=False,
+        timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as response:
+        return response.status, response.headers.get('Location')
+
+
+async def get_content_length(url, timeout=10):
+    """HEAD so'rovi bilan (status, Content-Length) olish; uzunlik noma'lum bo'lsa None"""
+    session = get_http_session()
+    async with session.head(
+        url,
+        allow_redirects=True,
+        timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as response:
+        UPSTREAM_RESPONSES.inc(host=urlsplit(url).hostname, status=response.status)
+        return response.status, response.content_length
+
+
+def download_timeout():
+    """Media yuklab olish uchun timeout (umumiy emas, har bir o'qish uchun)"""
+    return aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
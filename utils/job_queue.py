@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import time
+
+from config import DOWNLOAD_QUEUE_SIZE, DOWNLOAD_WORKERS, PER_USER_JOBS
+from utils.metrics import QUEUE_WAIT_SECONDS, register_collector
+from utils.shared_state import state_backend
+
+logger = logging.getLogger(__name__)
+
+# Ishchi navbatdan ish kutishda shuncha sekundda bir to'xtatilishini tekshiradi
+POP_TIMEOUT = 1
+
+
+class DownloadQueue:
+    """Yuklab olish vazifalari uchun cheklangan navbat va ishchilar puli
+
+    Bir vaqtda ishlaydigan vazifalar soni ishchilar soni bilan, navbat
+    uzunligi max_size bilan, bitta foydalanuvchining navbatdagi va
+    ishlayotgan vazifalari esa per_user_limit bilan cheklanadi.
+
+    Navbatning o'zi state_backend'da saqlanadi: xotirada (bitta jarayon)
+    yoki SQLite/Redis'da, shunda bir nechta jarayonning ishchilari bitta
+    umumiy navbatdan ish oladi. Vazifa JSON'ga aylantiriladigan dict bo'lib,
+    start() ga berilgan runner tomonidan bajariladi.
+    """
+
+    def __init__(self, workers, max_size, per_user_limit, backend):
+        self.workers = workers
+        self.max_size = max_size
+        self.per_user_limit = per_user_limit
+        self.backend = backend
+        self._runner = None
+        self._tasks = []
+        self.active = 0
+        # Oxirgi marta ko'rilgan navbat uzunligi (metrikalar uchun)
+        self.last_depth = 0
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+        }
+
+    async def queue_position(self):
+        """Yangi vazifaning navbatdagi o'rni (0 - bo'sh ishchi bor, darhol boshlanadi)"""
+        self.last_depth, _ = await self.backend.job_counts()
+        return max(0, self.last_depth - (self.workers - self.active) + 1)
+
+    async def can_accept(self, user_id):
+        if self._runner is None:
+            return False
+        self.last_depth, _ = await self.backend.job_counts()
+        return (
+            self.last_depth < self.max_size
+            and await self.backend.user_jobs(user_id) < self.per_user_limit
+        )
+
+    async def submit(self, user_id, job):
+        """Vazifani navbatga qo'yish; joy bo'lmasa asyncio.QueueFull"""
+        job = dict(job, enqueued_at=time.time())
+        if not await self.backend.push_job(user_id, job, self.max_size, self.per_user_limit):
+            self.stats['rejected'] += 1
+            raise asyncio.QueueFull()
+        self.stats['submitted'] += 1
+
+    async def start(self, runner):
+        self._runner = runner
+        self._tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+        logger.info(f"Download queue started with {self.workers} workers ({self.backend.name} backend)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._runner = None
+        logger.info("Download queue stopped")
+
+    async def _worker(self, index):
+        while True:
+            try:
+                item = await self.backend.pop_job(POP_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Download worker {index} failed to fetch a job: {e}")
+                await asyncio.sleep(POP_TIMEOUT)
+                continue
+            if item is None:
+                continue
+
+            job_id, user_id, job = item
+            QUEUE_WAIT_SECONDS.observe(max(0.0, time.time() - job['enqueued_at']))
+            self.active += 1
+            try:
+                await self._runner(job)
+                self.stats['completed'] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"Download worker {index} job failed: {e}")
+            finally:
+                self.active -= 1
+                await self.backend.finish_job(job_id, user_id)
+
+
+download_queue = DownloadQueue(DOWNLOAD_WORKERS, DOWNLOAD_QUEUE_SIZE, PER_USER_JOBS, state_backend)
+
+
+@register_collector
+def _collect_metrics():
+    return [
+        ('bot_jobs_queued', 'gauge', 'Link jobs waiting for a worker (last observed)', download_queue.last_depth),
+        ('bot_jobs_in_flight', 'gauge', 'Link jobs being processed by this process', download_queue.active),
+        ('bot_jobs_total', 'counter', 'Link jobs by outcome',
+         {(('outcome', outcome),): count for outcome, count in download_queue.stats.items()}),
+    ]
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from urllib.parse import urljoin, urlsplit
+
+from config import REDIRECT_CACHE_MEMORY_SIZE, REDIRECT_CACHE_TTL_DAYS
+from utils.database import get_redirect, purge_redirect_cache, save_redirect
+from utils.http_client import get_location
+from utils.metrics import register_collector
+from utils.router import classify_url, extract_urls
+from utils.single_flight import SingleFlight
+from utils.url_utils import normalize_url
+
+logger = logging.getLogger(__name__)
+
+# Kengaytiriladigan qisqa havola domenlari
+SHORT_LINK_HOSTS = {'youtu.be', 'pin.it', 'vt.tiktok.com', 'vm.tiktok.com', 'fb.watch', 't.co'}
+MAX_REDIRECTS = 5
+# Ba'zi serverlar HEAD so'rovini qabul qilmaydi - unda GET (tanasini o'qimasdan)
+HEAD_UNSUPPORTED = {400, 403, 404, 405, 501}
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+}
+
+CACHE_TTL = timedelta(days=REDIRECT_CACHE_TTL_DAYS)
+
+# short_key -> (expires_at, final_url), eng oxirgi ishlatilgani oxirida
+_memory_cache = OrderedDict()
+
+# Bir xil qisqa havola uchun bitta tarmoq so'rovi
+_flights = SingleFlight('redirect')
+
+expander_stats = {
+    'memory_hits': 0,
+    'db_hits': 0,
+    'local': 0,
+    'network': 0,
+    'failed': 0,
+}
+
+
+def _host(url):
+    try:
+        host = (urlsplit(url if '://' in url else 'https://' + url).hostname or '').lower()
+    except ValueError:
+        return ''
+    return host[4:] if host.startswith('www.') else host
+
+
+def is_short_link(url):
+    return _host(url) in SHORT_LINK_HOSTS
+
+
+def _remember(short_key, final_url, expires_at):
+    _memory_cache[short_key] = (expires_at, final_url)
+    _memory_cache.move_to_end(short_key)
+    while len(_memory_cache) > REDIRECT_CACHE_MEMORY_SIZE:
+        _memory_cache.popitem(last=False)
+
+
+async def _get_cached(short_key):
+    cached = _memory_cache.get(short_key)
+    if cached:
+        expires_at, final_url = cached
+        if expires_at > datetime.now():
+            _memory_cache.move_to_end(short_key)
+            expander_stats['memory_hits'] += 1
+            return final_url
+        del _memory_cache[short_key]
+
+    stored = await asyncio.to_thread(get_redirect, short_key)
+    if stored:
+        final_url, expires_at = stored
+        _remember(short_key, final_url, expires_at)
+        expander_stats['db_hits'] += 1
+        return final_url
+
+    return None
+
+
+async def expand_url(url):
+    """Qisqa havolaning manzilini aniqlash; qisqa havola bo'lmasa yoki xatolikda o'zini qaytaradi
+
+    Sahifalar yuklab olinmaydi: har bir qadamda faqat HEAD (kerak bo'lsa
+    GET) javobining Location sarlavhasi o'qiladi va manzil qisqa havola
+    domenidan chiqishi bilan to'xtatiladi. Natija xotira va SQLite'da
+    keshlanadi.
+    """
+    if not is_short_link(url):
+        return url
+    if '://' not in url:
+        url = 'https://' + url
+
+    # youtu.be/ID tarmoqsiz kengaytiriladi
+    if _host(url) == 'youtu.be':
+        video_id = urlsplit(url).path.strip('/').split('/')[0]
+        if video_id:
+            expander_stats['local'] += 1
+            return f"https://www.youtube.com/watch?v={video_id}"
+
+    short_key = normalize_url(url)
+    final_url = await _get_cached(short_key)
+    if final_url is not None:
+        return final_url
+
+    return await _flights.run(short_key, _expand_and_cache, short_key, url)
+
+
+async def _expand_and_cache(short_key, url):
+    try:
+        final_url = await _follow(url)
+    except Exception as e:
+        expander_stats['failed'] += 1
+        logger.error(f"Error expanding short link {url}: {e}")
+        return url
+
+    expander_stats['network'] += 1
+    if final_url != url:
+        expires_at = datetime.now() + CACHE_TTL
+        _remember(short_key, final_url, expires_at)
+        await asyncio.to_thread(save_redirect, short_key, final_url, expires_at)
+        logger.info(f"Expanded {url} -> {final_url}")
+    return final_url
+
+
+async def _follow(url):
+    current = url
+    for _ in range(MAX_REDIRECTS):
+        status, location = await get_location(current, headers=HEADERS)
+        if status in HEAD_UNSUPPORTED:
+            status, location = await get_location(current, method='GET', headers=HEADERS)
+
+        if not (300 <= status < 400 and location):
+            return current
+
+        current = urljoin(current, location)
+        if not is_short_link(current):
+            return current
+    return current
+
+
+async def route_text(text):
+    """Xabardagi birinchi qo'llab-quvvatlanadigan havola uchun Route (qisqa havolalar kengaytiriladi)"""
+    for url in extract_urls(text):
+        route = classify_url(await expand_url(url))
+        if route is not None:
+            return route
+    return None
+
+
+@register_collector
+def _collect_metrics():
+    return [
+        ('bot_short_link_expansions_total', 'counter', 'Short link expansions by source',
+         {(('source', source),): count for source, count in expander_stats.items()}),
+    ]
+
+
+def purge_expired():
+    """Eskirgan yozuvlarni xotira va SQLite'dan tozalash"""
+    now = datetime.now()
+    for short_key in [key for key, (expires_at, _) in _memory_cache.items() if expires_at <= now]:
+        del _memory_cache[short_key]
+    return purge_redirect_cache()
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputMediaPhoto, InputMediaVideo
+
+from config import MEDIA_CACHE_MAX_ENTRIES, MEDIA_CACHE_TTL_DAYS
+from utils.database import (
+    delete_cached_media,
+    evict_cached_media,
+    get_cached_media,
+    save_cached_media,
+)
+from utils.metrics import MEDIA_CACHE_LOOKUPS
+from utils.router import cache_key
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = timedelta(days=MEDIA_CACHE_TTL_DAYS)
+# Har shuncha saqlashdan keyin eskirgan yozuvlarni tozalash
+EVICT_EVERY = 100
+
+_saves_since_evict = 0
+
+
+def media_entry(method, sent_message, caption=None):
+    """Yuborilgan xabardan kesh yozuvini yaratish (video, photo yoki document)"""
+    media = getattr(sent_message, method, None)
+    if method == 'photo' and media:
+        media = media[-1]
+    if media is None:
+        return None
+    return {'method': method, 'file_id': media.file_id, 'caption': caption}
+
+
+def media_group_entry(sent_messages, caption=None):
+    """send_media_group natijasidan kesh yozuvini yaratish"""
+    items = []
+    for sent_message in sent_messages:
+        if sent_message.photo:
+            items.append({'type': 'photo', 'file_id': sent_message.photo[-1].file_id})
+        elif sent_message.video:
+            items.append({'type': 'video', 'file_id': sent_message.video.file_id})
+        else:
+            return None
+    return {'method': 'media_group', 'items': items, 'caption': caption}
+
+
+async def remember_media(source_url, entries):
+    """Yuborilgan media file_id'larini manba URL bo'yicha saqlash (DB yozuvi alohida oqimda)"""
+    global _saves_since_evict
+    if not entries or any(entry is None for entry in entries):
+        return False
+
+    saved = await asyncio.to_thread(save_cached_media, cache_key(source_url), entries)
+
+    _saves_since_evict += 1
+    if _saves_since_evict >= EVICT_EVERY:
+        _saves_since_evict = 0
+        await asyncio.to_thread(evict_cached_media, CACHE_TTL, MEDIA_CACHE_MAX_ENTRIES)
+
+    return saved
+
+
+async def _send_entry(bot, chat_id, entry):
+    method = entry['method']
+    caption = entry.get('caption')
+
+    if method == 'video':
+        await bot.send_video(chat_id=chat_id, video=entry['file_id'], caption=caption)
+    elif method == 'photo':
+        await bot.send_photo(chat_id=chat_id, photo=entry['file_id'], caption=caption)
+    elif method == 'document':
+        await bot.send_document(chat_id=chat_id, document=entry['file_id'], caption=caption)
+    elif method == 'media_group':
+        media_group = []
+        for i, item in enumerate(entry['items']):
+            media_class = InputMediaVideo if item['type'] == 'video' else InputMediaPhoto
+            media_group.append(media_class(media=item['file_id'], caption=caption if i == 0 else None))
+        await bot.send_media_group(chat_id=chat_id, media=media_group)
+    else:
+        raise ValueError(f"Unknown cached media method: {method}")
+
+
+async def send_cached_media(bot, chat_id, source_url):
+    """Keshdagi file_id orqali qayta yuborish; topilmasa yoki eskirgan bo'lsa False"""
+    source_key = cache_key(source_url)
+    # Topilganda last_access yangilanadi - boshqa jarayonlar yozayotganda kutmaslik uchun alohida oqimda
+    entries = await asyncio.to_thread(get_cached_media, source_key, CACHE_TTL)
+    if not entries:
+        MEDIA_CACHE_LOOKUPS.inc(result='miss')
+        return False
+
+    try:
+        for entry in entries:
+            await _send_entry(bot, chat_id, entry)
+    except TelegramBadRequest as e:
+        # file_id endi yaroqsiz - yozuvni o'chirib, oddiy yo'l bilan davom etish
+        logger.warning(f"Stale cached file_id for {source_key}: {e}")
+        await asyncio.to_thread(delete_cached_media, source_key)
+        MEDIA_CACHE_LOOKUPS.inc(result='stale')
+        return False
+
+    MEDIA_CACHE_LOOKUPS.inc(result='hit')
+    logger.info(f"Served {source_key} from file_id cache")
+    return True
+
+
+def evict_media_cache():
+    """Eskirgan va kam ishlatilgan yozuvlarni tozalash"""
+    return evict_cached_media(CACHE_TTL, MEDIA_CACHE_MAX_ENTRIES)
@@ -0,0 +1,207 @@
+import contextvars
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Joriy vazifa qaysi platformaga tegishli (metrikalar yorlig'i uchun)
+current_platform = contextvars.ContextVar('current_platform', default='unknown')
+
+_metrics = []
+_collectors = []
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class Counter:
+    """Faqat o'sadigan hisoblagich"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        # Qiymatlar asyncio.to_thread oqimlaridan ham yangilanadi
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge(Counter):
+    """Istalgan qiymatni qabul qiladigan o'lchov"""
+
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Qiymatlar taqsimoti (masalan, kechikish vaqtlari)"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        # DB_CALL_SECONDS asyncio.to_thread oqimlaridan yangilanadi
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (bucket_counts, total, count) in values:
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                labels = _format_labels(self.labelnames, key, [('le', bound)])
+                yield f"{self.name}_bucket", labels, bucket_count
+            yield f"{self.name}_bucket", _format_labels(self.labelnames, key, [('le', '+Inf')]), count
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), count
+
+
+def register_collector(func):
+    """Har bir so'rovda chaqiriladigan funksiya: [(nom, tur, izoh, {yorliqlar: qiymat}|qiymat)]"""
+    _collectors.append(func)
+    return func
+
+
+def render():
+    """Barcha metrikalarni Prometheus matn formatida qaytarish"""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+
+    for collector in _collectors:
+        try:
+            collected = collector()
+        except Exception as e:
+            logger.error(f"Metrics collector {collector.__name__} failed: {e}")
+            continue
+        for name, type_name, documentation, value in collected:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {type_name}")
+            if isinstance(value, dict):
+                for labels, labelled_value in value.items():
+                    lines.append(f"{name}{_format_labels([k for k, _ in labels], [v for _, v in labels])} {labelled_value}")
+            else:
+                lines.append(f"{name} {value}")
+
+    return '\n'.join(lines) + '\n'
+
+
+def timed_db_call(func):
+    """Ma'lumotlar bazasi funksiyasining bajarilish vaqtini o'lchash"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            DB_CALL_SECONDS.observe(time.perf_counter() - started, function=func.__name__)
+    return wrapper
+
+
+# Bosqichlar bo'yicha kechikishlar
+PROCESS_LINK_SECONDS = Histogram(
+    'bot_process_link_seconds', 'Total time to handle a link job', ['platform', 'outcome']
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    'bot_queue_wait_seconds', 'Time a link job waited in the download queue'
+)
+RESOLVE_SECONDS = Histogram(
+    'bot_resolve_seconds', 'Time to resolve a source URL into media links', ['platform']
+)
+DOWNLOAD_SECONDS = Histogram(
+    'bot_download_seconds', 'Time to download media from the CDN', ['platform']
+)
+UPLOAD_SECONDS = Histogram(
+    'bot_upload_seconds', 'Time of Telegram send calls carrying media', ['platform', 'method']
+)
+DB_CALL_SECONDS = Histogram(
+    'bot_db_call_seconds', 'SQLite call latency by function', ['function'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+)
+
+# Tashqi xizmatlar va keshlar
+UPSTREAM_RESPONSES = Counter(
+    'bot_upstream_responses_total', 'Resolver API responses by host and HTTP status', ['host', 'status']
+)
+MEDIA_CACHE_LOOKUPS = Counter(
+    'bot_media_cache_lookups_total', 'Telegram file_id cache lookups', ['result']
+)
+
+
+async def handle_metrics(request):
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+def setup_metrics(app):
+    app.router.add_get('/metrics', handle_metrics)
+
+
+async def start_metrics_server(host, port):
+    """Metrikalar uchun alohida kichik aiohttp server"""
+    app = web.Application()
+    setup_metrics(app)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
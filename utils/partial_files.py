@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: flock yo'q, qisman fayllar ishlatilmaydi
+    fcntl = None
+
+from config import PARTIAL_JANITOR_INTERVAL, PARTIAL_MAX_AGE_HOURS, TEMP_DIRECTORY
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_FILE_PREFIX = 'partial-'
+PARTIAL_SUFFIX = '.part'
+META_SUFFIX = '.json'
+# Metama'lumot shuncha bayt yozilganda yangilanadi (jarayon to'xtasa ham davom ettirish uchun)
+SAVE_INTERVAL = 4 * 1024 * 1024
+PARTIAL_MAX_AGE = PARTIAL_MAX_AGE_HOURS * 3600
+# Qisman fayllarni band qilish (flock) va bo'laklarni o'z joyiga yozish (pwrite) mumkinmi;
+# aks holda yuklab olish bitta oqimda, davom ettirishsiz bajariladi
+FILE_LOCKS_SUPPORTED = fcntl is not None
+PARTIAL_FILES_SUPPORTED = FILE_LOCKS_SUPPORTED and hasattr(os, 'pwrite')
+
+_janitor_task = None
+
+
+def _base_path(url, private=False):
+    name = PARTIAL_FILE_PREFIX + hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+    if private:
+        # Boshqa yuklab olish umumiy faylni band qilgan - alohida, davom ettirilmaydigan nusxa
+        name += '-' + uuid.uuid4().hex[:8]
+    return os.path.join(TEMP_DIRECTORY, name)
+
+
+def try_lock(fd):
+    """Faylni band qilish (flock, kutmasdan); boshqa deskriptor band qilgan bo'lsa False
+
+    Band qilish deskriptor yopilguncha (yoki jarayon tugaguncha) saqlanadi.
+    """
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+class PartialDownload:
+    """TEMP_DIRECTORY'dagi qisman yuklangan fayl va uning metama'lumotlari
+
+    Fayl oldindan to'liq hajmda ajratiladi va bo'laklar (segments) o'z
+    joyiga yoziladi. Har bir bo'lak uchun qancha bayt yozilgani yonidagi
+    .json faylda saqlanadi, shuning uchun uzilgan yuklab olish (shu jarayonda
+    yoki qayta ishga tushgandan keyin) Range so'rovlari bilan davom etadi.
+    Fayl flock bilan band qilinadi - uni bir vaqtda faqat bitta yuklab olish
+    yozadi. Metodlar diskka sinxron yozadi, shuning uchun yuklab oluvchi
+    ularni asyncio.to_thread orqali chaqiradi; bo'laklar turli oqimlardan
+    yozilishi mumkin.
+    """
+
+    def __init__(self, url, size, validator, segments, base_path, fd):
+        self.url = url
+        self.size = size
+        # ETag yoki Last-Modified (If-Range uchun); None bo'lsa davom ettirib bo'lmaydi
+        self.validator = validator
+        # [start, end, written] - end kiritilgan holda
+        self.segments = segments
+        self.path = base_path + PARTIAL_SUFFIX
+        self.meta_path = base_path + META_SUFFIX
+        self._fd = fd
+        self._unsaved = 0
+        self._save_lock = threading.Lock()
+
+    @property
+    def written(self):
+        return sum(segment[2] for segment in self.segments)
+
+    @property
+    def resumable(self):
+        return self.validator is not None
+
+    @classmethod
+    def create(cls, url, size, validator, ranges):
+        """Yangi qisman fayl yaratish (eski nusxa bo'lsa ustidan yoziladi)"""
+        base_path = _base_path(url)
+        fd = os.open(base_path + PARTIAL_SUFFIX, os.O_RDWR | os.O_CREAT, 0o644)
+        if not try_lock(fd):
+            os.close(fd)
+            base_path = _base_path(url, private=True)
+            fd = os.open(base_path + PARTIAL_SUFFIX, os.O_RDWR | os.O_CREAT, 0o644)
+            # Boshqalar bilan baham ko'rilmaydi - davom ettirish uchun saqlanmaydi
+            validator = None
+
+        os.ftruncate(fd, 0)
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+
+        partial = cls(url, size, validator, [[start, end, 0] for start, end in ranges], base_path, fd)
+        partial.save()
+        return partial
+
+    @classmethod
+    def load(cls, url, max_size):
+        """Oldin uzilgan yuklab olishni topish; yo'q, band yoki yaroqsiz bo'lsa None"""
+        base_path = _base_path(url)
+        try:
+            with open(base_path + META_SUFFIX) as f:
+                meta = json.load(f)
+            fd = os.open(base_path + PARTIAL_SUFFIX, os.O_RDWR)
+        except (OSError, ValueError):
+            return None
+
+        if not try_lock(fd):
+            os.close(fd)
+            return None
+
+        partial = cls(url, meta.get('size'), meta.get('validator'), meta.get('segments'), base_path, fd)
+        valid = (
+            meta.get('url') == url
+            and partial.validator
+            and isinstance(partial.size, int)
+            and os.fstat(fd).st_size == partial.size
+        )
+        if not valid:
+            partial.discard()
+            return None
+        if partial.size > max_size:
+            # Kattaroq chegarali yuklab olish uchun saqlanib qoladi
+            os.close(fd)
+            return None
+        return partial
+
+    def remaining(self):
+        """[(index, offset, end)] - hali yozilmagan oraliqlar"""
+        return [
+            (index, start + written, end)
+            for index, (start, end, written) in enumerate(self.segments)
+            if start + written <= end
+        ]
+
+    def is_complete(self):
+        return not self.remaining()
+
+    def write(self, index, chunk):
+        """index-bo'lakning davomiga yozish"""
+        segment = self.segments[index]
+        offset = segment[0] + segment[2]
+        if offset + len(chunk) > segment[1] + 1:
+            raise ValueError("Range chunk beyond its segment")
+        os.pwrite(self._fd, chunk, offset)
+        segment[2] += len(chunk)
+
+        # Metama'lumot ma'lumotdan keyin yoziladi, shuning uchun u hech
+        # qachon haqiqatda yozilganidan ko'pini ko'rsatmaydi
+        with self._save_lock:
+            self._unsaved += len(chunk)
+            due = self._unsaved >= SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def save(self):
+        """Metama'lumotni atomar yozish (davom ettirib bo'lmaydiganlar uchun ham - janitor yoshini biladi)"""
+        with self._save_lock:
+            meta = {
+                'url': self.url,
+                'size': self.size,
+                'validator': self.validator,
+                'segments': [list(segment) for segment in self.segments],
+                'updated_at': time.time(),
+            }
+            tmp_path = self.meta_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self.meta_path)
+            self._unsaved = 0
+
+    def close(self):
+        """Faylni bo'shatish (keyinroq davom ettirish uchun diskda qoladi)"""
+        if self._fd is not None:
+            if self.resumable:
+                self.save()
+            os.close(self._fd)
+            self._fd = None
+
+    def discard(self):
+        """Qisman fayl va metama'lumotni o'chirish"""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        for path in (self.path, self.meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def detach(self, target_path):
+        """Tugagan faylni target_path'ga ko'chirib, bo'shatish (metama'lumot o'chiriladi)
+
+        Ko'chirish flock ushlab turilgan holda bajariladi, shuning uchun boshqa
+        yuklab olish bu faylni qisman deb ocha olmaydi.
+        """
+        try:
+            os.remove(self.meta_path)
+        except FileNotFoundError:
+            pass
+        os.replace(self.path, target_path)
+        os.close(self._fd)
+        self._fd = None
+
+
+def purge_stale_partials(max_age=PARTIAL_MAX_AGE):
+    """max_age sekunddan beri yangilanmagan (yoki metama'lumotsiz) qisman fayllarni o'chirish
+
+    Hozir yozilayotgan (flock bilan band) fayllarga tegilmaydi.
+    """
+    if not PARTIAL_FILES_SUPPORTED:
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(TEMP_DIRECTORY):
+        if not (name.startswith(PARTIAL_FILE_PREFIX) and name.endswith(PARTIAL_SUFFIX)):
+            continue
+        path = os.path.join(TEMP_DIRECTORY, name)
+        meta_path = path[:-len(PARTIAL_SUFFIX)] + META_SUFFIX
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except OSError:
+            continue
+        try:
+            if not try_lock(fd):
+                continue
+            try:
+                updated_at = os.path.getmtime(meta_path)
+            except OSError:
+                updated_at = None
+            if updated_at is not None and updated_at > cutoff:
+                continue
+            for stale_path in (path, meta_path):
+                try:
+                    os.remove(stale_path)
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        finally:
+            os.close(fd)
+
+    if removed:
+        logger.info(f"Removed {removed} stale partial downloads")
+    return removed
+
+
+async def _janitor_loop(interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(purge_stale_partials)
+        except Exception as e:
+            logger.error(f"Error purging partial downloads: {e}")
+
+
+def start_janitor(interval=PARTIAL_JANITOR_INTERVAL):
+    global _janitor_task
+    if _janitor_task is None:
+        _janitor_task = asyncio.create_task(_janitor_loop(interval))
+
+
+async def stop_janitor():
+    global _janitor_task
+    if _janitor_task is not None:
+        _janitor_task.cancel()
+        await asyncio.gather(_janitor_task, return_exceptions=True)
+        _janitor_task = None
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from config import RESOLVER_CACHE_TTL
+from utils.downloader import max_download_size
+from utils.http_client import get_content_length
+from utils.metrics import register_collector
+from utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+PROBE_TIMEOUT = 5
+# CDN havolalari resolver javobi bilan birga eskiradi
+PROBE_CACHE_TTL = RESOLVER_CACHE_TTL
+PROBE_CACHE_SIZE = 5000
+
+# url -> (expires_at, size yoki None), eng oxirgi ishlatilgani oxirida
+_probe_cache = OrderedDict()
+
+_flights = SingleFlight('probe')
+
+rendition_stats = {
+    'probes': 0,
+    'probe_cache_hits': 0,
+    'probe_failures': 0,
+    'downgraded': 0,
+    'too_large': 0,
+}
+
+
+class MediaTooLarge(Exception):
+    """Hech bir variant yuborish chegarasiga sig'maydi"""
+
+    def __init__(self, size, limit):
+        super().__init__(f"Smallest rendition is {size} bytes, limit is {limit}")
+        self.size = size
+        self.limit = limit
+
+
+async def _probe(url):
+    rendition_stats['probes'] += 1
+    try:
+        status, size = await get_content_length(url, timeout=PROBE_TIMEOUT)
+        if status >= 400:
+            size = None
+    except Exception as e:
+        logger.warning(f"Size probe failed for {url[:100]}: {e}")
+        size = None
+    if size is None:
+        rendition_stats['probe_failures'] += 1
+
+    _probe_cache[url] = (time.monotonic() + PROBE_CACHE_TTL, size)
+    _probe_cache.move_to_end(url)
+    while len(_probe_cache) > PROBE_CACHE_SIZE:
+        _probe_cache.popitem(last=False)
+    return size
+
+
+async def probe_size(url):
+    """Faylning hajmi (HEAD/Content-Length) yoki noma'lum bo'lsa None, keshlangan holda"""
+    cached = _probe_cache.get(url)
+    if cached:
+        expires_at, size = cached
+        if expires_at > time.monotonic():
+            _probe_cache.move_to_end(url)
+            rendition_stats['probe_cache_hits'] += 1
+            return size
+        del _probe_cache[url]
+
+    return await _flights.run(url, _probe, url)
+
+
+async def select_rendition(candidates, max_size=None):
+    """Chegaraga sig'adigan eng yaxshi variantning URL'i
+
+    candidates - eng yaxshi sifatdan boshlab tartiblangan URL'lar. Barchasi
+    bir vaqtda HEAD bilan tekshiriladi va hajmi chegaradan katta ekani
+    ma'lum bo'lganlari tashlab ketiladi; hajmi noma'lumlari tanlanishi
+    mumkin (yuklab olishda chegara baribir tekshiriladi). Hammasi katta
+    bo'lsa MediaTooLarge, nomzod bo'lmasa None.
+    """
+    if not candidates:
+        return None
+
+    if max_size is None:
+        max_size = max_download_size.get()
+
+    sizes = await asyncio.gather(*(probe_size(url) for url in candidates))
+    for index, (url, size) in enumerate(zip(candidates, sizes)):
+        if size is None or size <= max_size:
+            if index:
+                rendition_stats['downgraded'] += 1
+                logger.info(f"Best {index} renditions exceed {max_size} bytes, using rendition {index + 1}")
+            return url
+
+    rendition_stats['too_large'] += 1
+    raise MediaTooLarge(min(sizes), max_size)
+
+
+@register_collector
+def _collect_metrics():
+    return [
+        ('bot_rendition_probes_total', 'counter', 'HEAD size probes sent to media CDNs',
+         rendition_stats['probes']),
+        ('bot_rendition_probe_cache_hits_total', 'counter', 'Size probes answered from cache',
+         rendition_stats['probe_cache_hits']),
+        ('bot_rendition_probe_failures_total', 'counter', 'Size probes without a usable Content-Length',
+         rendition_stats['probe_failures']),
+        ('bot_rendition_selections_total', 'counter', 'Rendition selections that skipped oversized variants', {
+            (('result', 'downgraded'),): rendition_stats['downgraded'],
+            (('result', 'too_large'),): rendition_stats['too_large'],
+        }),
+        ('bot_rendition_probe_cache_entries', 'gauge', 'Size probe results held in memory',
+         len(_probe_cache)),
+    ]
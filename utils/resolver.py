@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from config import RAPIDAPI_KEY, RESOLVER_CACHE_MEMORY_SIZE, RESOLVER_CACHE_TTL
+from utils.database import get_resolver_cache, purge_resolver_cache, save_resolver_cache
+from utils.http_client import get_json
+from utils.metrics import RESOLVE_SECONDS, current_platform, register_collector
+from utils.router import cache_key
+from utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+SMVD_URL = "https://social-media-video-downloader.p.rapidapi.com/smvd/get/all"
+SMVD_HOST = "social-media-video-downloader.p.rapidapi.com"
+
+CACHE_TTL = timedelta(seconds=RESOLVER_CACHE_TTL)
+
+# source_key -> (expires_at, payload), eng oxirgi ishlatilgani oxirida
+_memory_cache = OrderedDict()
+
+# Bir vaqtda kelgan bir xil havolalar uchun bitta API so'rovi
+_flights = SingleFlight('resolver')
+
+# Tejalgan RapidAPI so'rovlarini kuzatish uchun hisoblagichlar
+resolver_stats = {
+    'memory_hits': 0,
+    'db_hits': 0,
+    'misses': 0,
+}
+
+
+def _remember(source_key, payload, expires_at):
+    _memory_cache[source_key] = (expires_at, payload)
+    _memory_cache.move_to_end(source_key)
+    while len(_memory_cache) > RESOLVER_CACHE_MEMORY_SIZE:
+        _memory_cache.popitem(last=False)
+
+
+async def get_cached_payload(source_key):
+    """Keshdan (avval xotira, keyin SQLite - alohida oqimda) javobni olish"""
+    cached = _memory_cache.get(source_key)
+    if cached:
+        expires_at, payload = cached
+        if expires_at > datetime.now():
+            _memory_cache.move_to_end(source_key)
+            resolver_stats['memory_hits'] += 1
+            return payload
+        del _memory_cache[source_key]
+
+    stored = await asyncio.to_thread(get_resolver_cache, source_key)
+    if stored:
+        payload, expires_at = stored
+        _remember(source_key, payload, expires_at)
+        resolver_stats['db_hits'] += 1
+        return payload
+
+    return None
+
+
+def _quality_rank(link, index):
+    """Saralash kaliti: suv belgisiz, original > hd > sd, balandroq o'lcham, API tartibi"""
+    quality = link.get('quality', '').lower()
+    match = re.search(r'(\d{3,4})p', quality)
+    height = int(match.group(1)) if match else 0
+    if 'original' in quality:
+        tier = 3
+    elif 'hd' in quality or height >= 720:
+        tier = 2
+    elif 'sd' in quality or height:
+        tier = 0
+    else:
+        tier = 1
+    watermarked = 'watermark' in quality and 'no_watermark' not in quality
+    return (not watermarked, tier, height, -index)
+
+
+def video_candidates(links):
+    """API javobidagi video havolalari, eng yaxshi sifatdan boshlab"""
+    ranked = []
+    for index, link in enumerate(links):
+        quality = link.get('quality', '')
+        link_url = link.get('link', '')
+        if link_url and 'audio' not in quality and ('video' in quality or 'mp4' in link_url):
+            ranked.append((_quality_rank(link, index), link_url))
+    ranked.sort(reverse=True)
+    return [link_url for _, link_url in ranked]
+
+
+def is_usable_payload(data):
+    """Keshlashga arziydigan javob (video yoki rasm havolalari bor)"""
+    if not isinstance(data, dict):
+        return False
+    return bool(data.get('links')) or bool(data.get('images'))
+
+
+async def resolve_social_media(source_url):
+    """social-media-video-downloader API'dan (status, data) olish, keshlangan holda"""
+    source_key = cache_key(source_url)
+
+    with RESOLVE_SECONDS.time(platform=current_platform.get()):
+        payload = await get_cached_payload(source_key)
+        if payload is not None:
+            logger.info(f"Resolver cache hit: {source_key}")
+            return 200, payload
+
+        return await _flights.run(source_key, _fetch_and_cache, source_key, source_url)
+
+
+async def _fetch_and_cache(source_key, source_url):
+    resolver_stats['misses'] += 1
+    headers = {
+        "x-rapidapi-key": RAPIDAPI_KEY,
+        "x-rapidapi-host": SMVD_HOST
+    }
+    status, data = await get_json(SMVD_URL, headers=headers, params={"url": source_url})
+
+    if status == 200 and is_usable_payload(data):
+        expires_at = datetime.now() + CACHE_TTL
+        _remember(source_key, data, expires_at)
+        await asyncio.to_thread(save_resolver_cache, source_key, data, expires_at)
+
+    return status, data
+
+
+@register_collector
+def _collect_metrics():
+    return [
+        ('bot_resolver_cache_lookups_total', 'counter', 'Resolver cache lookups by result',
+         {(('result', result),): count for result, count in resolver_stats.items()}),
+        ('bot_resolver_cache_memory_entries', 'gauge', 'Resolver responses held in memory',
+         len(_memory_cache)),
+        ('bot_resolves_in_flight', 'gauge', 'Distinct resolver API calls in progress', len(_flights)),
+    ]
+
+
+def purge_expired():
+    """Eskirgan yozuvlarni xotira va SQLite'dan tozalash"""
+    now = datetime.now()
+    for source_key in [key for key, (expires_at, _) in _memory_cache.items() if expires_at <= now]:
+        del _memory_cache[source_key]
+    return purge_resolver_cache()
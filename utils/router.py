@@ -0,0 +1,136 @@
+import re
+from collections import namedtuple
+from urllib.parse import parse_qs, urlsplit
+
+from utils.url_utils import normalize_url
+
+# Xabar matnidan havolalarni ajratish (sxemasiz "youtu.be/..." ham)
+URL_PATTERN = re.compile(
+    r'(?<![\w.-])(?:https?://)?(?:[a-z0-9-]+\.)+[a-z]{2,}(?::\d+)?/[^\s<>"\']*',
+    re.IGNORECASE,
+)
+# Havola oxiriga yopishib qolgan tinish belgilari
+TRAILING_PUNCTUATION = '.,;:!?)]}»"\''
+
+# Registratsiya qilingan domen (hostning oxirgi ikki labeli) -> platforma,
+# shuning uchun "box.com" yoki "x.com.evil.io" x.com deb hisoblanmaydi
+HOST_PLATFORMS = {
+    'instagram.com': 'instagram',
+    'instagr.am': 'instagram',
+    'tiktok.com': 'tiktok',
+    'x.com': 'twitter',
+    'twitter.com': 'twitter',
+    'youtube.com': 'youtube',
+    'youtu.be': 'youtube',
+    'youtube-nocookie.com': 'youtube',
+    'facebook.com': 'facebook',
+    'fb.com': 'facebook',
+    'fb.watch': 'facebook',
+    'pinterest.com': 'pinterest',
+    'pin.it': 'pinterest',
+}
+
+# DNS bo'yicha hostname uzunligi chegarasi
+MAX_HOST_LENGTH = 253
+
+# Pinterest mamlakat domenlari (pinterest.co.uk, pinterest.de, ...)
+PINTEREST_HOST = re.compile(r'(?:^|\.)pinterest\.(?:[a-z]{2,3}|co\.[a-z]{2}|com\.[a-z]{2})$')
+
+# Platforma -> yo'ldan media ID'ni ajratuvchi ifodalar
+MEDIA_ID_PATTERNS = {
+    'instagram': [re.compile(r'^/(?:[\w.]+/)?(?:p|reels?|tv)/([\w-]+)')],
+    'tiktok': [re.compile(r'^/(?:@[\w.-]+/)?(?:video|photo)/(\d+)'), re.compile(r'^/v/(\d+)')],
+    'twitter': [re.compile(r'^/(?:\w+|i/web)/status(?:es)?/(\d+)')],
+    'youtube': [re.compile(r'^/(?:shorts|embed|live|v)/([\w-]{11})')],
+    'facebook': [
+        re.compile(r'^/(?:[\w.]+/)?videos/(?:[\w.-]+/)?(\d+)'),
+        re.compile(r'^/reel/(\d+)'),
+        re.compile(r'^/share/[vr]/(\w+)'),
+    ],
+    'pinterest': [re.compile(r'^/pin/(?:[\w-]*--)?(\d+)')],
+}
+
+Route = namedtuple('Route', ['platform', 'url', 'key', 'media_id'])
+
+
+def platform_for_host(host):
+    """Hostname bo'yicha platforma nomini topish (aks holda None)"""
+    host = host.lower().rstrip('.')
+    if len(host) > MAX_HOST_LENGTH:
+        return None
+    platform = HOST_PLATFORMS.get('.'.join(host.rsplit('.', 2)[-2:]))
+    if platform:
+        return platform
+    if PINTEREST_HOST.search(host):
+        return 'pinterest'
+    return None
+
+
+def _media_id(platform, host, parts):
+    path = parts.path
+    for pattern in MEDIA_ID_PATTERNS[platform]:
+        match = pattern.match(path)
+        if match:
+            return match.group(1)
+
+    if platform == 'youtube':
+        if host.endswith('youtu.be'):
+            video_id = path.strip('/').split('/')[0]
+            return video_id if len(video_id) == 11 else None
+        video_id = parse_qs(parts.query).get('v', [''])[0]
+        return video_id if len(video_id) == 11 else None
+
+    if platform == 'facebook' and path.rstrip('/') == '/watch':
+        return parse_qs(parts.query).get('v', [None])[0]
+
+    return None
+
+
+def classify_url(url):
+    """Havolani tahlil qilish: Route(platform, url, key, media_id) yoki None
+
+    key kesh va takrorlarni aniqlash uchun: ID topilsa "platform:id",
+    aks holda "platform:" + normallashtirilgan URL (masalan, qisqa havolalar).
+    """
+    url = url.strip()
+    if '://' not in url:
+        url = 'https://' + url
+
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+    except ValueError:
+        return None
+    if not host or parts.scheme not in ('http', 'https'):
+        return None
+
+    platform = platform_for_host(host)
+    if platform is None:
+        return None
+
+    media_id = _media_id(platform, host, parts)
+    if media_id:
+        key = f"{platform}:{media_id}"
+    else:
+        key = f"{platform}:{normalize_url(url)}"
+    return Route(platform, url, key, media_id)
+
+
+def extract_urls(text):
+    """Matndagi barcha havolalarni tartib bilan qaytarish"""
+    return [match.group(0).rstrip(TRAILING_PUNCTUATION) for match in URL_PATTERN.finditer(text)]
+
+
+def route_message(text):
+    """Xabardagi birinchi qo'llab-quvvatlanadigan havola uchun Route (yoki None)"""
+    for url in extract_urls(text):
+        route = classify_url(url)
+        if route is not None:
+            return route
+    return None
+
+
+def cache_key(url):
+    """Kesh kaliti: tanilgan havola uchun Route.key, aks holda normallashtirilgan URL"""
+    route = classify_url(url)
+    return route.key if route is not None else normalize_url(url)
@@ -0,0 +1,489 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import (
+    FREE_LIMIT,
+    JOB_POLL_INTERVAL,
+    JOB_POLL_MAX_INTERVAL,
+    REDIS_URL,
+    STALE_JOB_TIMEOUT,
+    STATE_BACKEND,
+)
+from utils import entitlements
+from utils.database import (
+    claim_job,
+    consume_download,
+    count_jobs,
+    count_user_jobs,
+    create_user,
+    enqueue_job,
+    finish_job,
+    get_fsm_record,
+    get_user,
+    refund_download,
+    renew_job_leases,
+    requeue_stale_jobs,
+    set_fsm_data,
+    set_fsm_state,
+)
+
+logger = logging.getLogger(__name__)
+
+# Navbatdagi ishni qaysi jarayon olganini ko'rsatish uchun
+WORKER_NAME = f"{socket.gethostname()}:{os.getpid()}"
+
+# Jarayon tirikligi (Redis'da heartbeat kaliti, SQLite'da ishlarning claimed_at'i)
+# shu oraliqda yangilanadi va HEARTBEAT_TTL ichida yangilanmasa, olgan ishlari
+# navbatga qaytariladi
+HEARTBEAT_INTERVAL = 10
+HEARTBEAT_TTL = 30
+
+
+def _storage_key(key):
+    return ':'.join(str(part) for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id,
+        key.business_connection_id, key.destiny,
+    ))
+
+
+def _get_or_create_user(user_id):
+    return get_user(user_id) or create_user(user_id)
+
+
+def _subscription_active(user):
+    return bool(user and user['subscription_end'] and user['subscription_end'] > datetime.now())
+
+
+def _state_name(state):
+    return state.state if hasattr(state, 'state') else state
+
+
+class MemoryBackend:
+    """Bitta jarayon uchun: navbat, kvota va FSM holati xotirada (standart)"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self._user_jobs = {}
+        self._next_id = 0
+        self.claimed = 0
+
+    async def push_job(self, user_id, payload, max_queued, per_user_limit):
+        if self._queue.qsize() >= max_queued or self._user_jobs.get(user_id, 0) >= per_user_limit:
+            return False
+        self._next_id += 1
+        self._queue.put_nowait((self._next_id, user_id, payload))
+        self._user_jobs[user_id] = self._user_jobs.get(user_id, 0) + 1
+        return True
+
+    async def pop_job(self, timeout):
+        try:
+            job = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.claimed += 1
+        return job
+
+    async def finish_job(self, job_id, user_id):
+        self.claimed -= 1
+        remaining = self._user_jobs.get(user_id, 0) - 1
+        if remaining > 0:
+            self._user_jobs[user_id] = remaining
+        else:
+            self._user_jobs.pop(user_id, None)
+
+    async def user_jobs(self, user_id):
+        return self._user_jobs.get(user_id, 0)
+
+    async def job_counts(self):
+        return self._queue.qsize(), self.claimed
+
+    async def consume_quota(self, user_id):
+        return await entitlements.consume(user_id)
+
+    async def refund_quota(self, user_id):
+        entitlements.refund(user_id)
+
+    async def has_subscription(self, user_id):
+        # consume_quota foydalanuvchini keshga yuklagan, bazaga murojaat bo'lmaydi
+        return await entitlements.has_subscription(user_id)
+
+    async def invalidate_quota(self, user_id):
+        entitlements.invalidate(user_id)
+
+    def fsm_storage(self):
+        return MemoryStorage()
+
+    async def start(self):
+        entitlements.start_flusher()
+
+    async def close(self):
+        await entitlements.stop_flusher()
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM holatini umumiy SQLite faylida saqlash (so'rovlar alohida oqimda)"""
+
+    async def set_state(self, key, state=None):
+        await asyncio.to_thread(set_fsm_state, _storage_key(key), _state_name(state))
+
+    async def get_state(self, key):
+        state, _ = await asyncio.to_thread(get_fsm_record, _storage_key(key))
+        return state
+
+    async def set_data(self, key, data):
+        await asyncio.to_thread(set_fsm_data, _storage_key(key), dict(data))
+
+    async def get_data(self, key):
+        _, data = await asyncio.to_thread(get_fsm_record, _storage_key(key))
+        return data
+
+    async def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """Bitta hostdagi bir nechta jarayon uchun: hammasi bitta SQLite faylida
+
+    Navbat download_jobs jadvalida, kvota users jadvalida atomik upsert
+    bilan, FSM esa fsm_state jadvalida. Bazaga murojaatlar event loop'ni
+    to'xtatmasligi uchun alohida oqimda bajariladi (busy_timeout kutishi
+    ham shu oqimda o'tadi). Navbatni har bir jarayonda faqat bitta ishchi
+    so'raydi; bo'sh navbatda so'rash oralig'i JOB_POLL_MAX_INTERVAL'gacha
+    uzayadi, shu jarayonda qo'shilgan ish esa poller'ni darhol uyg'otadi.
+
+    Olingan ishning claimed_at'i ijara (lease) vazifasini bajaradi: jarayon
+    uni har HEARTBEAT_INTERVAL'da yangilaydi va HEARTBEAT_TTL davomida
+    yangilanmagan ishlarni (jarayon o'lgan) istalgan jarayon navbatga
+    qaytaradi. Uzoq yuklab olish esa tirik jarayonda qoladi.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self):
+        self._poll_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._poll_interval = JOB_POLL_INTERVAL
+        self._next_poll = 0
+        self._active_jobs = 0
+        self._heartbeat_task = None
+
+    async def push_job(self, user_id, payload, max_queued, per_user_limit):
+        job_id = await asyncio.to_thread(enqueue_job, user_id, payload, max_queued, per_user_limit)
+        if job_id is None:
+            return False
+        self._wakeup.set()
+        return True
+
+    async def pop_job(self, timeout):
+        # Qolgan ishchilar poller ish topib qaytguncha shu yerda kutadi
+        async with self._poll_lock:
+            deadline = time.monotonic() + timeout
+            while True:
+                now = time.monotonic()
+                if now >= self._next_poll or self._wakeup.is_set():
+                    self._wakeup.clear()
+                    job = await asyncio.to_thread(claim_job, WORKER_NAME)
+                    if job is not None:
+                        self._active_jobs += 1
+                        self._next_poll = 0
+                        self._poll_interval = JOB_POLL_INTERVAL
+                        return job
+                    self._next_poll = time.monotonic() + self._poll_interval
+                    self._poll_interval = min(self._poll_interval * 2, JOB_POLL_MAX_INTERVAL)
+                    continue
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    return None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(self._next_poll - now, remaining))
+                except asyncio.TimeoutError:
+                    pass
+
+    async def finish_job(self, job_id, user_id):
+        self._active_jobs -= 1
+        await asyncio.to_thread(finish_job, job_id)
+
+    async def user_jobs(self, user_id):
+        return await asyncio.to_thread(count_user_jobs, user_id)
+
+    async def job_counts(self):
+        return await asyncio.to_thread(count_jobs)
+
+    async def consume_quota(self, user_id):
+        return await asyncio.to_thread(consume_download, user_id, FREE_LIMIT)
+
+    async def refund_quota(self, user_id):
+        await asyncio.to_thread(refund_download, user_id)
+
+    async def has_subscription(self, user_id):
+        # Obuna boshqa jarayonda o'zgarishi mumkin - bazadan o'qiladi
+        user = await asyncio.to_thread(get_user, user_id)
+        return _subscription_active(user)
+
+    async def invalidate_quota(self, user_id):
+        # Kvota har safar bazadan o'qiladi, kesh yo'q
+        pass
+
+    def fsm_storage(self):
+        return SQLiteStorage()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                if self._active_jobs:
+                    await asyncio.to_thread(renew_job_leases, WORKER_NAME)
+                await asyncio.to_thread(requeue_stale_jobs, HEARTBEAT_TTL)
+            except Exception as e:
+                logger.error(f"Error renewing job leases: {e}")
+
+    async def start(self):
+        # O'lgan jarayonlar va shu nomli oldingi jarayon tugatmagan ishlar
+        await asyncio.to_thread(requeue_stale_jobs, HEARTBEAT_TTL, WORKER_NAME)
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def close(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+
+
+# Obuna tugamagan yoki bepul limit tugamagan bo'lsa hisoblagichni oshirish
+_CONSUME_SCRIPT = """
+local sub_end = tonumber(redis.call('HGET', KEYS[1], 'sub_end') or '0')
+local count = tonumber(redis.call('HGET', KEYS[1], 'count') or '0')
+if sub_end > tonumber(ARGV[1]) or count < tonumber(ARGV[2]) then
+    redis.call('HINCRBY', KEYS[1], 'count', 1)
+    return 1
+end
+return 0
+"""
+
+# Navbat va foydalanuvchi cheklovini tekshirib, ishni qo'shish
+_PUSH_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+if tonumber(redis.call('GET', KEYS[2]) or '0') >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+# Tugagan ishni processing ro'yxatidan olib, foydalanuvchi hisoblagichini kamaytirish;
+# hisoblagich TTL bilan o'chib ketgan bo'lsa manfiy bo'lib qolmaydi
+_FINISH_SCRIPT = """
+redis.call('LREM', KEYS[1], 1, ARGV[1])
+if tonumber(redis.call('GET', KEYS[2]) or '0') > 1 then
+    redis.call('DECR', KEYS[2])
+else
+    redis.call('DEL', KEYS[2])
+end
+return 1
+"""
+
+# O'lgan jarayonning ishlov berilayotgan ishlarini (tartibni saqlab) navbat boshiga qaytarish
+_REQUEUE_SCRIPT = """
+local count = 0
+while redis.call('RPOPLPUSH', KEYS[1], KEYS[2]) do
+    count = count + 1
+end
+redis.call('SREM', KEYS[3], ARGV[1])
+return count
+"""
+
+
+class RedisBackend:
+    """Bir nechta hostdagi jarayonlar uchun: navbat, kvota va FSM Redis'da
+
+    Foydalanuvchi yozuvlari SQLite'da qoladi; kvota hisoblagichi birinchi
+    murojaatda bazadan olinadi va keyin Redis'da atomik oshiriladi.
+
+    Ish navbatdan BLMOVE bilan jarayonning o'z processing ro'yxatiga
+    ko'chiriladi va faqat tugagach o'chiriladi. Jarayon heartbeat kalitini
+    yangilab turadi; kaliti eskirgan jarayonning ishlari (SQLite'dagi
+    claimed_by kabi) boshqa jarayon tomonidan navbatga qaytariladi.
+    """
+
+    name = 'redis'
+    prefix = 'videodl'
+
+    def __init__(self, url):
+        try:
+            from redis.asyncio import Redis
+        except ImportError:
+            raise RuntimeError("STATE_BACKEND=redis requires the 'redis' package")
+
+        self.redis = Redis.from_url(url)
+        self._consume = self.redis.register_script(_CONSUME_SCRIPT)
+        self._push = self.redis.register_script(_PUSH_SCRIPT)
+        self._requeue = self.redis.register_script(_REQUEUE_SCRIPT)
+        self._finish = self.redis.register_script(_FINISH_SCRIPT)
+        self._queue_key = f"{self.prefix}:jobs"
+        self._workers_key = f"{self.prefix}:workers"
+        self._processing_key = self._worker_processing_key(WORKER_NAME)
+        self._heartbeat_task = None
+
+    def _worker_processing_key(self, worker_name):
+        return f"{self.prefix}:jobs:processing:{worker_name}"
+
+    def _heartbeat_key(self, worker_name):
+        return f"{self.prefix}:workers:alive:{worker_name}"
+
+    def _user_jobs_key(self, user_id):
+        return f"{self.prefix}:user_jobs:{user_id}"
+
+    def _quota_key(self, user_id):
+        return f"{self.prefix}:quota:{user_id}"
+
+    async def push_job(self, user_id, payload, max_queued, per_user_limit):
+        # id bir xil ishlarni processing ro'yxatida farqlash uchun
+        job = json.dumps({'id': uuid.uuid4().hex, 'user_id': user_id, 'payload': payload})
+        pushed = await self._push(
+            keys=[self._queue_key, self._user_jobs_key(user_id)],
+            args=[job, max_queued, per_user_limit, STALE_JOB_TIMEOUT],
+        )
+        return bool(pushed)
+
+    async def pop_job(self, timeout):
+        raw = await self.redis.blmove(
+            self._queue_key, self._processing_key, max(1, int(timeout)), 'LEFT', 'RIGHT'
+        )
+        if raw is None:
+            return None
+        job = json.loads(raw)
+        # Hisoblagich ish davomida eskirib qolmasligi uchun TTL yangilanadi
+        await self.redis.expire(self._user_jobs_key(job['user_id']), STALE_JOB_TIMEOUT)
+        # job_id - processing ro'yxatidagi aynan shu yozuv
+        return raw, job['user_id'], job['payload']
+
+    async def finish_job(self, job_id, user_id):
+        await self._finish(keys=[self._processing_key, self._user_jobs_key(user_id)], args=[job_id])
+
+    async def user_jobs(self, user_id):
+        return int(await self.redis.get(self._user_jobs_key(user_id)) or 0)
+
+    async def job_counts(self):
+        queued = await self.redis.llen(self._queue_key)
+        active = 0
+        for worker_name in await self.redis.smembers(self._workers_key):
+            active += await self.redis.llen(self._worker_processing_key(worker_name.decode()))
+        return queued, active
+
+    async def _beat(self):
+        await self.redis.set(self._heartbeat_key(WORKER_NAME), 1, ex=HEARTBEAT_TTL)
+        await self.redis.sadd(self._workers_key, WORKER_NAME)
+
+    async def _requeue_worker(self, worker_name):
+        requeued = await self._requeue(
+            keys=[self._worker_processing_key(worker_name), self._queue_key, self._workers_key],
+            args=[worker_name],
+        )
+        if requeued:
+            logger.info(f"Requeued {requeued} jobs claimed by {worker_name}")
+        return requeued
+
+    async def requeue_stale_jobs(self):
+        """Heartbeat'i eskirgan jarayonlarning ishlarini navbatga qaytarish"""
+        for worker_name in await self.redis.smembers(self._workers_key):
+            worker_name = worker_name.decode()
+            if worker_name != WORKER_NAME and not await self.redis.exists(self._heartbeat_key(worker_name)):
+                await self._requeue_worker(worker_name)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await self._beat()
+                await self.requeue_stale_jobs()
+            except Exception as e:
+                logger.error(f"Error refreshing worker heartbeat: {e}")
+
+    async def _seed_quota(self, user_id):
+        user = await asyncio.to_thread(_get_or_create_user, user_id)
+        if not user:
+            return
+        key = self._quota_key(user_id)
+        await self.redis.hsetnx(key, 'count', user['downloads_count'])
+        sub_end = user['subscription_end'].timestamp() if user['subscription_end'] else 0
+        await self.redis.hsetnx(key, 'sub_end', sub_end)
+
+    async def consume_quota(self, user_id):
+        if not await self.redis.exists(self._quota_key(user_id)):
+            await self._seed_quota(user_id)
+
+        allowed = await self._consume(
+            keys=[self._quota_key(user_id)],
+            args=[datetime.now().timestamp(), FREE_LIMIT],
+        )
+        if allowed:
+            # Statistika uchun SQLite'dagi hisoblagich ham (kechiktirib) yangilanadi
+            entitlements.record_download(user_id)
+        return bool(allowed)
+
+    async def refund_quota(self, user_id):
+        if await self.redis.exists(self._quota_key(user_id)):
+            await self.redis.hincrby(self._quota_key(user_id), 'count', -1)
+        entitlements.refund(user_id)
+
+    async def has_subscription(self, user_id):
+        if not await self.redis.exists(self._quota_key(user_id)):
+            await self._seed_quota(user_id)
+        sub_end = float(await self.redis.hget(self._quota_key(user_id), 'sub_end') or 0)
+        return sub_end > datetime.now().timestamp()
+
+    async def invalidate_quota(self, user_id):
+        user = await asyncio.to_thread(get_user, user_id)
+        if user:
+            sub_end = user['subscription_end'].timestamp() if user['subscription_end'] else 0
+            await self.redis.hset(self._quota_key(user_id), 'sub_end', sub_end)
+
+    def fsm_storage(self):
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage(self.redis)
+
+    async def start(self):
+        # Shu nomli oldingi jarayon (masalan konteynerda pid 1) tugatmagan ishlar
+        await self._requeue_worker(WORKER_NAME)
+        await self._beat()
+        await self.requeue_stale_jobs()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        entitlements.start_flusher()
+
+    async def close(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        await entitlements.stop_flusher()
+        await self.redis.delete(self._heartbeat_key(WORKER_NAME))
+        await self.redis.aclose()
+
+
+def create_backend(name):
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'sqlite':
+        return SQLiteBackend()
+    if name == 'redis':
+        return RedisBackend(REDIS_URL)
+    raise ValueError(f"Unknown STATE_BACKEND: {name}")
+
+
+state_backend = create_backend(STATE_BACKEND)
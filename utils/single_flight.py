@@ -0,0 +1,74 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Bir xil kalit bo'yicha parallel so'rovlarni bitta vazifaga birlashtirish
+
+    Birinchi chaqiruv vazifani ishga tushiradi, qolganlari tugashini kutadi
+    va o'sha natijani (yoki xatolikni) oladi. Kutayotganlardan biri bekor
+    qilinsa ham umumiy vazifa to'xtamaydi.
+
+    acquire berilsa, natija tayyor bo'lganda har bir chaqiruvchi uchun
+    (hali hech biri davom etmasdan) chaqiriladi - masalan, umumiy natijaga
+    havolalar sonini oshirish uchun. Natijani olmay bekor qilingan
+    chaqiruvchining ulushi release bilan qaytariladi.
+    """
+
+    def __init__(self, name, acquire=None, release=None):
+        self.name = name
+        self._acquire = acquire
+        self._release = release
+        self._inflight = {}
+        self.stats = {
+            'leaders': 0,
+            'coalesced': 0,
+        }
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def run(self, key, func, *args, **kwargs):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+            logger.info(f"{self.name}: joined in-flight request for {key[:100]}")
+        else:
+            self.stats['leaders'] += 1
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+
+        if self._acquire is None:
+            return await asyncio.shield(task)
+
+        def acquire(_):
+            result = self._result(task)
+            if result is not None:
+                self._acquire(result)
+
+        if task.done():
+            acquire(task)
+        else:
+            task.add_done_callback(acquire)
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Natija tayyor bo'lib ulgurgan bo'lsa, shu chaqiruvchining ulushi qaytariladi
+            if not task.remove_done_callback(acquire):
+                result = self._result(task)
+                if result is not None and self._release is not None:
+                    self._release(result)
+            raise
+
+    @staticmethod
+    def _result(task):
+        if task.cancelled() or task.exception() is not None:
+            return None
+        return task.result()
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
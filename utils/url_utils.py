@@ -0,0 +1,34 @@
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Kontentga ta'sir qilmaydigan (kuzatuv/ulashish) parametrlar
+TRACKING_PARAMS = {
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+    'igshid', 'igsh', 'si', 'feature', 'fbclid', 'ref', 'ref_src', 's', 't',
+    'is_from_webapp', 'sender_device', 'share_app_id', 'share_link_id',
+    'mibextid', 'rdid', 'invite_code', 'web_id',
+}
+
+HOST_PREFIXES = ('www.', 'm.', 'mobile.')
+
+
+def normalize_url(url):
+    """URL'ni kesh kaliti uchun kanonik ko'rinishga keltirish"""
+    url = url.strip()
+    if '://' not in url:
+        url = 'https://' + url
+
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+
+    path = parts.path.rstrip('/') or '/'
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=False)
+        if key.lower() not in TRACKING_PARAMS
+    )
+
+    return urlunsplit(('https', host, path, urlencode(query), ''))
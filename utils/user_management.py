@@ -1,42 +1,45 @@
 # user_management.py
 
 import logging
-from datetime import datetime
 
-from config import ADMIN_IDS, FREE_LIMIT
+from config import ADMIN_IDS, FREE_LIMIT, FREE_MAX_FILE_MB, PREMIUM_MAX_FILE_MB, TELEGRAM_UPLOAD_LIMIT
 from utils.database import (
-    get_user, 
-    create_user, 
-    increment_downloads, 
+    extend_subscription,
     create_coupon, 
     activate_coupon, 
     get_usage_stats
 )
+from utils.shared_state import state_backend
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def check_user_limit(user_id):
-    """Check if user can download more videos"""
-    user = get_user(user_id)
-    if not user:
-        user = create_user(user_id)
-        if not user:
-            return False
+async def check_user_limit(user_id):
+    """Check if user can download more videos and count the download"""
+    return await state_backend.consume_quota(user_id)
 
-    # Check if user has active subscription
-    if user['subscription_end'] and user['subscription_end'] > datetime.now():
-        increment_downloads(user_id)
-        return True
 
-    # Check free limit
-    if user['downloads_count'] < FREE_LIMIT:
-        increment_downloads(user_id)
-        return True
+async def refund_user_download(user_id):
+    """Give back a download that was counted but never queued"""
+    await state_backend.refund_quota(user_id)
 
-    return False
+
+async def update_subscription(user_id, plan):
+    """Activate a paid subscription plan for user"""
+    success = extend_subscription(user_id, plan)
+    await state_backend.invalidate_quota(user_id)
+    return success
+
+
+async def get_max_file_size(user_id):
+    """Largest file (bytes) the user's plan may download, capped by the Telegram upload limit"""
+    if await state_backend.has_subscription(user_id):
+        limit_mb = PREMIUM_MAX_FILE_MB
+    else:
+        limit_mb = FREE_MAX_FILE_MB
+    return min(limit_mb * 1024 * 1024, TELEGRAM_UPLOAD_LIMIT)
 
 
 def get_limit_exceeded_message():
@@ -59,6 +62,7 @@ async def handle_coupon_activation(message):
     """Handle coupon activation from message"""
     coupon_code = message.text.strip()
     if activate_coupon(message.from_user.id, coupon_code):
+        await state_backend.invalidate_quota(message.from_user.id)
         await message.answer("Kupon muvaffaqiyatli faollashtirildi! Endi sizda cheksiz yuklab olish imkoniyati bor.")
     else:
         await message.answer("Noto'g'ri yoki allaqachon ishlatilgan kupon kodi. Iltimos, qaytadan urinib ko'ring yoki admin bilan bog'laning.")
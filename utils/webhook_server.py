@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import secrets
+
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import (
+    STATE_BACKEND,
+    STRIPE_WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_MAX_UPDATES,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+)
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """Telegramga darhol javob qaytarib, yangilanishlarni cheklangan parallellikda qayta ishlash"""
+
+    def __init__(self, dispatcher, bot, max_concurrent_updates, **kwargs):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self._semaphore = asyncio.Semaphore(max_concurrent_updates)
+
+    async def _background_feed_update(self, bot, update):
+        async with self._semaphore:
+            await super()._background_feed_update(bot, update)
+
+
+def build_webhook_app(dp, bot, secret_token):
+    """Telegram webhook va (sozlangan bo'lsa) Stripe uchun umumiy web.Application
+
+    /metrics bu yerda emas: u ochiq portda autentifikatsiyasiz bo'lib qoladi,
+    shuning uchun alohida METRICS_HOST:METRICS_PORT serverida beriladi.
+    """
+    app = web.Application()
+    app['bot'] = bot
+
+    BoundedRequestHandler(
+        dp, bot,
+        max_concurrent_updates=WEBHOOK_MAX_UPDATES,
+        secret_token=secret_token,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    if STRIPE_WEBHOOK_SECRET:
+        from utils.stripe_webhook_handler import setup_stripe_webhook
+        setup_stripe_webhook(app)
+
+    return app
+
+
+async def run_webhook(dp, bot):
+    """Webhookni o'rnatib, aiohttp serverini to'xtatilguncha ishlatish"""
+    secret_token = WEBHOOK_SECRET
+    if not secret_token:
+        # Sozlanmagan bo'lsa har ishga tushishda yangi maxfiy token
+        secret_token = secrets.token_urlsafe(32)
+
+    app = build_webhook_app(dp, bot, secret_token)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        # Umumiy holat bilan bir nechta jarayon bitta portni baham ko'radi
+        await web.TCPSite(
+            runner, WEBHOOK_HOST, WEBHOOK_PORT, reuse_port=STATE_BACKEND != 'memory'
+        ).start()
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=secret_token,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types(),
+            # Bir nechta jarayon ketma-ket ishga tushganda yangilanishlar yo'qolmasin
+            drop_pending_updates=STATE_BACKEND == 'memory',
+        )
+        logger.info(f"Webhook server listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()